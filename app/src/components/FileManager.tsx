@@ -56,6 +56,29 @@ interface FileManagerProps {
   initialFileToOpen?: string; // 直接打开指定文件进行编辑
 }
 
+// 复制、移动、删除、解压等操作默认作为后台任务执行，响应中带有job_id；
+// 轮询任务直到结束，返回与同步接口相同形式的结果，没有job_id的响应原样返回
+const waitForJob = async (response: { data: any }): Promise<{ data: any }> => {
+  const jobId = response.data?.job_id;
+  if (response.data?.status !== 'success' || !jobId) {
+    return response;
+  }
+  while (true) {
+    await new Promise(resolve => setTimeout(resolve, 1000));
+    const jobResponse = await axios.get(`/api/jobs/${jobId}`);
+    const job = jobResponse.data?.job;
+    if (!job) {
+      return { data: { status: 'error', message: jobResponse.data?.message || '任务不存在' } };
+    }
+    if (job.state === 'completed') {
+      return { data: { status: 'success', job, ...(job.result && typeof job.result === 'object' ? job.result : {}) } };
+    }
+    if (job.state !== 'queued' && job.state !== 'running') {
+      return { data: { status: 'error', job, message: job.state === 'cancelled' ? '任务已取消' : (job.error || '任务失败') } };
+    }
+  }
+};
+
 const FileManager: React.FC<FileManagerProps> = ({ initialPath = '/home/steam', isVisible = true, initialFileToOpen }) => {
   // 创建一个唯一的实例ID，用于识别当前组件实例
   const instanceId = useRef<string>(Math.random().toString(36).substring(2, 15));
@@ -779,10 +802,10 @@ const FileManager: React.FC<FileManagerProps> = ({ initialPath = '/home/steam',
           const fileName = file.name;
           const destinationPath = `${currentPath}/${fileName}`;
           
-          const response = await axios.post(`/api/${clipboard.operation === 'copy' ? 'copy' : 'move'}`, {
+          const response = await waitForJob(await axios.post(`/api/${clipboard.operation === 'copy' ? 'copy' : 'move'}`, {
             sourcePath: file.path,
             destinationPath
-          });
+          }));
           
           if (response.data.status === 'success') {
             successCount++;
@@ -988,10 +1011,10 @@ const FileManager: React.FC<FileManagerProps> = ({ initialPath = '/home/steam',
       onOk: async () => {
         setLoading(true);
         try {
-          const response = await axios.post(`/api/delete`, {
+          const response = await waitForJob(await axios.post(`/api/delete`, {
             path: file.path,
             type: file.type
-          });
+          }));
           
           if (response.data.status === 'success') {
             message.success(`${file.type === 'file' ? '文件' : '文件夹'}已删除`);
@@ -1350,10 +1373,10 @@ const FileManager: React.FC<FileManagerProps> = ({ initialPath = '/home/steam',
         const zipName = compressName.endsWith(fileExtension) ? compressName : `${compressName}${fileExtension}`;
         const destinationPath = `${currentPath}/${zipName}`;
         
-        const moveResponse = await axios.post('/api/move', {
+        const moveResponse = await waitForJob(await axios.post('/api/move', {
           sourcePath: zipPath,
           destinationPath: destinationPath
-        });
+        }));
         
         if (moveResponse.data.status === 'success') {
           compressNotification(); // 关闭加载通知
@@ -1416,10 +1439,10 @@ const FileManager: React.FC<FileManagerProps> = ({ initialPath = '/home/steam',
       // 默认解压到当前目录或指定目录
       const targetDir = extractPath || currentPath;
       
-      const response = await axios.post('/api/extract', {
+      const response = await waitForJob(await axios.post('/api/extract', {
         path: selectedFile.path,
         targetDir
-      });
+      }));
       
       if (response.data.status === 'success') {
         extractNotification(); // 关闭加载通知
@@ -1463,10 +1486,10 @@ const FileManager: React.FC<FileManagerProps> = ({ initialPath = '/home/steam',
           // 逐个删除选中的文件/文件夹
           for (const file of selectedFiles) {
             try {
-              const response = await axios.post('/api/delete', {
+              const response = await waitForJob(await axios.post('/api/delete', {
                 path: file.path,
                 type: file.type
-              });
+              }));
               
               if (response.data.status === 'success') {
                 successCount++;
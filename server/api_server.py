@@ -7,7 +7,6 @@ import logging
 import subprocess
 import shlex
 import shutil
-import tempfile
 import queue
 import threading
 import pty
@@ -19,19 +18,14 @@ import uuid
 import hashlib
 import base64
 import datetime
-import zipfile
-import tarfile
-import gzip
-import bz2
-import rarfile
-import lzma
 import stat
-import zstandard as zstd
 import multiprocessing
 import secrets
 import struct
+import mimetypes
 from functools import wraps
-from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context, g, render_template_string, send_file, make_response
+from urllib.parse import quote
+from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context, g, render_template_string, send_file, make_response, after_this_request
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 from auth_middleware import auth_required, generate_token, verify_token, save_user, is_public_route, hash_password, verify_password
@@ -54,6 +48,57 @@ from docker_manager import docker_manager
 from minecraft_modpack_installer import MinecraftModpackInstaller
 # 导入网易云音乐播放器
 from Wangyi import NeteaseMusicPlayer
+# 导入Prometheus指标注册表
+from metrics import metrics, CONTENT_TYPE_LATEST
+# 导入请求耗时分析器
+from request_profiler import request_profiler
+# 导入cgroup资源管理器
+from cgroup_manager import cgroup_manager, normalize_limits
+# 导入进程调度配置工具
+from process_priority import normalize_sched_profile, default_sched_profile, apply_sched_profile_to_tree, get_effective_sched
+# 导入进程浏览器
+from process_explorer import process_explorer
+# 导入目录列表缓存
+from file_listing import directory_listing
+# 导入文件名索引
+from file_index import file_index
+# 导入文件内容搜索器
+from content_search import content_searcher
+# 导入分片上传管理器
+from chunked_upload import upload_manager, UploadError
+# 导入支持范围请求的文件发送函数
+from file_transfer import send_file_ranges
+# 导入流式打包工具
+from archive_stream import stream_archive, STREAM_FORMATS
+# 导入多线程压缩工具
+from parallel_compress import compress_paths, create_temp_output_dir, cleanup_temp_outputs
+# 导入流式解压工具
+from archive_extract import extraction_manager, detect_format, normalize_member, UnsafeEntryError
+# 导入后台任务管理器
+from job_manager import job_manager, measure_paths, JobCancelled
+# 导入快速复制工具
+from fast_copy import fast_copier
+# 导入回收站管理器
+from trash_manager import trash_manager, TrashError
+# 导入大文件分页查看工具
+from file_viewer import file_viewer, PAGEABLE_ENCODINGS
+# 导入原子保存工具
+from file_save import save_text, hash_bytes, SaveConflict, PatchError
+# 导入文件变化监听服务
+from fs_watcher import fs_watcher, WatchError
+# 导入归档浏览工具
+from archive_browser import archive_browser
+# 导入文件哈希服务
+from file_hash import file_hasher, normalize_algorithms, HashError
+# 导入批量文件操作工具
+import batch_ops
+# 导入增量同步工具
+from delta_sync import DeltaApplier, DeltaError, tree_signatures, MIN_BLOCK_SIZE, MAX_BLOCK_SIZE
+# 导入缩略图服务
+from thumbnail import thumbnail_service, is_image, ThumbnailError, THUMBNAIL_SIZES, DEFAULT_SIZE as DEFAULT_THUMBNAIL_SIZE
+
+# 目录发生变化时让列表缓存失效
+fs_watcher.add_listener(directory_listing.invalidate)
 
 # 输出管理函数
 def add_server_output(game_id, message, max_lines=500):
@@ -140,6 +185,73 @@ app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # 禁用缓存，确保始终获取
 # 允许跨域请求
 CORS(app, resources={r"/*": {"origins": "*"}})  # 允许所有来源的跨域请求
 
+# Prometheus指标定义（全部为内存计数，抓取时不遍历进程）
+HTTP_REQUEST_DURATION = metrics.histogram('gsm_http_request_duration_seconds', 'HTTP请求处理耗时（秒）', ['endpoint', 'method'])
+HTTP_REQUESTS_TOTAL = metrics.counter('gsm_http_requests_total', 'HTTP请求总数', ['endpoint', 'method', 'status'])
+SERVER_UP = metrics.gauge('gsm_server_up', '游戏服务器是否在运行（1为运行）', ['server'])
+SERVER_STATE = metrics.gauge('gsm_server_state', '游戏服务器当前状态', ['server', 'state'])
+SERVER_CPU_PERCENT = metrics.gauge('gsm_server_cpu_percent', '游戏服务器进程树CPU使用率', ['server'])
+SERVER_RSS_BYTES = metrics.gauge('gsm_server_memory_rss_bytes', '游戏服务器进程树常驻内存（字节）', ['server'])
+SERVER_UPTIME = metrics.gauge('gsm_server_uptime_seconds', '游戏服务器运行时长（秒）', ['server'])
+SERVER_RESTARTS = metrics.counter('gsm_server_restarts_total', '游戏服务器自动重启次数', ['server'])
+CONSOLE_LINES = metrics.counter('gsm_server_console_lines_total', '游戏服务器控制台输出行数', ['server'])
+CONSOLE_LINES_RATE = metrics.gauge('gsm_server_console_lines_per_second', '游戏服务器控制台每秒输出行数', ['server'])
+SSE_CLIENTS = metrics.gauge('gsm_sse_clients', '当前连接的SSE客户端数量', ['stream'])
+QUEUE_DEPTH = metrics.gauge('gsm_queue_depth', '输出队列中待消费的消息数', ['queue', 'id'])
+BACKUP_DURATION = metrics.histogram('gsm_backup_duration_seconds', '备份任务耗时（秒）', ['task'],
+                                    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+BACKUP_SIZE_BYTES = metrics.gauge('gsm_backup_size_bytes', '最近一次备份文件大小（字节）', ['task'])
+BACKUPS_TOTAL = metrics.counter('gsm_backups_total', '备份任务执行次数', ['task', 'result'])
+DOWNLOAD_BYTES = metrics.counter('gsm_download_bytes_total', '通过面板下载的字节数', ['kind'])
+
+def track_sse_client(stream_name, generator):
+    """包装SSE生成器，统计当前连接的客户端数量"""
+    SSE_CLIENTS.inc(stream=stream_name)
+    try:
+        yield from generator
+    finally:
+        SSE_CLIENTS.dec(stream=stream_name)
+
+def summarize_request_args():
+    """提取慢请求的参数用于记录（隐藏令牌，截断过长的内容）"""
+    args = {key: ('***' if key == 'token' else value[:200]) for key, value in request.args.items()}
+    summary = {'query': args}
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if body is not None:
+            if isinstance(body, dict):
+                body = {key: ('***' if 'password' in key.lower() or 'token' in key.lower() else value)
+                        for key, value in body.items()}
+            summary['json'] = json.dumps(body, ensure_ascii=False, default=str)[:1000]
+    elif request.content_length:
+        summary['content_length'] = request.content_length
+    return summary
+
+# 请求计时需要在认证检查之前注册，确保被拒绝的请求也会计入
+@app.before_request
+def start_request_timer():
+    request_profiler.ensure_sampler_started()
+    g.request_started_at = request_profiler.begin(request.method, request.path)
+
+@app.after_request
+def record_request_metrics(response):
+    started_at = g.get('request_started_at')
+    if started_at is not None:
+        endpoint = request.endpoint or 'unmatched'
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        duration, stack = request_profiler.end(started_at, request.method, route)
+        HTTP_REQUEST_DURATION.observe(duration, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS_TOTAL.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        
+        # 只有慢请求才整理参数，正常请求不产生额外开销
+        if duration >= request_profiler.slow_threshold:
+            try:
+                request_profiler.record_slow(duration, request.method, route, request.path,
+                                             response.status_code, summarize_request_args(), stack)
+            except Exception as e:
+                logger.error(f"记录慢请求失败: {str(e)}")
+    return response
+
 # 在应用启动时加载备份配置（延迟加载，避免循环导入）
 # 使用全局变量标记是否已初始化
 _backup_config_loaded = False
@@ -821,6 +933,7 @@ def run_installation(game_id, cmd):
 def run_game_server(game_id, cmd, cwd):
     """在单独线程中使用PTY运行服务器"""
     logger.info(f"开始使用PTY运行游戏服务器 {game_id}")
+    ensure_server_metrics_sampler_started()
     
     try:
         # 准备命令字符串
@@ -830,13 +943,29 @@ def run_game_server(game_id, cmd, cwd):
         process_id = f"server_{game_id}"
         logger.info(f"生成进程ID: {process_id}")
         
+        # 主机支持cgroup v2时，为服务器准备独立的cgroup并应用资源限制
+        server_config = load_config()
+        resource_limits = server_config.get('server_resource_limits', {}).get(game_id)
+        cgroup_path = cgroup_manager.prepare_server(game_id, resource_limits)
+        if cgroup_path:
+            logger.info(f"游戏服务器 {game_id} 将运行在cgroup {cgroup_path} 中，资源限制: {resource_limits or '无'}")
+        if game_id in running_servers:
+            running_servers[game_id]['cgroup'] = cgroup_path
+        
+        # 服务器的调度配置（CPU亲和性、nice、ionice、SCHED_BATCH），在子进程exec之前应用
+        sched_profile = server_config.get('server_sched_profiles', {}).get(game_id)
+        if sched_profile:
+            logger.info(f"游戏服务器 {game_id} 将使用调度配置: {sched_profile}")
+        
         # 创建并启动PTY进程
         process = pty_manager.create_process(
             process_id=process_id,
             cmd=cmd,
             cwd=cwd,
             env=dict(os.environ, TERM="xterm"),
-            log_prefix=f"game_server_{game_id}"
+            log_prefix=f"game_server_{game_id}",
+            cgroup_path=cgroup_path,
+            sched_profile=sched_profile
         )
         
         # 将进程对象和输出队列关联到服务器数据
@@ -965,6 +1094,7 @@ def run_game_server(game_id, cmd, cwd):
                                     if isinstance(item, str):
                                         add_server_output(game_id, item)
                                         output_count += 1
+                                        CONSOLE_LINES.inc(server=game_id)
                                         
                                         # 定期记录输出状态
                                         current_time = time.time()
@@ -1061,6 +1191,12 @@ def run_game_server(game_id, cmd, cwd):
             running_servers[game_id]['running'] = False
             return
         
+        # 进程未能加入cgroup时不再按cgroup统计和限制，并删除空的cgroup
+        if cgroup_path and not process.cgroup_path:
+            cgroup_manager.release_server(game_id)
+            cgroup_path = None
+            running_servers[game_id]['cgroup'] = None
+        
         # 获取进程对象并保存
         try:
             # 获取底层进程并保存
@@ -1076,6 +1212,10 @@ def run_game_server(game_id, cmd, cwd):
         # 主线程等待进程完成
         return_code = process.wait()
         logger.info(f"游戏服务器 {game_id} 主进程已结束，返回码: {return_code}")
+        
+        # 释放服务器的cgroup
+        if cgroup_path:
+            cgroup_manager.release_server(game_id)
          
         # 确保服务器状态已更新
         if game_id in running_servers:
@@ -1576,7 +1716,7 @@ def install_game_stream():
                     yield f"data: {json.dumps({'error': str(e)})}\n\n"
                     break
         
-        return Response(stream_with_context(generate()), 
+        return Response(stream_with_context(track_sse_client('install', generate())), 
                        mimetype='text/event-stream',
                        headers={
                            'Cache-Control': 'no-cache',
@@ -1755,9 +1895,13 @@ def uninstall_game():
                 except Exception as e:
                     logger.error(f"停止游戏服务器 {game_id} 时出错: {str(e)}")
                     
-        # 直接删除游戏目录
-        logger.info(f"直接删除游戏目录: {game_dir}")
-        shutil.rmtree(game_dir)
+        # 把游戏目录移入回收站，由后台线程限速删除
+        logger.info(f"删除游戏目录: {game_dir}")
+        try:
+            trash_manager.trash(game_dir, g.user.get('username') if hasattr(g, 'user') else None)
+        except (TrashError, OSError) as e:
+            logger.warning(f"移入回收站失败，改为直接删除 {game_dir}: {str(e)}")
+            shutil.rmtree(game_dir)
             
         # 清理服务器状态
         if game_id in running_servers:
@@ -2581,7 +2725,8 @@ def server_status():
                         'status': 'success',
                         'server_status': 'running',
                         'started_at': server_data.get('started_at'),
-                        'uptime': time.time() - server_data.get('started_at', time.time())
+                        'uptime': time.time() - server_data.get('started_at', time.time()),
+                        'sched': get_effective_sched(process.pid, threads=False)
                     })
                 else:
                     # 服务器已停止
@@ -2605,7 +2750,8 @@ def server_status():
                     servers[server_id] = {
                         'status': 'running',
                         'started_at': server_data.get('started_at'),
-                        'uptime': time.time() - server_data.get('started_at', time.time())
+                        'uptime': time.time() - server_data.get('started_at', time.time()),
+                        'sched': get_effective_sched(process.pid, threads=False)
                     }
             
             response = {
@@ -2623,6 +2769,336 @@ def server_status():
         logger.error(f"获取服务器状态失败: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/server/resource_limits', methods=['GET'])
+def get_server_resource_limits():
+    """获取游戏服务器的cgroup资源限制配置"""
+    try:
+        game_id = request.args.get('game_id')
+        config = load_config()
+        all_limits = config.get('server_resource_limits', {})
+        
+        response = {
+            'status': 'success',
+            'cgroup_available': cgroup_manager.is_available(),
+            'cgroup_reason': cgroup_manager.reason
+        }
+        if game_id:
+            response['limits'] = all_limits.get(game_id, {})
+        else:
+            response['limits'] = all_limits
+        return jsonify(response)
+    except Exception as e:
+        logger.error(f"获取资源限制失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/server/resource_limits', methods=['POST'])
+def set_server_resource_limits():
+    """设置游戏服务器的cgroup资源限制，服务器运行中时立即生效"""
+    try:
+        data = request.json
+        game_id = data.get('game_id')
+        if not game_id:
+            return jsonify({'status': 'error', 'message': '缺少游戏ID'}), 400
+        
+        try:
+            limits = normalize_limits(data.get('limits'))
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        config = load_config()
+        all_limits = config.get('server_resource_limits', {})
+        if limits:
+            all_limits[game_id] = limits
+        else:
+            all_limits.pop(game_id, None)
+        config['server_resource_limits'] = all_limits
+        save_config(config)
+        
+        # 运行中的服务器直接更新cgroup中的限制
+        applied = False
+        if game_id in running_servers and running_servers[game_id].get('cgroup'):
+            try:
+                applied = cgroup_manager.update_limits(game_id, limits)
+            except (OSError, ValueError) as e:
+                logger.error(f"实时更新游戏服务器 {game_id} 的资源限制失败: {str(e)}")
+        
+        logger.info(f"已更新游戏服务器 {game_id} 的资源限制: {limits or '无'}，实时生效: {applied}")
+        return jsonify({
+            'status': 'success',
+            'message': '资源限制已保存' + ('并立即生效' if applied else '，将在下次启动时生效'),
+            'limits': limits,
+            'applied': applied,
+            'cgroup_available': cgroup_manager.is_available()
+        })
+    except Exception as e:
+        logger.error(f"设置资源限制失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/server/resource_usage', methods=['GET'])
+def get_server_resource_usage():
+    """从cgroup文件读取游戏服务器的资源使用情况（CPU、内存、压力信息），CPU使用率为后台采样线程最近一次的计算结果"""
+    try:
+        game_id = request.args.get('game_id')
+        game_ids = [game_id] if game_id else list(running_servers.keys())
+        
+        usage = {}
+        for server_id in game_ids:
+            server_usage = cgroup_manager.read_usage(server_id)
+            if server_usage is not None:
+                usage[server_id] = server_usage
+        
+        if game_id and game_id not in usage:
+            return jsonify({
+                'status': 'error',
+                'message': f'游戏服务器 {game_id} 没有独立的cgroup',
+                'cgroup_available': cgroup_manager.is_available(),
+                'cgroup_reason': cgroup_manager.reason
+            }), 404
+        
+        return jsonify({
+            'status': 'success',
+            'usage': usage[game_id] if game_id else usage
+        })
+    except Exception as e:
+        logger.error(f"获取资源使用情况失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/server/sched_profile', methods=['GET'])
+def get_server_sched_profile():
+    """获取游戏服务器的调度配置以及当前生效的调度设置"""
+    try:
+        game_id = request.args.get('game_id')
+        if not game_id:
+            return jsonify({'status': 'error', 'message': '缺少游戏ID'}), 400
+        
+        config = load_config()
+        profile = config.get('server_sched_profiles', {}).get(game_id, {})
+        
+        effective = None
+        process = running_servers.get(game_id, {}).get('process')
+        if process and process.poll() is None:
+            effective = get_effective_sched(process.pid)
+        
+        return jsonify({
+            'status': 'success',
+            'profile': profile,
+            'effective': effective,
+            'available_cpus': sorted(os.sched_getaffinity(0))
+        })
+    except Exception as e:
+        logger.error(f"获取调度配置失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/server/sched_profile', methods=['POST'])
+def set_server_sched_profile():
+    """设置游戏服务器的调度配置，服务器运行中时同时应用到其进程树"""
+    try:
+        data = request.json
+        game_id = data.get('game_id')
+        if not game_id:
+            return jsonify({'status': 'error', 'message': '缺少游戏ID'}), 400
+        
+        try:
+            profile = normalize_sched_profile(data.get('profile'))
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        config = load_config()
+        profiles = config.get('server_sched_profiles', {})
+        if profile:
+            profiles[game_id] = profile
+        else:
+            profiles.pop(game_id, None)
+        config['server_sched_profiles'] = profiles
+        save_config(config)
+        
+        # 运行中的服务器立即应用到整个进程树
+        applied = 0
+        effective = None
+        process = running_servers.get(game_id, {}).get('process')
+        if process and process.poll() is None:
+            # 清除配置时恢复默认设置，否则运行中的服务器会保留旧的亲和性和优先级
+            applied = apply_sched_profile_to_tree(process.pid, profile or default_sched_profile())
+            effective = get_effective_sched(process.pid)
+        
+        logger.info(f"已更新游戏服务器 {game_id} 的调度配置: {profile or '默认'}，已应用到 {applied} 个进程")
+        return jsonify({
+            'status': 'success',
+            'message': '调度配置已保存',
+            'profile': profile,
+            'applied_processes': applied,
+            'effective': effective
+        })
+    except Exception as e:
+        logger.error(f"设置调度配置失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# 游戏服务器资源采样：后台线程定期采样，/metrics抓取时只读取内存中的结果
+SERVER_METRICS_SAMPLE_INTERVAL = 10  # 采样间隔（秒）
+_server_metric_processes = {}  # game_id: {pid: psutil.Process}，保留进程对象以获得真实的CPU增量
+_server_console_line_marks = {}  # game_id: (采样时间, 累计输出行数)
+_server_metrics_sampler_pid = None
+_server_metrics_sampler_lock = threading.Lock()
+
+def sample_server_metrics():
+    """定期采样运行中游戏服务器进程树的CPU和内存占用"""
+    while True:
+        try:
+            now = time.time()
+            active_ids = set()
+            for game_id, server_data in list(running_servers.items()):
+                process = server_data.get('process')
+                if not process or process.poll() is not None:
+                    continue
+                
+                # 服务器有独立cgroup时直接读取cgroup统计，无需遍历进程树
+                usage = cgroup_manager.read_usage(game_id, consumer='metrics') if server_data.get('cgroup') else None
+                if usage is not None:
+                    active_ids.add(game_id)
+                    _server_metric_processes[game_id] = {}
+                    if usage['cpu_percent'] is not None:
+                        SERVER_CPU_PERCENT.set(usage['cpu_percent'], server=game_id)
+                    SERVER_RSS_BYTES.set(usage['memory_rss'], server=game_id)
+                else:
+                    cached = _server_metric_processes.get(game_id, {})
+                    try:
+                        root = cached.get(process.pid) or psutil.Process(process.pid)
+                        tree = [root] + root.children(recursive=True)
+                    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                        continue
+                    
+                    active_ids.add(game_id)
+                    current = {}
+                    cpu_total = 0.0
+                    rss_total = 0
+                    for proc in tree:
+                        proc = cached.get(proc.pid, proc)
+                        try:
+                            cpu_total += proc.cpu_percent(None)
+                            rss_total += proc.memory_info().rss
+                            current[proc.pid] = proc
+                        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                            continue
+                    _server_metric_processes[game_id] = current
+                    SERVER_CPU_PERCENT.set(round(cpu_total, 2), server=game_id)
+                    SERVER_RSS_BYTES.set(rss_total, server=game_id)
+                
+                # 根据计数器增量计算每秒输出行数
+                line_count = CONSOLE_LINES.get(server=game_id)
+                last_mark = _server_console_line_marks.get(game_id)
+                if last_mark and now > last_mark[0]:
+                    CONSOLE_LINES_RATE.set(round((line_count - last_mark[1]) / (now - last_mark[0]), 2), server=game_id)
+                _server_console_line_marks[game_id] = (now, line_count)
+            
+            # 清理已停止服务器的采样数据
+            for game_id in list(_server_metric_processes):
+                if game_id not in active_ids:
+                    _server_metric_processes.pop(game_id, None)
+                    _server_console_line_marks.pop(game_id, None)
+                    SERVER_CPU_PERCENT.remove(server=game_id)
+                    SERVER_RSS_BYTES.remove(server=game_id)
+                    CONSOLE_LINES_RATE.remove(server=game_id)
+        except Exception as e:
+            logger.error(f"采样游戏服务器指标时出错: {str(e)}")
+        
+        time.sleep(SERVER_METRICS_SAMPLE_INTERVAL)
+
+def ensure_server_metrics_sampler_started():
+    """确保当前进程中的采样线程已启动（Gunicorn预加载后工作进程需要重新启动线程）"""
+    global _server_metrics_sampler_pid
+    if _server_metrics_sampler_pid == os.getpid():
+        return
+    with _server_metrics_sampler_lock:
+        if _server_metrics_sampler_pid != os.getpid():
+            threading.Thread(target=sample_server_metrics, daemon=True).start()
+            _server_metrics_sampler_pid = os.getpid()
+            logger.info("游戏服务器指标采样线程已启动")
+
+def collect_runtime_metrics():
+    """抓取前从内存状态刷新服务器状态和队列长度"""
+    now = time.time()
+    SERVER_UP.clear()
+    SERVER_STATE.clear()
+    SERVER_UPTIME.clear()
+    for game_id, server_data in list(running_servers.items()):
+        running = bool(server_data.get('running'))
+        if running:
+            state = 'running'
+        elif server_data.get('error'):
+            state = 'error'
+        else:
+            state = 'stopped'
+        SERVER_UP.set(1 if running else 0, server=game_id)
+        SERVER_STATE.set(1, server=game_id, state=state)
+        if running and server_data.get('started_at'):
+            SERVER_UPTIME.set(round(now - server_data['started_at'], 1), server=game_id)
+    
+    QUEUE_DEPTH.clear()
+    for game_id, output_queue in list(server_output_queues.items()):
+        QUEUE_DEPTH.set(output_queue.qsize(), queue='server_output', id=game_id)
+    for game_id, output_queue in list(output_queues.items()):
+        QUEUE_DEPTH.set(output_queue.qsize(), queue='install_output', id=game_id)
+
+metrics.register_collector(collect_runtime_metrics)
+
+def check_metrics_access():
+    """/metrics 不在 /api/ 下，不经过全局认证，需要单独检查
+
+    配置中 metrics_public 为true时公开；否则需要通过Authorization头或 ?token= 提供
+    配置中的 metrics_token（供Prometheus长期使用），或有效的登录令牌
+    """
+    config = load_config()
+    if config.get('metrics_public'):
+        return True
+    token = None
+    auth_header = request.headers.get('Authorization')
+    if auth_header:
+        parts = auth_header.split()
+        if len(parts) == 2 and parts[0].lower() == 'bearer':
+            token = parts[1]
+    token = token or request.args.get('token')
+    if not token:
+        return False
+    metrics_token = config.get('metrics_token')
+    if metrics_token and secrets.compare_digest(token.encode('utf-8'), str(metrics_token).encode('utf-8')):
+        return True
+    return verify_token(token) is not None
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """以Prometheus文本格式导出面板和游戏服务器指标"""
+    if not check_metrics_access():
+        return Response('unauthorized\n', status=401, content_type='text/plain; charset=utf-8',
+                        headers={'WWW-Authenticate': 'Bearer'})
+    ensure_server_metrics_sampler_started()
+    return Response(metrics.render(), content_type=CONTENT_TYPE_LATEST)
+
+@app.route('/api/debug/slow-requests', methods=['GET'])
+def debug_slow_requests():
+    """查看各路由延迟统计和最近的慢请求"""
+    try:
+        limit = min(int(request.args.get('limit', 50)), 200)
+        sort = request.args.get('sort', 'recent')  # recent 或 duration
+        route_filter = request.args.get('route')
+        
+        routes = request_profiler.route_summaries()
+        slow_requests = request_profiler.slow_requests(limit=200, sort=sort)
+        if route_filter:
+            routes = [r for r in routes if r['route'] == route_filter]
+            slow_requests = [r for r in slow_requests if r['route'] == route_filter]
+        
+        return jsonify({
+            'status': 'success',
+            'slow_threshold_ms': request_profiler.slow_threshold * 1000,
+            'since': request_profiler.started_at,
+            'routes': routes,
+            'slow_requests': slow_requests[:limit],
+            'in_flight': request_profiler.in_flight_requests()
+        })
+    except Exception as e:
+        logger.error(f"获取慢请求信息失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @app.route('/api/server/stream', methods=['GET'])
 def server_stream():
     """游戏服务器输出流"""
@@ -2951,7 +3427,7 @@ def server_stream():
             logger.info(f"输出转发线程结束: game_id={game_id}, 总共处理 {output_count} 行输出")
         
         # 返回流式响应
-        return Response(stream_with_context(generate()), 
+        return Response(stream_with_context(track_sse_client('server', generate())), 
                        mimetype='text/event-stream',
                        headers={
                            'Cache-Control': 'no-cache',
@@ -3354,33 +3830,42 @@ def list_files():
                 path = '/home/steam'
                 logger.warning(f"父目录不是有效目录，切换到默认目录: {path}")
             
-        # 获取目录内容
-        items = []
-        for name in os.listdir(path):
-            full_path = os.path.join(path, name)
-            stat_result = os.stat(full_path)
-            
-            # 确定类型
-            item_type = 'directory' if os.path.isdir(full_path) else 'file'
-            
-            # 获取修改时间
-            mtime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat_result.st_mtime))
-            
-            # 获取文件大小（对于目录，大小为0）
-            size = 0 if item_type == 'directory' else stat_result.st_size
-            
-            items.append({
-                'name': name,
-                'path': full_path,
-                'type': item_type,
-                'size': size,
-                'modified': mtime
-            })
-            
-        # 按照类型和名称排序，先显示目录，再显示文件
-        items.sort(key=lambda x: (0 if x['type'] == 'directory' else 1, x['name']))
+        # 目录未变化时直接返回304
+        etag = directory_listing.get_etag(path)
+        if request.if_none_match and etag.strip('"') in request.if_none_match:
+            response = make_response('', 304)
+            response.headers['ETag'] = etag
+            return response
         
-        return jsonify({'status': 'success', 'files': items, 'path': path})
+        # 获取目录内容，支持排序、过滤和游标分页（limit为0时返回全部）
+        try:
+            items, total, next_cursor, etag = directory_listing.list(
+                path,
+                sort=request.args.get('sort', 'name'),
+                order=request.args.get('order', 'asc'),
+                dirs_first=request.args.get('dirs_first', 'true').lower() != 'false',
+                search=request.args.get('filter') or None,
+                item_type=request.args.get('type') or None,
+                limit=max(0, request.args.get('limit', 0, type=int)),
+                cursor=request.args.get('cursor') or None
+            )
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        # 网格视图可以请求附带缩略图地址，并在后台预先生成当前页的缩略图
+        if request.args.get('thumbnails', 'false').lower() == 'true' and thumbnail_service.available:
+            thumb_size = request.args.get('thumb_size', DEFAULT_THUMBNAIL_SIZE, type=int)
+            if thumb_size not in THUMBNAIL_SIZES:
+                return jsonify({'status': 'error', 'message': f'不支持的缩略图尺寸: {thumb_size}'}), 400
+            images = [item for item in items if item['type'] == 'file' and is_image(item['name'])]
+            for item in images:
+                item['thumbnail'] = thumbnail_service.thumbnail_url(item, thumb_size)
+            thumbnail_service.prefetch([item['path'] for item in images], thumb_size)
+        
+        response = jsonify({'status': 'success', 'files': items, 'path': path, 'total': total, 'next_cursor': next_cursor})
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
     except Exception as e:
         logger.error(f"列出文件时出错: {str(e)}")
@@ -3416,6 +3901,239 @@ def list_files():
             logger.error(f"尝试使用默认路径也失败: {str(inner_e)}")
             return jsonify({'status': 'error', 'message': f'无法列出文件: {str(e)}'})
 
+@app.route('/api/files/watch', methods=['GET'])
+def watch_files():
+    """以SSE推送目录中的文件变化（认证使用 ?token= 参数），可以用多个path参数同时订阅多个目录
+
+    首先推送ready事件，其中paths给出请求路径对应的真实路径（事件中的directory使用真实路径）；
+    之后每批事件为 {'events': [...]}，type为created/modified/deleted/moved/deleted_self，
+    收到overflow时客户端应重新加载整个列表
+    """
+    paths = request.args.getlist('path')
+    if not paths:
+        return jsonify({'status': 'error', 'message': '缺少目录路径'}), 400
+    for path in paths:
+        if '..' in path or not path.startswith('/'):
+            return jsonify({'status': 'error', 'message': f'无效的目录路径: {path}'}), 400
+        if not os.path.isdir(path):
+            return jsonify({'status': 'error', 'message': f'目录不存在: {path}'}), 404
+
+    try:
+        subscription = fs_watcher.subscribe(paths)
+    except WatchError as e:
+        logger.error(f"监听目录失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+
+    def generate():
+        try:
+            ready = {'type': 'ready', 'paths': {path: os.path.realpath(path) for path in paths}}
+            yield f"data: {json.dumps(ready, ensure_ascii=False)}\n\n"
+            while True:
+                batch = subscription.get(15)
+                if batch is None:
+                    # 心跳，及时发现断开的连接
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {json.dumps({'events': batch}, ensure_ascii=False)}\n\n"
+        finally:
+            subscription.close()
+
+    return Response(stream_with_context(track_sse_client('fs_watch', generate())),
+                   mimetype='text/event-stream',
+                   headers={
+                       'Cache-Control': 'no-cache',
+                       'X-Accel-Buffering': 'no'
+                   })
+
+@app.route('/api/files/watch/status', methods=['GET'])
+def watch_files_status():
+    """查询文件变化监听服务的状态"""
+    return jsonify({'status': 'success', 'watcher': fs_watcher.get_status()})
+
+@app.route('/api/files/hash', methods=['GET', 'POST'])
+def hash_files():
+    """计算文件哈希，未变化的文件直接返回缓存的结果
+
+    GET参数或POST JSON：
+    - path/paths: 一个或多个文件路径，目录需要 recursive=true 并展开为其中的所有文件
+    - algorithm/algorithms: sha1、sha256（默认）、sha512，安装xxhash后还支持xxh64、xxh3_64、xxh128
+    - expected: 期望的摘要，可以是字符串（单个文件）或 {路径: 摘要}，结果中的match表示是否一致
+    - async: 作为后台任务执行，结果保存在任务的result中
+    """
+    try:
+        if request.method == 'GET':
+            data = {
+                'paths': request.args.getlist('path'),
+                'algorithms': request.args.getlist('algorithm') or None,
+                'recursive': request.args.get('recursive', 'false').lower() == 'true',
+                'expected': request.args.get('expected')
+            }
+        else:
+            data = request.json or {}
+        paths = data.get('paths') or ([data['path']] if data.get('path') else [])
+        recursive = bool(data.get('recursive'))
+        expected = data.get('expected')
+
+        if not paths:
+            return jsonify({'status': 'error', 'message': '缺少文件路径'}), 400
+        for path in paths:
+            if not isinstance(path, str) or '..' in path or not path.startswith('/'):
+                return jsonify({'status': 'error', 'message': f'无效的文件路径: {path}'}), 400
+        algorithms = normalize_algorithms(data.get('algorithms') or data.get('algorithm'))
+        if isinstance(expected, str):
+            if len(paths) != 1:
+                return jsonify({'status': 'error', 'message': '多个文件时expected需要是 {路径: 摘要}'}), 400
+            expected = {paths[0]: expected}
+        expected = {path: digest.strip().lower() for path, digest in (expected or {}).items()}
+
+        files, errors = file_hasher.expand_paths(paths, recursive)
+
+        def run(ctx):
+            ctx.set_total(len(files), sum(os.path.getsize(path) for path in files))
+            results = file_hasher.hash_paths(files, algorithms,
+                                             lambda count, size, current: ctx.advance(count, size, current))
+            for result in results:
+                if result['path'] in expected and 'hashes' in result:
+                    result['match'] = expected[result['path']] in result['hashes'].values()
+            return {'algorithms': algorithms, 'results': results + errors}
+
+        if data.get('async'):
+            return submit_file_job('hash', f'计算 {len(files)} 个文件的哈希', run,
+                                   {'paths': paths, 'algorithms': algorithms})
+        result = run_file_job('hash', f'计算 {len(files)} 个文件的哈希', run)
+        return jsonify(dict(result, status='success'))
+    except HashError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"计算文件哈希失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'计算文件哈希失败: {str(e)}'}), 500
+
+@app.route('/api/files/hash/status', methods=['GET'])
+def hash_files_status():
+    """查询哈希缓存的命中情况"""
+    return jsonify({'status': 'success', 'hash': file_hasher.get_status()})
+
+@app.route('/api/files/thumbnail', methods=['GET'])
+def get_thumbnail():
+    """获取图片的缩略图（size: 64/128/256/512，format: webp/png，默认webp），生成后缓存在磁盘中
+
+    带v参数（目录列表返回的缩略图地址）时允许浏览器长期缓存，文件变化后地址随之变化
+    """
+    try:
+        path = request.args.get('path')
+        size = request.args.get('size', DEFAULT_THUMBNAIL_SIZE, type=int)
+        
+        if not path or '..' in path or not path.startswith('/'):
+            return jsonify({'status': 'error', 'message': '无效的文件路径'}), 400
+        if not os.path.isfile(path):
+            return jsonify({'status': 'error', 'message': '文件不存在'}), 404
+        if not thumbnail_service.available:
+            return jsonify({'status': 'error', 'message': '未安装Pillow库，无法生成缩略图'}), 501
+        
+        try:
+            thumb_path, mime_type = thumbnail_service.get(path, size, request.args.get('format') or None)
+        except ThumbnailError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 422
+        response, sent_bytes = send_file_ranges(thumb_path, mimetype=mime_type)
+        if request.args.get('v'):
+            response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        DOWNLOAD_BYTES.inc(sent_bytes, kind='thumbnail')
+        return response
+    except Exception as e:
+        logger.error(f"获取缩略图失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'获取缩略图失败: {str(e)}'}), 500
+
+@app.route('/api/files/thumbnail/status', methods=['GET'])
+def thumbnail_status():
+    """查询缩略图服务和缓存的状态"""
+    return jsonify({'status': 'success', 'thumbnail': thumbnail_service.get_status()})
+
+@app.route('/api/sync/signatures', methods=['POST'])
+def sync_signatures():
+    """获取目标目录（或单个文件）的分块签名，客户端据此计算只包含差异的增量流
+
+    POST JSON：
+    - path: 目标目录或文件
+    - files: 只返回这些相对路径的签名（可选，通常先用 blocks=false 比较大小和mtime，再只请求有变化的文件）
+    - blocks: 是否包含分块签名，默认true
+    - block_size: 指定块大小，默认取文件大小的平方根
+
+    每个文件的blocks为base64编码的定长记录：Adler-32（4字节大端，与zlib.adler32相同，可滚动计算）+ BLAKE2b-128（16字节）
+    """
+    try:
+        data = request.json or {}
+        path = data.get('path')
+        files = data.get('files')
+        block_size = data.get('block_size')
+
+        if not path or '..' in path or not path.startswith('/'):
+            return jsonify({'status': 'error', 'message': '无效的路径'}), 400
+        if not os.path.exists(path):
+            return jsonify({'status': 'error', 'message': '路径不存在'}), 404
+        if files is not None and (not isinstance(files, list) or not all(isinstance(name, str) for name in files)):
+            return jsonify({'status': 'error', 'message': 'files需要是相对路径列表'}), 400
+        if block_size is not None and (not isinstance(block_size, int) or not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE):
+            return jsonify({'status': 'error', 'message': f'块大小需要在 {MIN_BLOCK_SIZE} 到 {MAX_BLOCK_SIZE} 之间'}), 400
+
+        result = tree_signatures(path, files, data.get('blocks', True) is not False, block_size)
+        return jsonify(dict(result, status='success', path=path))
+    except UnsafeEntryError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"生成同步签名失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'生成同步签名失败: {str(e)}'}), 500
+
+@app.route('/api/sync/apply', methods=['POST'])
+def sync_apply():
+    """按请求体中的增量流（格式见 delta_sync 模块）重建 ?path= 目录下的文件
+
+    每个文件先写入同目录的临时文件，SHA-256校验通过后原子替换；校验失败的文件保持原样，需要重新获取签名后再同步。
+    D记录删除的路径默认移入回收站，?permanent=true 时直接删除
+    """
+    try:
+        root = request.args.get('path', '')
+        if not root or '..' in root or not root.startswith('/'):
+            return jsonify({'status': 'error', 'message': '无效的路径'}), 400
+        if not os.path.isdir(root):
+            return jsonify({'status': 'error', 'message': '目标目录不存在'}), 404
+        permanent = request.args.get('permanent', 'false').lower() == 'true'
+        username = g.user.get('username') if hasattr(g, 'user') else None
+
+        def remove(path):
+            if not permanent:
+                try:
+                    trash_manager.trash(path, username)
+                    return
+                except (TrashError, OSError) as e:
+                    logger.warning(f"移入回收站失败，改为直接删除 {path}: {str(e)}")
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+        applier = DeltaApplier(root, request.stream, remove)
+        try:
+            results = applier.apply()
+            error = None
+        except DeltaError as e:
+            results = applier.results
+            error = str(e)
+        finally:
+            for directory in {os.path.dirname(os.path.join(root, result['path'])) for result in applier.results}:
+                directory_listing.invalidate(directory)
+
+        summary = {'results': results, 'bytes_received': applier.bytes_received}
+        for status in ('created', 'updated', 'deleted', 'error'):
+            summary[status] = sum(1 for result in results if result['status'] == status)
+        if error:
+            return jsonify(dict(summary, status='error', message=f'增量流无效: {error}')), 400
+        return jsonify(dict(summary, status='success' if not summary['error'] else 'error',
+                            message=f"{summary['error']} 个文件同步失败" if summary['error']
+                            else f"已同步 {len(results)} 个路径"))
+    except Exception as e:
+        logger.error(f"应用增量同步失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'应用增量同步失败: {str(e)}'}), 500
+
 @app.route('/api/open_folder', methods=['GET'])
 def open_folder():
     """在客户端打开指定的文件夹"""
@@ -3464,48 +4182,110 @@ def get_file_content():
         if not os.path.isfile(path):
             return jsonify({'status': 'error', 'message': '路径不是文件'})
             
-        # 检查文件大小，防止读取过大的文件
+        # 检查文件大小，防止读取过大的文件；大文件通过 /api/file_lines 分页查看
         if os.path.getsize(path) > 10 * 1024 * 1024:  # 10MB限制
-            return jsonify({'status': 'error', 'message': '文件过大，无法读取'})
+            return jsonify({'status': 'error', 'message': '文件过大，请使用分页查看', 'paged': True})
             
         # 验证编码格式
         supported_encodings = ['utf-8', 'gbk', 'gb2312', 'big5', 'ascii', 'latin1', 'utf-16', 'utf-32']
         if encoding not in supported_encodings:
             encoding = 'utf-8'  # 如果编码不支持，回退到UTF-8
             
-        # 读取文件内容
+        # 读取文件内容，同时返回版本信息，保存时用于检测冲突
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            raw = f.read()
         try:
-            with open(path, 'r', encoding=encoding, errors='replace') as f:
-                content = f.read()
+            content = raw.decode(encoding, errors='replace')
         except UnicodeDecodeError:
             # 如果指定编码失败，尝试使用UTF-8
             logger.warning(f"使用编码 {encoding} 读取文件失败，尝试使用 UTF-8")
-            with open(path, 'r', encoding='utf-8', errors='replace') as f:
-                content = f.read()
+            content = raw.decode('utf-8', errors='replace')
             encoding = 'utf-8'  # 更新实际使用的编码
+        # 与文本模式读取一致，统一换行符
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
             
         return jsonify({
             'status': 'success', 
             'content': content,
-            'encoding': encoding  # 返回实际使用的编码
+            'encoding': encoding,  # 返回实际使用的编码
+            'mtime': st.st_mtime,
+            'mtime_ns': st.st_mtime_ns,
+            'hash': hash_bytes(raw)
         })
         
     except Exception as e:
         logger.error(f"读取文件内容时出错: {str(e)}")
         return jsonify({'status': 'error', 'message': f'读取文件失败: {str(e)}'})
 
+@app.route('/api/file_lines', methods=['GET'])
+def get_file_lines():
+    """分页读取文本文件，响应大小与文件大小无关
+
+    mode=lines: 从第start行（从1开始）读取count行
+    mode=tail: 读取最后count行
+    mode=follow: 读取offset字节之后新增的完整行，wait为没有新内容时最多等待的秒数
+    """
+    try:
+        path = request.args.get('path')
+        mode = request.args.get('mode', 'lines')
+        encoding = request.args.get('encoding', 'utf-8')
+        count = request.args.get('count', 200, type=int)
+        
+        # 安全检查
+        if not path or '..' in path or not path.startswith('/'):
+            return jsonify({'status': 'error', 'message': '无效的文件路径'}), 400
+        if not os.path.isfile(path):
+            return jsonify({'status': 'error', 'message': '文件不存在或不是文件'}), 404
+        if encoding not in PAGEABLE_ENCODINGS:
+            return jsonify({'status': 'error', 'message': f'分页查看不支持编码: {encoding}'}), 400
+        
+        if mode == 'tail':
+            result = file_viewer.tail(path, count, encoding)
+        elif mode == 'follow':
+            offset = request.args.get('offset', type=int)
+            if offset is None or offset < 0:
+                return jsonify({'status': 'error', 'message': '跟随模式需要提供offset参数'}), 400
+            wait = min(max(request.args.get('wait', 0, type=float), 0), 10)
+            result = file_viewer.follow(path, offset, encoding, wait=wait)
+        elif mode == 'lines':
+            start = request.args.get('start', 1, type=int)
+            result = file_viewer.read_lines(path, start, count, encoding)
+        else:
+            return jsonify({'status': 'error', 'message': f'不支持的模式: {mode}'}), 400
+        
+        return jsonify({'status': 'success', **result})
+        
+    except Exception as e:
+        logger.error(f"分页读取文件失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'读取文件失败: {str(e)}'}), 500
+
 @app.route('/api/save_file', methods=['POST'])
 def save_file_content():
-    """保存文件内容"""
+    """保存文件内容
+
+    写入临时文件后原子替换原文件。可选参数:
+        expected_mtime / expected_hash: 文件必须仍是该版本，否则返回409
+        edits: 代替content的补丁，[{rangeOffset, rangeLength, text}]，按顺序应用，必须同时提供expected_hash
+    """
     try:
         data = request.json
         path = data.get('path')
         content = data.get('content', '')
         encoding = data.get('encoding', 'utf-8')  # 默认使用UTF-8编码
+        edits = data.get('edits')
+        expected_mtime = data.get('expected_mtime')
+        expected_hash = data.get('expected_hash')
         
         # 安全检查
         if not path or '..' in path or not path.startswith('/'):
             return jsonify({'status': 'error', 'message': '无效的文件路径'})
+        
+        if edits is not None:
+            if not isinstance(edits, list):
+                return jsonify({'status': 'error', 'message': 'edits必须是数组'}), 400
+            if not expected_hash:
+                return jsonify({'status': 'error', 'message': '使用补丁保存时必须提供expected_hash'}), 400
             
         # 验证编码格式
         supported_encodings = ['utf-8', 'gbk', 'gb2312', 'big5', 'ascii', 'latin1', 'utf-16', 'utf-32']
@@ -3519,27 +4299,113 @@ def save_file_content():
             
         # 写入文件
         try:
-            with open(path, 'w', encoding=encoding) as f:
-                f.write(content)
-        except UnicodeEncodeError:
-            # 如果指定编码失败，尝试使用UTF-8
-            logger.warning(f"使用编码 {encoding} 保存文件失败，尝试使用 UTF-8")
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            encoding = 'utf-8'  # 更新实际使用的编码
+            encoding, version = save_text(path, content, encoding, edits, expected_mtime, expected_hash)
+        except SaveConflict as e:
+            return jsonify({'status': 'error', 'message': str(e), 'conflict': True, 'current': e.current}), 409
+        except PatchError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 422
+        
+        # 覆盖写入不会改变目录mtime，需要主动让目录列表缓存失效
+        directory_listing.invalidate(dir_path)
             
         return jsonify({
             'status': 'success',
-            'encoding': encoding  # 返回实际使用的编码
+            'encoding': encoding,  # 返回实际使用的编码
+            'mtime': version['mtime'],
+            'mtime_ns': version['mtime_ns'],
+            'hash': version['hash'],
+            'size': version['size']
         })
         
     except Exception as e:
         logger.error(f"保存文件内容时出错: {str(e)}")
         return jsonify({'status': 'error', 'message': f'保存文件失败: {str(e)}'})
 
+def submit_file_job(job_type, title, func, params):
+    """提交后台文件任务，返回给客户端的响应"""
+    username = g.user.get('username') if hasattr(g, 'user') else None
+    job = job_manager.submit(job_type, title, func, params, username)
+    return jsonify({
+        'status': 'success',
+        'message': '任务已提交',
+        'job_id': job.id,
+        'job': job.to_dict()
+    })
+
+def run_file_job(job_type, title, func, params=None, job_id=None):
+    """在后台任务线程池中执行文件任务并等待结果（客户端要求同步返回时使用），失败时抛出任务的异常"""
+    username = g.user.get('username') if hasattr(g, 'user') else None
+    return job_manager.run_inline(job_type, title, func, params, username, job_id)
+
+def wants_background_job(data):
+    """耗时的文件操作默认作为后台任务执行并立即返回job_id，async为false时等待任务完成后再返回"""
+    return str(data.get('async', True)).lower() not in ('false', '0', '')
+
+def remove_path_with_progress(ctx, path):
+    """删除文件或目录，逐个条目报告进度"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        for root, dirs, files in os.walk(path, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+                ctx.advance(items=1)
+            for name in dirs:
+                dir_path = os.path.join(root, name)
+                if os.path.islink(dir_path):
+                    os.remove(dir_path)
+                else:
+                    os.rmdir(dir_path)
+                ctx.advance(items=1, current=dir_path)
+        os.rmdir(path)
+    else:
+        os.remove(path)
+    ctx.advance(items=1)
+
+def move_path(ctx, source_path, destination_path):
+    """移动文件或目录，已存在的目标路径被替换；跨文件系统时返回复制统计"""
+    if os.lstat(source_path).st_dev == os.stat(os.path.dirname(destination_path) or '/').st_dev:
+        # 同一文件系统内直接重命名，已存在的目标路径先移到一旁，替换成功后再删除
+        ctx.set_total(1)
+        old_path = None
+        if os.path.lexists(destination_path):
+            old_path = os.path.join(os.path.dirname(destination_path),
+                                    f".{os.path.basename(destination_path)}.old-{uuid.uuid4().hex[:8]}")
+            os.rename(destination_path, old_path)
+        try:
+            os.rename(source_path, destination_path)
+        except OSError:
+            if old_path:
+                os.rename(old_path, destination_path)
+            raise
+        if old_path:
+            # 被替换的旧目标交给回收线程在后台删除
+            trash_manager.discard(old_path)
+        ctx.advance(items=1)
+        return None
+    # 跨文件系统时先复制再删除源路径
+    items, total = measure_paths([source_path])
+    ctx.set_total(items * 2, total)
+    stats = fast_copier.copy(source_path, destination_path,
+                             lambda count, size, current: ctx.advance(count, size, current))
+    remove_path_with_progress(ctx, source_path)
+    return stats
+
+def chmod_path(path, mode, recursive=False):
+    """修改文件或目录的权限，recursive为true时包括目录中的所有子目录和文件"""
+    if recursive and os.path.isdir(path):
+        # 递归修改目录及其内容的权限
+        for root, dirs, files in os.walk(path):
+            # 修改目录权限
+            os.chmod(root, mode)
+            # 修改文件权限
+            for file in files:
+                os.chmod(os.path.join(root, file), mode)
+    else:
+        # 仅修改当前文件或目录的权限
+        os.chmod(path, mode)
+
 @app.route('/api/copy', methods=['POST'])
 def copy_item():
-    """复制文件或目录"""
+    """复制文件或目录，默认作为后台任务执行并返回job_id，async为false时等待完成后返回"""
     try:
         data = request.json
         source_path = data.get('sourcePath')
@@ -3555,21 +4421,20 @@ def copy_item():
         # 确保源路径存在
         if not os.path.exists(source_path):
             return jsonify({'status': 'error', 'message': '源路径不存在'})
+        
+        def run(ctx):
+            items, total = measure_paths([source_path])
+            ctx.set_total(items, total)
+            # 先复制到临时路径，成功后再替换已存在的目标路径
+            return fast_copier.copy(source_path, destination_path,
+                                    lambda count, size, current: ctx.advance(count, size, current))
+        
+        if wants_background_job(data):
+            return submit_file_job('copy', f'复制 {source_path} 到 {destination_path}', run,
+                                   {'sourcePath': source_path, 'destinationPath': destination_path})
+        stats = run_file_job('copy', f'复制 {source_path}', run)
             
-        # 如果目标路径已存在，先删除
-        if os.path.exists(destination_path):
-            if os.path.isdir(destination_path):
-                shutil.rmtree(destination_path)
-            else:
-                os.remove(destination_path)
-                
-        # 复制文件或目录
-        if os.path.isdir(source_path):
-            shutil.copytree(source_path, destination_path)
-        else:
-            shutil.copy2(source_path, destination_path)
-            
-        return jsonify({'status': 'success'})
+        return jsonify({'status': 'success', 'stats': stats})
         
     except Exception as e:
         logger.error(f"复制文件/目录时出错: {str(e)}")
@@ -3577,7 +4442,7 @@ def copy_item():
 
 @app.route('/api/move', methods=['POST'])
 def move_item():
-    """移动文件或目录"""
+    """移动文件或目录，默认作为后台任务执行并返回job_id，async为false时等待完成后返回"""
     try:
         data = request.json
         source_path = data.get('sourcePath')
@@ -3593,16 +4458,14 @@ def move_item():
         # 确保源路径存在
         if not os.path.exists(source_path):
             return jsonify({'status': 'error', 'message': '源路径不存在'})
-            
-        # 如果目标路径已存在，先删除
-        if os.path.exists(destination_path):
-            if os.path.isdir(destination_path):
-                shutil.rmtree(destination_path)
-            else:
-                os.remove(destination_path)
-                
-        # 移动文件或目录
-        shutil.move(source_path, destination_path)
+        
+        def run(ctx):
+            return move_path(ctx, source_path, destination_path)
+        
+        if wants_background_job(data):
+            return submit_file_job('move', f'移动 {source_path} 到 {destination_path}', run,
+                                   {'sourcePath': source_path, 'destinationPath': destination_path})
+        run_file_job('move', f'移动 {source_path}', run)
             
         return jsonify({'status': 'success'})
         
@@ -3612,32 +4475,209 @@ def move_item():
 
 @app.route('/api/delete', methods=['POST'])
 def delete_item():
-    """删除文件或目录"""
+    """删除文件或目录
+
+    默认移入同一文件系统上的回收站并立即返回；permanent为true时直接删除，默认作为后台任务执行并返回job_id，async为false时等待完成
+    """
     try:
         data = request.json
         path = data.get('path')
-        item_type = data.get('type')
         
         # 安全检查
         if not path or '..' in path or not path.startswith('/'):
             return jsonify({'status': 'error', 'message': '无效的路径'})
             
         # 确保路径存在
-        if not os.path.exists(path):
+        if not os.path.lexists(path):
             return jsonify({'status': 'error', 'message': '路径不存在'})
+        
+        if not data.get('permanent'):
+            try:
+                entry = trash_manager.trash(path, g.user.get('username') if hasattr(g, 'user') else None)
+                return jsonify({'status': 'success', 'trashed': True, 'trash_id': entry['id'],
+                                'expires_at': entry['expires_at']})
+            except (TrashError, OSError) as e:
+                # 例如挂载点无法重命名，退回直接删除
+                logger.warning(f"移入回收站失败，改为直接删除 {path}: {str(e)}")
+        
+        def run(ctx):
+            items, _ = measure_paths([path])
+            ctx.set_total(items)
+            remove_path_with_progress(ctx, path)
+        
+        if wants_background_job(data):
+            return submit_file_job('delete', f'删除 {path}', run, {'path': path})
+        run_file_job('delete', f'删除 {path}', run)
             
-        # 删除文件或目录
-        if item_type == 'directory' or os.path.isdir(path):
-            shutil.rmtree(path)
-        else:
-            os.remove(path)
-            
-        return jsonify({'status': 'success'})
+        return jsonify({'status': 'success', 'trashed': False})
         
     except Exception as e:
         logger.error(f"删除文件/目录时出错: {str(e)}")
         return jsonify({'status': 'error', 'message': f'删除失败: {str(e)}'})
 
+def run_batch_operation(ctx, op, username):
+    """执行批量操作中的单个操作，返回附加到结果中的信息"""
+    kind = op['op']
+    if kind == 'delete':
+        if not op['permanent']:
+            try:
+                entry = trash_manager.trash(op['path'], username)
+                return {'trashed': True, 'trash_id': entry['id']}
+            except (TrashError, OSError) as e:
+                logger.warning(f"移入回收站失败，改为直接删除 {op['path']}: {str(e)}")
+        remove_path_with_progress(ctx, op['path'])
+        return {'trashed': False}
+    if kind == 'move':
+        stats = move_path(ctx, op['path'], op['destination'])
+        return {'stats': stats} if stats else None
+    if kind == 'copy':
+        stats = fast_copier.copy(op['path'], op['destination'],
+                                 lambda count, size, current: ctx.advance(count, size, current))
+        return {'stats': stats}
+    if kind == 'rename':
+        if os.path.lexists(op['destination']):
+            raise FileExistsError('目标路径已存在')
+        os.rename(op['path'], op['destination'])
+        return None
+    if kind == 'chmod':
+        chmod_path(op['path'], op['mode'], op['recursive'])
+        return {'mode': oct(stat.S_IMODE(os.stat(op['path']).st_mode))}
+    raise ValueError(f'未知的操作类型: {kind}')
+
+@app.route('/api/batch', methods=['POST'])
+def batch_file_operations():
+    """批量执行文件操作（delete、move、copy、chmod、rename），格式见 batch_ops.plan
+
+    所有操作先整体校验，任何一个不通过时都不执行并返回400和errors；
+    互不冲突的操作并行执行；默认作为后台任务执行并返回job_id，结果保存在任务的result中，async为false时等待完成并直接返回每个操作的结果
+    """
+    try:
+        data = request.json or {}
+        try:
+            planned = batch_ops.plan(data.get('operations'))
+        except batch_ops.BatchValidationError as e:
+            return jsonify({'status': 'error', 'message': str(e), 'errors': e.errors}), 400
+        username = g.user.get('username') if hasattr(g, 'user') else None
+
+        def run(ctx):
+            results = batch_ops.run(ctx, planned, lambda op_ctx, op: run_batch_operation(op_ctx, op, username))
+            summary = {'results': results}
+            for status in ('success', 'error', 'skipped', 'cancelled'):
+                summary[status] = sum(1 for result in results if result['status'] == status)
+            if ctx.cancelled:
+                # 保留已完成部分的结果
+                ctx.job.result = summary
+                raise JobCancelled()
+            return summary
+
+        title = f'批量操作 {len(planned)} 项'
+        if wants_background_job(data):
+            return submit_file_job('batch', title, run, {'operations': len(planned)})
+        summary = run_file_job('batch', title, run)
+        failed = summary['error'] + summary['skipped']
+        return jsonify(dict(summary, status='success' if not failed else 'error',
+                            message=f'{failed} 个操作未成功' if failed else f"{summary['success']} 个操作已完成"))
+    except Exception as e:
+        logger.error(f"批量文件操作失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'批量文件操作失败: {str(e)}'}), 500
+
+@app.route('/api/trash', methods=['GET'])
+def list_trash():
+    """列出回收站条目及待释放的空间"""
+    try:
+        return jsonify({'status': 'success', **trash_manager.list()})
+    except Exception as e:
+        logger.error(f"获取回收站列表失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'获取回收站列表失败: {str(e)}'}), 500
+
+@app.route('/api/trash/<entry_id>/restore', methods=['POST'])
+def restore_trash_entry(entry_id):
+    """还原回收站条目，可以通过targetPath指定还原位置"""
+    try:
+        data = request.get_json(silent=True) or {}
+        target_path = data.get('targetPath')
+        if target_path and ('..' in target_path or not target_path.startswith('/')):
+            return jsonify({'status': 'error', 'message': '无效的还原路径'}), 400
+        restored = trash_manager.restore(entry_id, target_path)
+        return jsonify({'status': 'success', 'message': '已还原', 'path': restored})
+    except TrashError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"还原回收站条目失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'还原失败: {str(e)}'}), 500
+
+@app.route('/api/trash/<entry_id>/purge', methods=['POST'])
+def purge_trash_entry(entry_id):
+    """立即清除回收站条目（在后台限速删除）"""
+    try:
+        trash_manager.purge(entry_id)
+        return jsonify({'status': 'success', 'message': '条目将在后台清除'})
+    except TrashError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+
+@app.route('/api/trash/empty', methods=['POST'])
+def empty_trash():
+    """清空回收站（在后台限速删除）"""
+    count = trash_manager.purge()
+    return jsonify({'status': 'success', 'message': f'{count} 个条目将在后台清除'})
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """列出后台任务，state可以是active或具体状态"""
+    try:
+        state = request.args.get('state')
+        job_type = request.args.get('type')
+        jobs = [job.to_dict() for job in job_manager.list(state, job_type)]
+        return jsonify({'status': 'success', 'jobs': jobs})
+    except Exception as e:
+        logger.error(f"获取后台任务列表失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'获取后台任务列表失败: {str(e)}'}), 500
+
+@app.route('/api/jobs/stream', methods=['GET'])
+def stream_jobs():
+    """以SSE推送进行中任务的进度，任务结束时推送一次最终状态（认证使用 ?token= 参数）"""
+    def generate():
+        reported = {}
+        while True:
+            events = []
+            for job in job_manager.list():
+                if job.state in ('queued', 'running'):
+                    events.append(job.to_dict())
+                    reported[job.id] = job.state
+                elif job.id in reported:
+                    events.append(job.to_dict())
+                    del reported[job.id]
+            yield f"data: {json.dumps({'jobs': events}, ensure_ascii=False)}\n\n"
+            time.sleep(1)
+    
+    return Response(stream_with_context(track_sse_client('jobs', generate())),
+                   mimetype='text/event-stream',
+                   headers={
+                       'Cache-Control': 'no-cache',
+                       'X-Accel-Buffering': 'no'
+                   })
+
+@app.route('/api/jobs/<job_id>', methods=['GET', 'DELETE'])
+def manage_job(job_id):
+    """查询后台任务，DELETE删除已结束的任务记录"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+    if request.method == 'DELETE':
+        if not job_manager.remove(job_id):
+            return jsonify({'status': 'error', 'message': '任务仍在进行中，请先取消'}), 409
+        return jsonify({'status': 'success', 'message': '任务记录已删除'})
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消后台任务，已处理的部分不会回滚"""
+    job = job_manager.cancel(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+    logger.info(f"已请求取消后台任务: {job_id}")
+    return jsonify({'status': 'success', 'message': '已请求取消任务', 'job': job.to_dict()})
+
 @app.route('/api/search', methods=['GET'])
 def search_files():
     """搜索文件和文件夹"""
@@ -3666,6 +4706,28 @@ def search_files():
         if not search_query.strip():
             return jsonify({'status': 'error', 'message': '搜索关键词不能为空'})
             
+        # 优先使用文件名索引，索引未建立或路径不在索引范围内时回退到遍历搜索
+        file_index.ensure_started()
+        search_mode = request.args.get('mode') or None  # substring, prefix, glob
+        if file_index.covers(search_path) and request.args.get('use_index', 'true').lower() != 'false':
+            try:
+                results, truncated = file_index.search(search_query, search_path, search_type, case_sensitive,
+                                                       search_mode, max_results)
+                return jsonify({
+                    'status': 'success',
+                    'results': results,
+                    'search_path': search_path,
+                    'search_query': search_query,
+                    'search_type': search_type,
+                    'case_sensitive': case_sensitive,
+                    'total_found': len(results),
+                    'max_results': max_results,
+                    'truncated': truncated,
+                    'indexed': True
+                })
+            except Exception as e:
+                logger.warning(f"文件索引查询失败，回退到遍历搜索: {str(e)}")
+        
         results = []
         search_count = 0
         
@@ -3755,12 +4817,72 @@ def search_files():
             'case_sensitive': case_sensitive,
             'total_found': len(results),
             'max_results': max_results,
-            'truncated': search_count >= max_results
+            'truncated': search_count >= max_results,
+            'indexed': False
         })
         
     except Exception as e:
-        logger.error(f"搜索文件时出错: {str(e)}")
-        return jsonify({'status': 'error', 'message': f'搜索失败: {str(e)}'})
+        logger.error(f"搜索文件时出错: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'搜索失败: {str(e)}'})
+
+@app.route('/api/search/index', methods=['GET', 'POST'])
+def file_index_status():
+    """获取文件名索引状态，POST时立即触发一次增量重扫"""
+    try:
+        file_index.ensure_started()
+        if request.method == 'POST':
+            file_index.request_rescan()
+        return jsonify({'status': 'success', 'index': file_index.get_status()})
+    except Exception as e:
+        logger.error(f"获取文件索引状态失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/files/grep', methods=['GET'])
+def grep_files():
+    """按内容搜索文件，以SSE流式返回匹配行（认证使用 ?token= 参数）
+
+    参数: path pattern regex(true/false) case_sensitive include/exclude(逗号分隔的通配符)
+    max_results max_bytes(MB) timeout(秒) max_file_size(MB)
+    """
+    try:
+        search_path = request.args.get('path', '/home/steam')
+        pattern = request.args.get('pattern', '')
+        use_regex = request.args.get('regex', 'false').lower() == 'true'
+        case_sensitive = request.args.get('case_sensitive', 'false').lower() == 'true'
+        include = [p.strip() for p in request.args.get('include', '').split(',') if p.strip()]
+        exclude = [p.strip() for p in request.args.get('exclude', '').split(',') if p.strip()]
+        max_results = min(max(request.args.get('max_results', 500, type=int), 1), 5000)
+        max_bytes = min(max(request.args.get('max_bytes', 512, type=int), 1), 4096) * 1024 * 1024
+        timeout = min(max(request.args.get('timeout', 30, type=int), 1), 120)
+        max_file_size = min(max(request.args.get('max_file_size', 50, type=int), 1), 512) * 1024 * 1024
+        
+        # 安全检查
+        if not search_path or '..' in search_path or not search_path.startswith('/'):
+            return jsonify({'status': 'error', 'message': '无效的搜索路径'}), 400
+        if not os.path.isdir(search_path):
+            return jsonify({'status': 'error', 'message': '搜索路径不存在或不是目录'}), 404
+        if not pattern:
+            return jsonify({'status': 'error', 'message': '搜索内容不能为空'}), 400
+        
+        try:
+            regex = content_searcher.compile_pattern(pattern, use_regex, case_sensitive)
+        except re.error as e:
+            return jsonify({'status': 'error', 'message': f'无效的正则表达式: {str(e)}'}), 400
+        
+        def generate():
+            for event in content_searcher.search(search_path, regex, include, exclude, max_results,
+                                                 max_bytes, timeout, max_file_size):
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        
+        return Response(stream_with_context(track_sse_client('grep', generate())),
+                       mimetype='text/event-stream',
+                       headers={
+                           'Cache-Control': 'no-cache',
+                           'X-Accel-Buffering': 'no'
+                       })
+    except Exception as e:
+        logger.error(f"内容搜索失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'内容搜索失败: {str(e)}'}), 500
 
 @app.route('/api/create_folder', methods=['POST'])
 def create_folder():
@@ -3818,16 +4940,92 @@ def rename_item():
         logger.error(f"重命名文件/目录时出错: {str(e)}")
         return jsonify({'status': 'error', 'message': f'重命名失败: {str(e)}'})
 
+def create_deploy_dir(server_name):
+    """创建半自动部署的游戏目录，返回 (目录, 错误信息)"""
+    if '/' in server_name or server_name in ('.', '..'):
+        return None, '服务器名称不能包含 / 或为 . 和 ..'
+    games_dir = "/home/steam/games"
+    game_dir = os.path.join(games_dir, server_name)
+    
+    # 检查目录是否已存在
+    if os.path.exists(game_dir):
+        return None, f'服务器 {server_name} 已存在，请选择其他名称'
+        
+    # 确保games目录存在
+    os.makedirs(games_dir, exist_ok=True)
+    os.makedirs(game_dir, exist_ok=True)
+    return game_dir, None
+
+def finish_deploy(game_dir, server_name, server_type, jdk_version):
+    """解压完成后设置目录权限，Java类型生成启动脚本，返回部署结果"""
+    # 设置目录权限
+    try:
+        subprocess.run(['chown', '-R', 'steam:steam', game_dir], check=True)
+    except:
+        logger.warning(f"设置目录权限失败: {game_dir}")
+        
+    # 如果是Java类型，生成启动脚本
+    start_script = None
+    if server_type == 'java':
+        start_script = generate_java_start_script(game_dir, server_name, jdk_version)
+    
+    return {
+        'server_name': server_name,
+        'game_dir': game_dir,
+        'server_type': server_type,
+        'start_script': start_script
+    }
+
+def extract_request_body(filename, target_dir):
+    """把请求体作为tar归档边接收边解压到target_dir，返回结束后的解压任务
+
+    客户端可以用 ?job_id= 预先指定32位十六进制的任务ID，上传期间通过 /api/extract/jobs/<job_id> 查询进度或取消
+    """
+    job = extraction_manager.create_streaming(filename, request.stream, request.content_length, target_dir,
+                                              request.args.get('job_id') or None)
+    job.run()
+    return job
+
+# 流式上传的请求结束时最多再读取的请求体字节数
+REQUEST_BODY_DRAIN_LIMIT = 64 * 1024 * 1024
+
+def finish_request_body():
+    """在响应发出前读掉请求体中未读取的部分（tar结束标记后的填充数据，或出错、取消时客户端仍在发送的数据）
+
+    超过REQUEST_BODY_DRAIN_LIMIT仍未读完时响应带上 Connection: close，
+    否则服务器直接关闭连接，客户端通常只会看到连接被重置而收不到错误信息
+    """
+    @after_this_request
+    def drain(response):
+        remaining = REQUEST_BODY_DRAIN_LIMIT
+        try:
+            while remaining > 0:
+                data = request.stream.read(min(1024 * 1024, remaining))
+                if not data:
+                    return response
+                remaining -= len(data)
+        except Exception as e:
+            logger.debug(f"读取剩余请求体失败: {str(e)}")
+        response.headers['Connection'] = 'close'
+        return response
+
 @app.route('/api/semi-auto-deploy', methods=['POST'])
 @auth_required
 def semi_auto_deploy():
     """半自动部署服务器"""
     try:
-        # 检查是否有文件
-        if 'file' not in request.files:
+        # 检查是否有文件（也可以引用已完成的分片上传会话）
+        upload_id = request.form.get('upload_id', '').strip()
+        if 'file' not in request.files and not upload_id:
             return jsonify({'status': 'error', 'message': '没有文件'}), 400
             
-        file = request.files['file']
+        file = request.files.get('file')
+        uploaded_path = None
+        if upload_id:
+            try:
+                uploaded_path = upload_manager.get_completed_file(upload_id)
+            except UploadError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), e.status_code
         server_name = request.form.get('server_name', '').strip()
         server_type = request.form.get('server_type', '').strip()
         jdk_version = request.form.get('jdk_version', '').strip()
@@ -3839,11 +5037,11 @@ def semi_auto_deploy():
         if not server_type:
             return jsonify({'status': 'error', 'message': '请选择服务端类型'}), 400
             
-        if file.filename == '':
+        if not uploaded_path and file.filename == '':
             return jsonify({'status': 'error', 'message': '没有选择文件'}), 400
             
         # 安全处理文件名
-        filename = secure_filename(file.filename)
+        filename = secure_filename(os.path.basename(uploaded_path) if uploaded_path else file.filename)
         
         # 检查文件扩展名
         allowed_extensions = ['.zip', '.rar', '.tar.gz', '.tar', '.7z']
@@ -3851,78 +5049,108 @@ def semi_auto_deploy():
             return jsonify({'status': 'error', 'message': '不支持的文件格式，请上传 .zip, .rar, .tar.gz, .tar, .7z 格式的压缩包'}), 400
             
         # 创建游戏目录
-        games_dir = "/home/steam/games"
-        game_dir = os.path.join(games_dir, server_name)
-        
-        # 检查目录是否已存在
-        if os.path.exists(game_dir):
-            return jsonify({'status': 'error', 'message': f'服务器 {server_name} 已存在，请选择其他名称'}), 400
-            
-        # 确保games目录存在
-        os.makedirs(games_dir, exist_ok=True)
-        os.makedirs(game_dir, exist_ok=True)
+        game_dir, error = create_deploy_dir(server_name)
+        if error:
+            return jsonify({'status': 'error', 'message': error}), 400
         
         # 保存上传的文件到临时位置
         temp_file = os.path.join(game_dir, filename)
-        file.save(temp_file)
+        if uploaded_path:
+            shutil.move(uploaded_path, temp_file)
+            # 文件已经移入游戏目录，此前的参数错误不会让上传会话失效，客户端可以重试
+            upload_manager.release(upload_id)
+        else:
+            file.save(temp_file)
         
         logger.info(f"文件已上传: {temp_file}, 用户: {g.user.get('username')}")
         
-        # 解压文件
-        try:
-            if filename.lower().endswith('.zip'):
-                with zipfile.ZipFile(temp_file, 'r') as zip_ref:
-                    zip_ref.extractall(game_dir)
-            elif filename.lower().endswith('.rar'):
-                with rarfile.RarFile(temp_file, 'r') as rar_ref:
-                    rar_ref.extractall(game_dir)
-            elif filename.lower().endswith(('.tar.gz', '.tar')):
-                with tarfile.open(temp_file, 'r:*') as tar_ref:
-                    tar_ref.extractall(game_dir)
-            elif filename.lower().endswith('.7z'):
-                # 使用7z命令行工具
-                result = subprocess.run(['7z', 'x', temp_file, f'-o{game_dir}'], 
-                                      capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise Exception(f"7z解压失败: {result.stderr}")
-            else:
-                raise Exception("不支持的压缩格式")
+        def run(ctx):
+            # 解压文件
+            extraction_job = extraction_manager.create(temp_file, game_dir)
+            try:
+                run_extraction_job(ctx, extraction_job)
+                logger.info(f"文件解压成功: {game_dir}")
+            except BaseException as e:
+                # 清理失败的目录
+                if os.path.exists(game_dir):
+                    shutil.rmtree(game_dir)
+                logger.error(f"解压文件失败: {str(e)}")
+                raise
                 
-            logger.info(f"文件解压成功: {game_dir}")
-            
+            # 删除原始压缩包
+            try:
+                os.remove(temp_file)
+            except:
+                pass
+                
+            return finish_deploy(game_dir, server_name, server_type, jdk_version)
+        
+        if request.form.get('async', '').lower() == 'true':
+            return submit_file_job('deploy', f'部署服务器 {server_name}', run,
+                                   {'server_name': server_name, 'server_type': server_type})
+        
+        try:
+            result = run_file_job('deploy', f'部署服务器 {server_name}', run)
         except Exception as e:
-            # 清理失败的目录
-            if os.path.exists(game_dir):
-                shutil.rmtree(game_dir)
-            logger.error(f"解压文件失败: {str(e)}")
             return jsonify({'status': 'error', 'message': f'解压文件失败: {str(e)}'}), 500
             
-        # 删除原始压缩包
-        try:
-            os.remove(temp_file)
-        except:
-            pass
+        return jsonify({
+            'status': 'success',
+            'message': '服务器部署成功',
+            'data': result
+        })
+        
+    except Exception as e:
+        logger.error(f"半自动部署时出错: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'部署失败: {str(e)}'}), 500
+
+@app.route('/api/semi-auto-deploy/stream', methods=['POST'])
+@auth_required
+def semi_auto_deploy_stream():
+    """半自动部署服务器，上传的同时解压
+
+    请求体直接是压缩包内容（不使用multipart），参数放在查询字符串中：server_name、server_type、jdk_version、
+    filename（用于判断格式，仅支持.tar/.tar.gz/.tgz/.tar.bz2/.tar.xz/.tar.zst）和可选的job_id
+    """
+    finish_request_body()
+    try:
+        server_name = request.args.get('server_name', '').strip()
+        server_type = request.args.get('server_type', '').strip()
+        jdk_version = request.args.get('jdk_version', '').strip()
+        filename = secure_filename(request.args.get('filename', ''))
+        
+        # 验证参数
+        if not server_name:
+            return jsonify({'status': 'error', 'message': '服务器名称不能为空'}), 400
             
-        # 设置目录权限
-        try:
-            subprocess.run(['chown', '-R', 'steam:steam', game_dir], check=True)
-        except:
-            logger.warning(f"设置目录权限失败: {game_dir}")
+        if not server_type:
+            return jsonify({'status': 'error', 'message': '请选择服务端类型'}), 400
             
-        # 如果是Java类型，生成启动脚本
-        start_script = None
-        if server_type == 'java':
-            start_script = generate_java_start_script(game_dir, server_name, jdk_version)
+        if detect_format(filename)[0] != 'tar':
+            return jsonify({'status': 'error', 'message': '边上传边解压只支持 .tar, .tar.gz, .tar.bz2, .tar.xz, .tar.zst 格式，其他格式请使用普通上传'}), 400
             
+        game_dir, error = create_deploy_dir(server_name)
+        if error:
+            return jsonify({'status': 'error', 'message': error}), 400
+            
+        logger.info(f"开始边上传边解压: {filename} -> {game_dir}, 用户: {g.user.get('username')}")
+        try:
+            job = extract_request_body(filename, game_dir)
+        except ValueError as e:
+            shutil.rmtree(game_dir, ignore_errors=True)
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if job.state != 'completed':
+            # 清理失败的目录
+            shutil.rmtree(game_dir, ignore_errors=True)
+            message = '部署已取消' if job.state == 'cancelled' else f'解压文件失败: {job.error}'
+            return jsonify({'status': 'error', 'message': message, 'job': job.to_dict()}), 500
+        logger.info(f"文件解压成功: {game_dir}, 用时 {job.to_dict()['elapsed']} 秒")
+        
         return jsonify({
             'status': 'success',
             'message': '服务器部署成功',
-            'data': {
-                'server_name': server_name,
-                'game_dir': game_dir,
-                'server_type': server_type,
-                'start_script': start_script
-            }
+            'data': finish_deploy(game_dir, server_name, server_type, jdk_version),
+            'job': job.to_dict()
         })
         
     except Exception as e:
@@ -4072,6 +5300,87 @@ def upload_file():
         logger.error(f"上传文件时出错: {str(e)}")
         return jsonify({'status': 'error', 'message': f'上传文件失败: {str(e)}'}), 500
 
+@app.route('/api/upload/sessions', methods=['POST'])
+def create_upload_session():
+    """创建分片上传会话
+
+    参数: path(目标目录，省略时上传到暂存目录，供半自动部署使用) filename size chunk_size
+    hash_algorithm(sha256/sha1/md5) hash overwrite
+    """
+    try:
+        data = request.json or {}
+        path = data.get('path') or upload_manager.state_dir
+        filename = secure_filename(data.get('filename', ''))
+        
+        # 安全检查
+        if '..' in path or not path.startswith('/'):
+            return jsonify({'status': 'error', 'message': '无效的目标路径'}), 400
+        if not filename:
+            return jsonify({'status': 'error', 'message': '无效的文件名'}), 400
+        os.makedirs(upload_manager.state_dir, exist_ok=True)
+        if not os.path.isdir(path):
+            return jsonify({'status': 'error', 'message': '目标目录不存在'}), 400
+        
+        session = upload_manager.create(path, filename, data.get('size'), data.get('chunk_size'),
+                                        data.get('hash_algorithm'), data.get('hash'),
+                                        bool(data.get('overwrite')), g.user.get('username') if hasattr(g, 'user') else None)
+        return jsonify(dict(upload_manager.get_status(session['id']), status='success'))
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"创建上传会话失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'创建上传会话失败: {str(e)}'}), 500
+
+@app.route('/api/upload/sessions/<upload_id>', methods=['GET', 'DELETE'])
+def upload_session(upload_id):
+    """查询上传进度和缺失的分片，或取消上传"""
+    try:
+        if request.method == 'DELETE':
+            upload_manager.abort(upload_id)
+            return jsonify({'status': 'success', 'message': '上传已取消'})
+        return jsonify(dict(upload_manager.get_status(upload_id), status='success'))
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"处理上传会话失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/upload/sessions/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """上传一个分片，请求体为分片原始数据，多个分片可以并行上传"""
+    try:
+        session = upload_manager.write_chunk(upload_id, index, request.stream, request.content_length)
+        return jsonify({
+            'status': 'success',
+            'index': index,
+            'received_chunks': len(session['received']),
+            'total_chunks': session['total_chunks']
+        })
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"写入上传分片失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'写入分片失败: {str(e)}'}), 500
+
+@app.route('/api/upload/sessions/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """完成上传：检查分片完整性、校验哈希并移动到目标位置"""
+    try:
+        session = upload_manager.complete(upload_id)
+        directory_listing.invalidate(session['target_dir'])
+        return jsonify({
+            'status': 'success',
+            'message': '文件上传成功',
+            'upload_id': upload_id,
+            'path': session['final_path'],
+            'size': session['size']
+        })
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"完成上传失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'完成上传失败: {str(e)}'}), 500
+
 @app.route('/api/download', methods=['GET'])
 def download_file():
     """下载文件"""
@@ -4097,10 +5406,10 @@ def download_file():
         filename = os.path.basename(path)
         
         # 检查是否为图片预览
+        mime_type = None
         if preview:
             # 获取文件MIME类型
             file_ext = os.path.splitext(path)[1].lower()
-            mime_type = None
             
             # 设置常见图片文件的MIME类型
             if file_ext in ['.jpg', '.jpeg']:
@@ -4115,23 +5424,80 @@ def download_file():
                 mime_type = 'image/webp'
             elif file_ext == '.svg':
                 mime_type = 'image/svg+xml'
-            
-            # 对于图片文件，如果是预览模式，设置合适的Content-Type
-            if preview and mime_type.startswith('image/'):
-                # logger.debug(f"预览图片: {path}, MIME类型: {mime_type}")
-                return send_file(path, mimetype=mime_type)
-            else:
-                # logger.debug(f"下载文件: {path}, 文件名: {filename}")
-                return send_file(path, as_attachment=True, download_name=filename, mimetype=mime_type)
         
-        # 发送文件作为附件下载
-        # logger.debug(f"下载文件: {path}, 文件名: {filename}")
-        return send_file(path, as_attachment=True, download_name=filename)
+        # 图片预览直接显示，其他文件作为附件下载；支持断点续传和多段范围请求
+        # 压缩生成的临时文件由过期清理删除：HEAD请求、中断的下载和之后的断点续传都需要文件仍然存在
+        response, sent_bytes = send_file_ranges(path, mimetype=mime_type,
+                                                as_attachment=not (preview and mime_type),
+                                                download_name=filename)
+        
+        # 记录下载字节数
+        DOWNLOAD_BYTES.inc(sent_bytes, kind='preview' if preview else 'file')
+        return response
         
     except Exception as e:
         logger.error(f"下载文件时出错: {str(e)}")
         return jsonify({'status': 'error', 'message': f'下载文件失败: {str(e)}'}), 500
 
+@app.route('/api/download/archive', methods=['GET'])
+def download_archive():
+    """将文件或目录边打包边下载，不生成临时文件
+
+    参数: path(可重复) format(zip/tar/tgz/tzst) method(zip的store/deflate) level
+    """
+    try:
+        paths = request.args.getlist('path')
+        format = request.args.get('format', 'zip')
+        compress = request.args.get('method', 'deflate') != 'store'
+        level = request.args.get('level', 6, type=int)
+        
+        if not paths:
+            return jsonify({'status': 'error', 'message': '缺少要下载的路径'}), 400
+        if format not in STREAM_FORMATS:
+            return jsonify({'status': 'error', 'message': f'不支持的格式: {format}'}), 400
+        level = min(max(level, 1), 19 if format == 'tzst' else 9)
+        
+        # 检查所有路径是否合法
+        for path in paths:
+            if not path.startswith('/') or '..' in path:
+                return jsonify({'status': 'error', 'message': '无效的文件路径'}), 400
+            if not os.path.exists(path):
+                return jsonify({'status': 'error', 'message': f'文件不存在: {path}'}), 404
+        
+        # 归档内路径相对于所有路径的共同父目录
+        paths = [os.path.abspath(p) for p in paths]
+        base_dir = os.path.dirname(paths[0]) if len(paths) == 1 else os.path.commonpath(paths)
+        if len(paths) > 1 and base_dir in paths:
+            base_dir = os.path.dirname(base_dir)
+        
+        ext, mimetype = STREAM_FORMATS[format]
+        name = os.path.basename(paths[0]) if len(paths) == 1 else (os.path.basename(base_dir) or 'archive')
+        download_name = f"{name}{ext}"
+        
+        def generate():
+            sent = 0
+            try:
+                for data in stream_archive(paths, base_dir, format, compress, level):
+                    if data:
+                        sent += len(data)
+                        yield data
+            finally:
+                DOWNLOAD_BYTES.inc(sent, kind='archive')
+                logger.info(f"流式打包下载结束: {download_name}, {sent} 字节")
+        
+        ascii_name = download_name.encode('ascii', 'ignore').decode('ascii').replace('"', '') or f'archive{ext}'
+        return Response(stream_with_context(generate()),
+                        mimetype=mimetype,
+                        headers={
+                            'Content-Disposition': f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(download_name)}",
+                            'Cache-Control': 'no-cache',
+                            'X-Accel-Buffering': 'no'
+                        })
+        
+    except Exception as e:
+        logger.error(f"打包下载时出错: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'打包下载失败: {str(e)}'}), 500
+
 @app.route('/api/compress', methods=['POST'])
 def compress_files():
     """压缩文件，支持多种格式"""
@@ -4142,8 +5508,9 @@ def compress_files():
         format = data.get('format', 'zip')  # 默认使用zip格式
         level = data.get('level', 6)  # 默认压缩级别
         
-        # 创建临时目录用于存放压缩文件
-        temp_dir = tempfile.mkdtemp()
+        # 清理过期的压缩结果，并创建本次压缩使用的临时目录
+        cleanup_temp_outputs()
+        temp_dir = create_temp_output_dir()
         
         # 根据格式选择文件扩展名
         if format == 'zip':
@@ -4159,7 +5526,11 @@ def compress_files():
         elif format == 'tzst':
             ext = '.tar.zst'
         else:
+            format = 'zip'
             ext = '.zip'
+        
+        # zlib压缩级别为1-9，zstd为1-22
+        level = min(max(int(level), 1), 22 if format == 'tzst' else 9)
             
         # 生成临时文件名
         temp_file = os.path.join(temp_dir, f'archive_{int(time.time())}{ext}')
@@ -4167,74 +5538,47 @@ def compress_files():
         # 检查所有路径是否合法
         for path in paths:
             if not path.startswith('/') or '..' in path:
+                shutil.rmtree(temp_dir, ignore_errors=True)
                 return jsonify({'status': 'error', 'message': '无效的文件路径'}), 400
             if not os.path.exists(path):
+                shutil.rmtree(temp_dir, ignore_errors=True)
                 return jsonify({'status': 'error', 'message': f'文件不存在: {path}'}), 404
                 
         # 获取所有文件的共同父目录
         common_path = os.path.commonpath([os.path.abspath(p) for p in paths])
+        if os.path.isfile(common_path):
+            # 只压缩单个文件时以其所在目录为基准
+            common_path = os.path.dirname(common_path)
         
-        if format == 'zip':
-            # 使用ZIP格式压缩
-            with zipfile.ZipFile(temp_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=level) as zipf:
-                for path in paths:
-                    if os.path.isfile(path):
-                        # 添加文件
-                        arcname = os.path.relpath(path, common_path)
-                        zipf.write(path, arcname)
-                    elif os.path.isdir(path):
-                        # 添加目录及其内容
-                        for root, dirs, files in os.walk(path):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                arcname = os.path.relpath(file_path, common_path)
-                                zipf.write(file_path, arcname)
-                                
-        elif format in ['tar', 'tgz', 'tbz2', 'txz']:
-            # 使用TAR格式压缩
-            mode = 'w:'
-            if format == 'tgz':
-                mode = 'w:gz'
-            elif format == 'tbz2':
-                mode = 'w:bz2'
-            elif format == 'txz':
-                mode = 'w:xz'
-                
-            with tarfile.open(temp_file, mode) as tarf:
-                for path in paths:
-                    # 添加文件或目录
-                    arcname = os.path.relpath(path, common_path)
-                    tarf.add(path, arcname=arcname)
-                    
-        elif format == 'tzst':
-            # 使用TAR+ZSTD格式压缩
-            # 首先创建tar文件
-            tar_temp = os.path.join(temp_dir, 'temp.tar')
-            with tarfile.open(tar_temp, 'w') as tarf:
-                for path in paths:
-                    arcname = os.path.relpath(path, common_path)
-                    tarf.add(path, arcname=arcname)
-            
-            # 然后用zstd压缩tar文件
-            cctx = zstd.ZstdCompressor(level=level)
-            with open(tar_temp, 'rb') as tar_data:
-                with open(temp_file, 'wb') as compressed:
-                    cctx.copy_stream(tar_data, compressed)
-            
-            # 删除临时tar文件
-            os.unlink(tar_temp)
+        def run(ctx):
+            items, total = measure_paths(paths)
+            ctx.set_total(items, total)
+            try:
+                # zip和tar.gz按块并行deflate，tar.zst直接写入多线程zstd压缩器
+                stats = compress_paths(paths, common_path, temp_file, format, level,
+                                       progress=lambda count, size: ctx.advance(items=count, bytes=size))
+            except BaseException:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                raise
+            logger.info(f"压缩完成: {temp_file}, {stats['input_bytes']} -> {stats['output_bytes']} 字节, "
+                        f"{stats['throughput_mbps']} MB/s, {stats['threads']} 线程")
+            return {'zipPath': temp_file, 'stats': stats}
+        
+        if data.get('async'):
+            return submit_file_job('compress', f'压缩 {len(paths)} 个项目到 {os.path.basename(temp_file)}', run,
+                                   {'paths': paths, 'format': format, 'level': level})
+        result = run_file_job('compress', f'压缩 {len(paths)} 个项目', run)
             
         return jsonify({
             'status': 'success',
             'message': '文件已压缩',
-            'zipPath': temp_file
+            'zipPath': result['zipPath'],
+            'stats': result['stats']
         })
         
     except Exception as e:
         logger.error(f"压缩文件时出错: {str(e)}")
         # 清理临时文件
-        if 'temp_file' in locals() and os.path.exists(temp_file):
-            os.unlink(temp_file)
         if 'temp_dir' in locals() and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
         return jsonify({'status': 'error', 'message': f'压缩文件失败: {str(e)}'}), 500
@@ -5565,13 +6909,28 @@ def get_custom_frp_status():
             'message': f"获取自建FRP状态失败: {str(e)}"
         }), 500
 
+def run_extraction_job(ctx, extraction_job):
+    """在后台任务中执行解压，转发进度和取消操作"""
+    ctx.on_cancel(extraction_job.cancel)
+    ctx.track(extraction_job.progress)
+    extraction_job.run()
+    if extraction_job.state == 'cancelled':
+        raise JobCancelled()
+    if extraction_job.state != 'completed':
+        raise RuntimeError(extraction_job.error)
+    return {'targetDir': extraction_job.target_dir, 'skipped': extraction_job.skipped}
+
 @app.route('/api/extract', methods=['POST'])
 def extract_archive():
-    """解压缩文件，支持多种格式"""
+    """解压缩文件，支持多种格式；members给出归档内的路径时只解压这些条目（目录包含其中的所有条目）
+
+    默认作为后台任务执行并返回job_id，async为false时等待解压完成后返回
+    """
     try:
         data = request.json
         file_path = data.get('path')
         target_dir = data.get('targetDir')
+        members = data.get('members') or None
         
         # 安全检查
         if not file_path or '..' in file_path or not file_path.startswith('/'):
@@ -5593,145 +6952,204 @@ def extract_archive():
         elif not os.path.isdir(target_dir):
             return jsonify({'status': 'error', 'message': '目标路径不是目录'}), 400
             
-        # 获取文件扩展名
-        file_ext = os.path.splitext(file_path)[1].lower()
-        file_name = os.path.basename(file_path)
-        
-        # 特别处理.tar.gz、.tar.xz和.tar.zst格式
-        if file_path.endswith('.tar.gz') or file_path.endswith('.tar.xz') or file_path.endswith('.tar.zst'):
-            if file_path.endswith('.tar.gz'):
-                mode = 'r:gz'
-            elif file_path.endswith('.tar.xz'):
-                mode = 'r:xz'
-            elif file_path.endswith('.tar.zst'):
-                # 对于tar.zst，我们需要先解压zst，然后再解压tar
-                with open(file_path, 'rb') as compressed:
-                    dctx = zstd.ZstdDecompressor()
-                    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                        dctx.copy_stream(compressed, tmp)
-                        tmp_path = tmp.name
-                
-                try:
-                    with tarfile.open(tmp_path, 'r:') as tarf:
-                        tarf.extractall(target_dir)
-                finally:
-                    os.unlink(tmp_path)
-                return jsonify({
-                    'status': 'success',
-                    'message': '文件已解压',
-                    'targetDir': target_dir
-                })
-                
-            with tarfile.open(file_path, mode) as tarf:
-                tarf.extractall(target_dir)
-            return jsonify({
-                'status': 'success',
-                'message': '文件已解压',
-                'targetDir': target_dir
-            })
-            
-        # 根据文件扩展名选择解压方法
-        if file_ext in ['.zip', '.jar', '.apk']:
-            # 处理ZIP文件
-            with zipfile.ZipFile(file_path, 'r') as zipf:
-                zipf.extractall(target_dir)
-                
-        elif file_ext in ['.tar']:
-            # 处理TAR文件
-            with tarfile.open(file_path, 'r') as tarf:
-                tarf.extractall(target_dir)
-                
-        elif file_ext in ['.gz', '.tgz']:
-            # 处理TAR.GZ文件
-            if file_ext == '.tgz' or file_path.endswith('.tar.gz'):
-                with tarfile.open(file_path, 'r:gz') as tarf:
-                    tarf.extractall(target_dir)
-            else:
-                # 处理单个gzip文件
-                with gzip.open(file_path, 'rb') as f_in:
-                    # 提取不带.gz扩展名的原始文件名
-                    output_file = os.path.join(target_dir, os.path.splitext(file_name)[0])
-                    with open(output_file, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                        
-        elif file_ext in ['.bz2']:
-            # 处理TAR.BZ2或单个BZ2文件
-            if file_path.endswith('.tar.bz2'):
-                with tarfile.open(file_path, 'r:bz2') as tarf:
-                    tarf.extractall(target_dir)
-            else:
-                # 处理单个bzip2文件
-                with bz2.open(file_path, 'rb') as f_in:
-                    # 提取不带.bz2扩展名的原始文件名
-                    output_file = os.path.join(target_dir, os.path.splitext(file_name)[0])
-                    with open(output_file, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                        
-        elif file_ext in ['.xz']:
-            # 处理.xz文件
-            if file_path.endswith('.tar.xz'):
-                with tarfile.open(file_path, 'r:xz') as tarf:
-                    tarf.extractall(target_dir)
-            else:
-                # 处理单个xz文件
-                with lzma.open(file_path, 'rb') as f_in:
-                    # 提取不带.xz扩展名的原始文件名
-                    output_file = os.path.join(target_dir, os.path.splitext(file_name)[0])
-                    with open(output_file, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                        
-        elif file_ext in ['.zst']:
-            # 处理.zst文件
-            with open(file_path, 'rb') as compressed:
-                dctx = zstd.ZstdDecompressor()
-                # 提取不带.zst扩展名的原始文件名
-                output_file = os.path.join(target_dir, os.path.splitext(file_name)[0])
-                with open(output_file, 'wb') as f_out:
-                    dctx.copy_stream(compressed, f_out)
-                        
-        elif file_ext in ['.rar']:
-            # 处理RAR文件，需要安装python-rarfile库
-            try:
-                with rarfile.RarFile(file_path) as rf:
-                    rf.extractall(target_dir)
-            except ImportError:
-                # 如果没有安装rarfile库，尝试使用unrar命令
-                try:
-                    subprocess.run(['unrar', 'x', file_path, target_dir], check=True)
-                except (subprocess.SubprocessError, FileNotFoundError):
-                    return jsonify({
-                        'status': 'error', 
-                        'message': '解压RAR文件失败，系统未安装rarfile模块或unrar命令'
-                    }), 500
-                    
-        elif file_ext in ['.7z']:
-            # 处理7z文件，需要系统安装p7zip
-            try:
-                subprocess.run(['7z', 'x', file_path, '-o' + target_dir], check=True)
-            except (subprocess.SubprocessError, FileNotFoundError):
-                return jsonify({
-                    'status': 'error', 
-                    'message': '解压7Z文件失败，系统未安装7z命令'
-                }), 500
-                
-        else:
+        kind, file_ext = detect_format(file_path)
+        if kind is None:
             return jsonify({
                 'status': 'error', 
                 'message': f'不支持的文件格式: {file_ext}'
             }), 400
-            
-        logger.info(f"文件已解压: {file_path} -> {target_dir}")
-        
+
+        index = None
+        if members:
+            if not isinstance(members, list) or not all(isinstance(member, str) for member in members):
+                return jsonify({'status': 'error', 'message': 'members必须是路径列表'}), 400
+            # 已建立的索引用于直接定位条目（未压缩的tar）或在找到所有条目后提前结束；未压缩的tar建索引很快
+            index = archive_browser.get_index(file_path, build=(kind == 'tar' and not file_ext))
+            if index is not None:
+                missing = [member for member in members if normalize_member(member) not in index.by_path]
+                if missing:
+                    return jsonify({'status': 'error', 'message': f'归档中不存在: {", ".join(missing[:10])}'}), 404
+
+        job = extraction_manager.create(file_path, target_dir, members=members, index=index)
+        title = f'解压 {os.path.basename(file_path)}'
+        params = {'path': file_path, 'targetDir': target_dir}
+        if wants_background_job(data):
+            # 后台解压，任务ID与解压任务ID相同，两组接口都可以查询进度
+            username = g.user.get('username') if hasattr(g, 'user') else None
+            job_manager.submit('extract', title, lambda ctx: run_extraction_job(ctx, job), params, username,
+                               job_id=job.id)
+            return jsonify({
+                'status': 'success',
+                'message': '解压任务已开始',
+                'job_id': job.id,
+                'targetDir': target_dir
+            })
+
+        try:
+            run_file_job('extract', title, lambda ctx: run_extraction_job(ctx, job), params, job_id=job.id)
+        except (JobCancelled, RuntimeError):
+            message = '解压已取消' if job.state == 'cancelled' else f'解压文件失败: {job.error}'
+            return jsonify({'status': 'error', 'message': message, 'job': job.to_dict()}), 500
+
         return jsonify({
             'status': 'success',
             'message': '文件已解压',
-            'targetDir': target_dir
+            'targetDir': target_dir,
+            'job': job.to_dict()
         })
         
     except Exception as e:
         logger.error(f"解压文件时出错: {str(e)}")
         return jsonify({'status': 'error', 'message': f'解压文件失败: {str(e)}'}), 500
 
+@app.route('/api/extract/jobs/<job_id>', methods=['GET'])
+def get_extract_job(job_id):
+    """查询解压任务进度"""
+    job = extraction_manager.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': '解压任务不存在'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+@app.route('/api/extract/jobs/<job_id>/stream', methods=['GET'])
+def stream_extract_job(job_id):
+    """以SSE推送解压任务进度，任务结束后关闭（认证使用 ?token= 参数）"""
+    job = extraction_manager.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': '解压任务不存在'}), 404
+    
+    def generate():
+        while True:
+            event = job.to_dict()
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if event['state'] in ('completed', 'failed', 'cancelled'):
+                break
+            time.sleep(0.5)
+    
+    return Response(stream_with_context(track_sse_client('extract', generate())),
+                   mimetype='text/event-stream',
+                   headers={
+                       'Cache-Control': 'no-cache',
+                       'X-Accel-Buffering': 'no'
+                   })
+
+@app.route('/api/extract/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_extract_job(job_id):
+    """取消解压任务，已写出的文件保留在目标目录中"""
+    job = extraction_manager.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': '解压任务不存在'}), 404
+    job.cancel()
+    job_manager.cancel(job_id)
+    logger.info(f"已请求取消解压任务: {job_id}")
+    return jsonify({'status': 'success', 'message': '已请求取消解压任务'})
+
+@app.route('/api/archive/list', methods=['GET'])
+def list_archive():
+    """不解压列出归档内容，dir为归档内的目录（默认为根目录），recursive=true时返回该目录下的所有条目"""
+    try:
+        file_path = request.args.get('path')
+        directory = request.args.get('dir', '')
+        recursive = request.args.get('recursive', 'false').lower() == 'true'
+
+        if not file_path or '..' in file_path or not file_path.startswith('/'):
+            return jsonify({'status': 'error', 'message': '无效的文件路径'}), 400
+        if not os.path.isfile(file_path):
+            return jsonify({'status': 'error', 'message': '文件不存在'}), 404
+        if detect_format(file_path)[0] is None:
+            return jsonify({'status': 'error', 'message': '不支持的归档格式'}), 400
+
+        try:
+            index, items = archive_browser.list(file_path, directory, recursive)
+        except KeyError:
+            return jsonify({'status': 'error', 'message': f'归档中不存在目录: {directory}'}), 404
+        return jsonify({
+            'status': 'success',
+            'path': file_path,
+            'dir': normalize_member(directory),
+            'files': items,
+            'archive': index.summary()
+        })
+    except Exception as e:
+        logger.error(f"读取归档内容失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'读取归档内容失败: {str(e)}'}), 500
+
+@app.route('/api/archive/preview', methods=['GET'])
+def preview_archive_member():
+    """预览归档中的单个文件；raw=true时直接返回文件内容（用于图片预览或下载单个文件）"""
+    try:
+        file_path = request.args.get('path')
+        member = request.args.get('member', '')
+        raw = request.args.get('raw', 'false').lower() == 'true'
+        encoding = request.args.get('encoding', 'utf-8')
+        max_bytes = min(request.args.get('max_bytes', 256 * 1024, type=int), 1024 * 1024)
+
+        if not file_path or '..' in file_path or not file_path.startswith('/'):
+            return jsonify({'status': 'error', 'message': '无效的文件路径'}), 400
+        if not os.path.isfile(file_path):
+            return jsonify({'status': 'error', 'message': '文件不存在'}), 404
+        if not member:
+            return jsonify({'status': 'error', 'message': '缺少归档内的文件路径'}), 400
+
+        if raw:
+            entry, chunks = archive_browser.iter_member(file_path, member)
+            name = entry['path'].rsplit('/', 1)[-1]
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            headers = {'Content-Disposition': f"inline; filename*=UTF-8''{quote(name)}"}
+            if entry['size'] is not None:
+                headers['Content-Length'] = str(entry['size'])
+            return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+        entry, content, truncated = archive_browser.read_member(file_path, member, max_bytes)
+        # 开头包含NUL字节的视为二进制文件
+        binary = b'\x00' in content[:8192]
+        return jsonify({
+            'status': 'success',
+            'member': entry['path'],
+            'size': entry['size'],
+            'modified': entry['mtime'],
+            'binary': binary,
+            'content': None if binary else content.decode(encoding, errors='replace'),
+            'encoding': encoding,
+            'truncated': truncated
+        })
+    except KeyError:
+        return jsonify({'status': 'error', 'message': '归档中不存在该文件'}), 404
+    except LookupError:
+        return jsonify({'status': 'error', 'message': f'不支持的编码: {encoding}'}), 400
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"预览归档文件失败: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'预览归档文件失败: {str(e)}'}), 500
+
+@app.route('/api/extract/upload', methods=['POST'])
+def extract_upload():
+    """上传tar归档并在接收的同时解压到targetDir，请求体直接是归档内容，参数放在查询字符串中（targetDir、filename、job_id）"""
+    finish_request_body()
+    try:
+        target_dir = request.args.get('targetDir')
+        filename = secure_filename(request.args.get('filename', ''))
+        
+        if not target_dir or '..' in target_dir or not target_dir.startswith('/'):
+            return jsonify({'status': 'error', 'message': '无效的目标目录'}), 400
+        if os.path.exists(target_dir) and not os.path.isdir(target_dir):
+            return jsonify({'status': 'error', 'message': '目标路径不是目录'}), 400
+        if detect_format(filename)[0] != 'tar':
+            return jsonify({'status': 'error', 'message': '边上传边解压只支持 .tar, .tar.gz, .tar.bz2, .tar.xz, .tar.zst 格式'}), 400
+        
+        try:
+            job = extract_request_body(filename, target_dir)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        if job.state != 'completed':
+            message = '解压已取消' if job.state == 'cancelled' else f'解压文件失败: {job.error}'
+            return jsonify({'status': 'error', 'message': message, 'job': job.to_dict()}), 500
+        
+        return jsonify({'status': 'success', 'message': '文件已解压', 'targetDir': target_dir, 'job': job.to_dict()})
+    except Exception as e:
+        logger.error(f"边上传边解压时出错: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'解压文件失败: {str(e)}'}), 500
+
 @app.route('/api/chmod', methods=['POST'])
 def change_permissions():
     """修改文件或目录的权限"""
@@ -5755,17 +7173,7 @@ def change_permissions():
             except ValueError:
                 return jsonify({'status': 'error', 'message': '无效的权限值'}), 400
 
-        if recursive and os.path.isdir(path):
-            # 递归修改目录及其内容的权限
-            for root, dirs, files in os.walk(path):
-                # 修改目录权限
-                os.chmod(root, mode)
-                # 修改文件权限
-                for file in files:
-                    os.chmod(os.path.join(root, file), mode)
-        else:
-            # 仅修改当前文件或目录的权限
-            os.chmod(path, mode)
+        chmod_path(path, mode, recursive)
             
         # 获取更新后的权限
         current_mode = stat.S_IMODE(os.stat(path).st_mode)
@@ -6015,41 +7423,47 @@ def get_network_info():
             'message': str(e)
         }), 500
 
+def get_server_root_pids():
+    """返回正在运行的游戏服务器根进程，供进程浏览器按服务器分组"""
+    roots = {}
+    for game_id, server_data in list(running_servers.items()):
+        process = server_data.get('process')
+        if process and process.poll() is None:
+            roots[game_id] = process.pid
+    return roots
+
+process_explorer.set_server_resolver(get_server_root_pids)
+
 @app.route('/api/system_processes', methods=['GET'])
 @auth_required
 def get_system_processes():
-    """获取当前运行的所有进程信息"""
+    """获取当前运行的所有进程信息
+
+    参数: sort(排序字段) order(asc/desc) search(按名称/命令行/PID过滤) server(游戏服务器ID)
+    username page page_size(不传则返回全部) group(为server时附带按游戏服务器汇总)
+    """
     try:
-        processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent', 'create_time', 'cmdline']):
-            try:
-                proc_info = proc.info
-                # 过滤掉一些系统进程和权限不足的进程
-                if proc_info['name'] and proc_info['pid'] > 1:
-                    # 获取命令行参数，限制长度
-                    cmdline = ' '.join(proc_info['cmdline'] or [])[:100]
-                    if len(cmdline) > 100:
-                        cmdline += '...'
-                    
-                    processes.append({
-                        'pid': proc_info['pid'],
-                        'name': proc_info['name'],
-                        'username': proc_info['username'] or 'unknown',
-                        'cpu_percent': round(proc_info['cpu_percent'] or 0, 2),
-                        'memory_percent': round(proc_info['memory_percent'] or 0, 2),
-                        'create_time': proc_info['create_time'],
-                        'cmdline': cmdline
-                    })
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                continue
+        result = process_explorer.query(
+            sort=request.args.get('sort', 'cpu_percent'),
+            order=request.args.get('order', 'desc'),
+            search=request.args.get('search') or None,
+            server=request.args.get('server') or None,
+            username=request.args.get('username') or None,
+            page=request.args.get('page', 1, type=int),
+            page_size=min(request.args.get('page_size', 0, type=int), 1000),
+            group_by_server=request.args.get('group') == 'server'
+        )
         
-        # 按CPU使用率排序
-        processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
+        # 限制命令行长度
+        processes = []
+        for proc_info in result['processes']:
+            proc_info = dict(proc_info)
+            if len(proc_info['cmdline']) > 100:
+                proc_info['cmdline'] = proc_info['cmdline'][:100] + '...'
+            processes.append(proc_info)
+        result['processes'] = processes
         
-        return jsonify({
-            'status': 'success',
-            'processes': processes
-        })
+        return jsonify(dict(result, status='success'))
         
     except Exception as e:
         logger.error(f"获取进程信息失败: {str(e)}")
@@ -6063,90 +7477,11 @@ def get_system_processes():
 def get_system_ports():
     """获取当前活跃的端口和对应的进程信息"""
     try:
-        ports = []
-        port_set = set()  # 用于去重
-        
-        # 获取所有网络连接（包括IPv4和IPv6）
-        try:
-            connections = psutil.net_connections(kind='inet')
-        except psutil.AccessDenied:
-            # 如果权限不足，尝试只获取当前进程的连接
-            connections = psutil.net_connections(kind='inet', perproc=False)
-        
-        for conn in connections:
-            try:
-                port_info = None
-                
-                # 处理监听端口（服务器端口）
-                if conn.status == psutil.CONN_LISTEN and conn.laddr:
-                    port_key = (conn.laddr.port, conn.laddr.ip, 'LISTEN')
-                    if port_key not in port_set:
-                        port_set.add(port_key)
-                        port_info = {
-                            'port': conn.laddr.port,
-                            'address': conn.laddr.ip,
-                            'family': 'IPv4' if conn.family == socket.AF_INET else 'IPv6',
-                            'type': 'TCP' if conn.type == socket.SOCK_STREAM else 'UDP',
-                            'status': 'LISTEN',
-                            'pid': conn.pid,
-                            'process_name': None,
-                            'process_cmdline': None
-                        }
-                
-                # 处理已建立的连接（显示本地端口）
-                elif conn.status == psutil.CONN_ESTABLISHED and conn.laddr:
-                    port_key = (conn.laddr.port, conn.laddr.ip, 'ESTABLISHED')
-                    if port_key not in port_set:
-                        port_set.add(port_key)
-                        remote_info = f"{conn.raddr.ip}:{conn.raddr.port}" if conn.raddr else "Unknown"
-                        port_info = {
-                            'port': conn.laddr.port,
-                            'address': conn.laddr.ip,
-                            'family': 'IPv4' if conn.family == socket.AF_INET else 'IPv6',
-                            'type': 'TCP' if conn.type == socket.SOCK_STREAM else 'UDP',
-                            'status': f'ESTABLISHED -> {remote_info}',
-                            'pid': conn.pid,
-                            'process_name': None,
-                            'process_cmdline': None
-                        }
-                
-                # 处理UDP连接（通常没有状态）
-                elif conn.type == socket.SOCK_DGRAM and conn.laddr:
-                    port_key = (conn.laddr.port, conn.laddr.ip, 'UDP')
-                    if port_key not in port_set:
-                        port_set.add(port_key)
-                        port_info = {
-                            'port': conn.laddr.port,
-                            'address': conn.laddr.ip,
-                            'family': 'IPv4' if conn.family == socket.AF_INET else 'IPv6',
-                            'type': 'UDP',
-                            'status': 'ACTIVE',
-                            'pid': conn.pid,
-                            'process_name': None,
-                            'process_cmdline': None
-                        }
-                
-                # 获取进程信息
-                if port_info and conn.pid:
-                    try:
-                        proc = psutil.Process(conn.pid)
-                        port_info['process_name'] = proc.name()
-                        cmdline = ' '.join(proc.cmdline()[:3])  # 只取前3个参数
-                        if len(cmdline) > 80:
-                            cmdline = cmdline[:80] + '...'
-                        port_info['process_cmdline'] = cmdline
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        port_info['process_name'] = 'Unknown'
-                        port_info['process_cmdline'] = 'Access Denied'
-                
-                if port_info:
-                    ports.append(port_info)
-                    
-            except Exception:
-                continue
+        ports = process_explorer.list_ports()
         
-        # 按端口号排序
-        ports.sort(key=lambda x: x['port'])
+        server = request.args.get('server')
+        if server:
+            ports = [port for port in ports if port['server'] == server]
         
         return jsonify({
             'status': 'success',
@@ -6584,7 +7919,7 @@ def online_deploy_stream():
                     yield f"data: {json.dumps({'error': str(e), 'complete': True})}\n\n"
                     break
         
-        return Response(stream_with_context(generate()),
+        return Response(stream_with_context(track_sse_client('online_deploy', generate())),
                        mimetype='text/event-stream',
                        headers={
                            'Cache-Control': 'no-cache',
@@ -7285,6 +8620,7 @@ def restart_server(game_id, cwd):
     """重启游戏服务器"""
     try:
         logger.info(f"准备重启游戏服务器 {game_id}")
+        SERVER_RESTARTS.inc(server=game_id)
         
         # 确保服务器不在人工停止列表中
         if game_id in manually_stopped_servers:
@@ -8266,7 +9602,9 @@ def run_backup_now(task_id):
             os.path.basename(task['directory'])
         ]
         
+        backup_started_at = time.time()
         result = subprocess.run(tar_cmd, capture_output=True, text=True)
+        record_backup_metrics(task['name'], backup_started_at, backup_filepath, result.returncode == 0)
         
         if result.returncode == 0:
             # 备份成功，更新任务状态
@@ -8301,6 +9639,16 @@ def run_backup_now(task_id):
             "message": str(e)
         }), 500
 
+def record_backup_metrics(task_name, started_at, backup_filepath, success):
+    """记录备份耗时和大小指标"""
+    BACKUP_DURATION.observe(time.time() - started_at, task=task_name)
+    BACKUPS_TOTAL.inc(task=task_name, result='success' if success else 'failure')
+    if success:
+        try:
+            BACKUP_SIZE_BYTES.set(os.path.getsize(backup_filepath), task=task_name)
+        except OSError:
+            pass
+
 def cleanup_old_backups(backup_dir, keep_count):
     """清理旧的备份文件，只保留指定数量的最新备份"""
     try:
@@ -8406,7 +9754,9 @@ def execute_backup_task(task_id, task):
             os.path.basename(task['directory'])
         ]
         
+        backup_started_at = time.time()
         result = subprocess.run(tar_cmd, capture_output=True, text=True)
+        record_backup_metrics(task['name'], backup_started_at, backup_filepath, result.returncode == 0)
         
         if result.returncode == 0:
             # 备份成功，更新任务状态
@@ -9039,7 +10389,7 @@ def modpack_deploy_stream():
                 pass
     
     try:
-        return Response(generate(deployment_id), mimetype='text/event-stream')
+        return Response(track_sse_client('modpack_deploy', generate(deployment_id)), mimetype='text/event-stream')
     except Exception as e:
         logger.error(f"整合包部署流处理错误: {str(e)}")
         return jsonify({'error': f'流处理错误: {str(e)}'}), 500
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+归档浏览模块
+不解压即可列出归档内容：zip读取中央目录，tar扫描成员头（未压缩的tar记录每个成员的偏移，之后可直接定位），
+rar读取文件头，7z解析 `7z l -slt` 的输出；索引按路径缓存并以mtime和大小判断是否失效。
+还可以读取单个条目的内容用于预览或下载
+"""
+
+import os
+import time
+import logging
+import tarfile
+import zipfile
+import threading
+import subprocess
+from collections import OrderedDict
+
+import rarfile
+import zstandard as zstd
+
+from archive_extract import detect_format, normalize_member, SINGLE_FILE_SUFFIXES
+
+logger = logging.getLogger("archive_browser")
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class ArchiveIndex:
+    """一个归档的条目索引"""
+
+    def __init__(self, path, st, kind, compression):
+        self.path = path
+        self.dev = st.st_dev
+        self.ino = st.st_ino
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.kind = kind
+        self.compression = compression
+        # 未压缩的tar可以按偏移直接读取成员
+        self.seekable = kind == 'tar' and not compression
+        self.entries = []
+        self.by_path = {}
+        self.children = {}
+        self.built_in = 0
+
+    def add(self, member, entry_type, size=0, mtime=None, mode=None, link=None, offset=None, compressed_size=None):
+        path = normalize_member(member)
+        if not path:
+            return
+        entry = {
+            'path': path,
+            'member': member,
+            'type': entry_type,
+            'size': size,
+            'compressed_size': compressed_size,
+            'mtime': mtime,
+            'mode': mode,
+            'link': link,
+            'offset': offset
+        }
+        if path in self.by_path:
+            # 同名条目以后出现的为准（与解压结果一致）
+            self.entries.remove(self.by_path[path])
+        self.entries.append(entry)
+        self.by_path[path] = entry
+
+    def finish(self):
+        """建立目录层级，归档中没有单独记录的上级目录也补上"""
+        # 目录 -> 子条目路径（用dict保持顺序并去重）
+        self.children = {'': {}}
+        for entry in self.entries:
+            parts = entry['path'].split('/')
+            for depth in range(1, len(parts)):
+                directory = '/'.join(parts[:depth])
+                if directory not in self.children:
+                    self.children[directory] = {}
+                    self.children['/'.join(parts[:depth - 1])][directory] = None
+                    if directory not in self.by_path:
+                        self.by_path[directory] = {'path': directory, 'member': None, 'type': 'directory', 'size': 0,
+                                                   'compressed_size': None, 'mtime': None, 'mode': None,
+                                                   'link': None, 'offset': None}
+            if entry['type'] == 'directory':
+                self.children.setdefault(entry['path'], {})
+            self.children.setdefault('/'.join(parts[:-1]), {})[entry['path']] = None
+
+    def summary(self):
+        return {
+            'format': self.kind,
+            'compression': self.compression,
+            'entries': len(self.entries),
+            'files': sum(1 for entry in self.entries if entry['type'] == 'file'),
+            'total_size': sum(entry['size'] or 0 for entry in self.entries if entry['type'] == 'file'),
+            'archive_size': self.size,
+            'seekable': self.seekable or self.kind in ('zip', 'rar'),
+            'index_time': self.built_in
+        }
+
+
+def _describe(entry, directory_counts=None):
+    """转换为文件列表接口的条目格式"""
+    item = {
+        'name': entry['path'].rsplit('/', 1)[-1],
+        'path': entry['path'],
+        'type': entry['type'],
+        'size': entry['size'],
+        'modified': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['mtime'])) if entry['mtime'] else None
+    }
+    if entry['compressed_size'] is not None:
+        item['compressed_size'] = entry['compressed_size']
+    if entry['link']:
+        item['link'] = entry['link']
+    if directory_counts is not None and entry['type'] == 'directory':
+        item['children'] = directory_counts.get(entry['path'], 0)
+    return item
+
+
+class ArchiveBrowser:
+    """归档浏览器，缓存最近使用归档的条目索引"""
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_index(self, path, build=True):
+        """获取归档的条目索引；build为False时只返回仍然有效的缓存"""
+        st = os.stat(path)
+        with self._lock:
+            index = self._cache.get(path)
+            if index is not None:
+                if (index.dev, index.ino, index.size, index.mtime_ns) == (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns):
+                    self._cache.move_to_end(path)
+                    return index
+                del self._cache[path]
+        if not build:
+            return None
+
+        kind, detail = detect_format(path)
+        if kind is None:
+            raise ValueError(f'不支持的文件格式: {detail}')
+        index = ArchiveIndex(path, st, kind, detail if kind == 'tar' else None)
+        started = time.time()
+        getattr(self, f'_index_{kind}')(index, detail)
+        index.finish()
+        index.built_in = round(time.time() - started, 3)
+        if index.built_in > 1:
+            logger.info(f"建立归档索引 {path}: {len(index.entries)} 个条目, 用时 {index.built_in} 秒")
+
+        with self._lock:
+            self._cache[path] = index
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return index
+
+    @staticmethod
+    def _open_tar_stream(path, compression):
+        """打开顺序读取的tar流，返回 (原始文件, TarFile)"""
+        raw = open(path, 'rb')
+        try:
+            if compression == 'zst':
+                stream = zstd.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+                return raw, tarfile.open(fileobj=stream, mode='r|')
+            return raw, tarfile.open(fileobj=raw, mode=f'r|{compression}' if compression else 'r|')
+        except Exception:
+            raw.close()
+            raise
+
+    def _index_tar(self, index, compression):
+        if compression:
+            # 压缩的tar只能完整解压一遍读取成员头
+            raw, tar = self._open_tar_stream(index.path, compression)
+        else:
+            # 未压缩时tarfile读取成员头后直接跳过数据
+            raw, tar = None, tarfile.open(index.path, mode='r:')
+        try:
+            for member in tar:
+                if member.isdir():
+                    entry_type = 'directory'
+                elif member.issym():
+                    entry_type = 'symlink'
+                elif member.islnk():
+                    entry_type = 'hardlink'
+                elif member.isreg():
+                    entry_type = 'file'
+                else:
+                    entry_type = 'other'
+                index.add(member.name, entry_type, member.size if member.isreg() else 0, member.mtime, member.mode,
+                          member.linkname or None, member.offset if index.seekable else None)
+                # 流式读取时tarfile会保留所有成员，索引已经记录了需要的信息
+                tar.members = []
+        finally:
+            tar.close()
+            if raw:
+                raw.close()
+
+    def _index_zip(self, index, detail):
+        with zipfile.ZipFile(index.path) as zf:
+            for info in zf.infolist():
+                mode = (info.external_attr >> 16) & 0o177777
+                if info.is_dir():
+                    entry_type = 'directory'
+                elif mode & 0o170000 == 0o120000:
+                    entry_type = 'symlink'
+                else:
+                    entry_type = 'file'
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                index.add(info.filename, entry_type, info.file_size if entry_type == 'file' else 0, mtime,
+                          mode & 0o7777 or None, compressed_size=info.compress_size)
+
+    def _index_rar(self, index, detail):
+        with rarfile.RarFile(index.path) as rf:
+            for info in rf.infolist():
+                if info.is_dir():
+                    entry_type = 'directory'
+                elif info.is_symlink():
+                    entry_type = 'symlink'
+                else:
+                    entry_type = 'file'
+                mtime = info.mtime.timestamp() if getattr(info, 'mtime', None) else time.mktime(info.date_time + (0, 0, -1))
+                index.add(info.filename, entry_type, info.file_size if entry_type == 'file' else 0, mtime,
+                          compressed_size=info.compress_size)
+
+    def _index_7z(self, index, detail):
+        try:
+            result = subprocess.run(['7z', 'l', '-slt', '--', index.path], capture_output=True, timeout=600)
+        except FileNotFoundError:
+            raise RuntimeError('读取7Z文件失败，系统未安装7z命令')
+        if result.returncode != 0:
+            raise RuntimeError(f"7z读取失败: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        # 条目列表在分隔线之后，每个条目是一段 "键 = 值"，以空行分隔
+        output = result.stdout.decode('utf-8', errors='replace')
+        _, _, listing = output.partition('\n----------\n')
+        for block in listing.split('\n\n'):
+            fields = {}
+            for line in block.splitlines():
+                key, sep, value = line.partition(' = ')
+                if sep:
+                    fields[key.strip()] = value.strip()
+            if 'Path' not in fields:
+                continue
+            is_dir = fields.get('Folder') == '+' or fields.get('Attributes', '').startswith('D')
+            mtime = None
+            if fields.get('Modified'):
+                try:
+                    mtime = time.mktime(time.strptime(fields['Modified'][:19], '%Y-%m-%d %H:%M:%S'))
+                except ValueError:
+                    pass
+            packed = fields.get('Packed Size')
+            index.add(fields['Path'], 'directory' if is_dir else 'file',
+                      0 if is_dir else int(fields.get('Size') or 0), mtime,
+                      compressed_size=int(packed) if packed and packed.isdigit() else None)
+
+    def _index_single(self, index, ext):
+        st = os.stat(index.path)
+        name = os.path.splitext(os.path.basename(index.path))[0]
+        index.add(name, 'file', None, st.st_mtime)
+
+    def list(self, path, directory='', recursive=False):
+        """列出归档中某个目录下的条目；recursive为True时返回该目录下的所有条目"""
+        index = self.get_index(path)
+        directory = normalize_member(directory)
+        if directory and directory not in index.children:
+            raise KeyError(directory)
+        counts = {key: len(value) for key, value in index.children.items()}
+        if recursive:
+            prefix = directory + '/' if directory else ''
+            entries = [entry for entry in index.entries if entry['path'].startswith(prefix)]
+            items = [_describe(entry) for entry in sorted(entries, key=lambda entry: entry['path'])]
+        else:
+            items = [_describe(index.by_path[child], counts) for child in index.children[directory]]
+            items.sort(key=lambda item: (0 if item['type'] == 'directory' else 1, item['name']))
+        return index, items
+
+    def iter_member(self, path, member, chunk_size=READ_CHUNK_SIZE):
+        """逐块读取一个条目的内容；生成器被关闭时释放归档"""
+        index = self.get_index(path)
+        entry = index.by_path.get(normalize_member(member))
+        if entry is None:
+            raise KeyError(member)
+        # 硬链接读取其源文件
+        seen = set()
+        while entry['type'] == 'hardlink' and entry['path'] not in seen:
+            seen.add(entry['path'])
+            target = index.by_path.get(normalize_member(entry['link'] or ''))
+            if target is None:
+                raise KeyError(entry['link'])
+            entry = target
+        if entry['type'] != 'file':
+            raise ValueError('只能读取普通文件的内容')
+        return entry, self._iter_entry(index, entry, chunk_size)
+
+    def _iter_entry(self, index, entry, chunk_size):
+        if index.kind == 'zip':
+            with zipfile.ZipFile(index.path) as zf, zf.open(entry['member']) as src:
+                yield from iter(lambda: src.read(chunk_size), b'')
+        elif index.kind == 'rar':
+            with rarfile.RarFile(index.path) as rf, rf.open(entry['member']) as src:
+                yield from iter(lambda: src.read(chunk_size), b'')
+        elif index.kind == 'tar' and index.seekable:
+            with open(index.path, 'rb') as raw, tarfile.open(fileobj=raw, mode='r:') as tar:
+                raw.seek(entry['offset'])
+                src = tar.extractfile(tarfile.TarInfo.fromtarfile(tar))
+                yield from iter(lambda: src.read(chunk_size), b'')
+        elif index.kind == 'tar':
+            # 压缩的tar需要从头解压到该条目
+            raw, tar = self._open_tar_stream(index.path, index.compression)
+            try:
+                for member in tar:
+                    tar.members = []
+                    if normalize_member(member.name) == entry['path'] and member.isreg():
+                        src = tar.extractfile(member)
+                        yield from iter(lambda: src.read(chunk_size), b'')
+                        return
+                raise KeyError(entry['path'])
+            finally:
+                tar.close()
+                raw.close()
+        elif index.kind == 'single':
+            with open(index.path, 'rb') as raw:
+                if index.path.lower().endswith('.zst'):
+                    src = zstd.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+                else:
+                    src = SINGLE_FILE_SUFFIXES[os.path.splitext(index.path)[1].lower()](raw, 'rb')
+                with src:
+                    yield from iter(lambda: src.read(chunk_size), b'')
+        elif index.kind == '7z':
+            try:
+                process = subprocess.Popen(['7z', 'e', '-so', '--', index.path, entry['member']],
+                                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            except FileNotFoundError:
+                raise RuntimeError('读取7Z文件失败，系统未安装7z命令')
+            try:
+                yield from iter(lambda: process.stdout.read(chunk_size), b'')
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+
+    def read_member(self, path, member, max_bytes):
+        """读取条目开头最多max_bytes字节，返回 (条目, 内容, 是否被截断)"""
+        entry, chunks = self.iter_member(path, member)
+        data = bytearray()
+        truncated = False
+        try:
+            for chunk in chunks:
+                data += chunk
+                if len(data) > max_bytes:
+                    truncated = True
+                    del data[max_bytes:]
+                    break
+        finally:
+            chunks.close()
+        return entry, bytes(data), truncated
+
+
+# 创建全局归档浏览器实例
+archive_browser = ArchiveBrowser()
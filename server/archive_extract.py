@@ -0,0 +1,646 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式解压模块
+- tar系列：解压缩流直接交给tarfile流式读取，不再生成中间tar文件
+- zip：由小型线程池并行解压各条目
+- 单文件压缩（.gz/.bz2/.xz/.zst）、rar 逐块写出；7z 调用命令行并解析进度
+逐条目检查路径穿越和符号链接，支持进度查询与取消；可以只解压选中的条目；
+tar系列还可以直接读取上传中的请求体，边上传边解压
+"""
+
+import os
+import bz2
+import gzip
+import lzma
+import time
+import uuid
+import logging
+import tarfile
+import zipfile
+import threading
+import subprocess
+import concurrent.futures
+import re
+import contextlib
+import rarfile
+import zstandard as zstd
+
+logger = logging.getLogger("archive_extract")
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# 已结束任务的保留时间（秒）
+FINISHED_JOB_TTL = 3600
+
+TAR_SUFFIXES = {
+    '.tar': '', '.tar.gz': 'gz', '.tgz': 'gz', '.tar.bz2': 'bz2', '.tbz2': 'bz2',
+    '.tar.xz': 'xz', '.txz': 'xz', '.tar.zst': 'zst', '.tzst': 'zst'
+}
+SINGLE_FILE_SUFFIXES = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+
+def detect_format(path):
+    """根据文件名判断归档类型，返回 (类型, 参数)，不支持时类型为None"""
+    name = os.path.basename(path).lower()
+    for suffix in sorted(TAR_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return 'tar', TAR_SUFFIXES[suffix]
+    ext = os.path.splitext(name)[1]
+    if ext in ('.zip', '.jar', '.apk'):
+        return 'zip', ext
+    if ext in SINGLE_FILE_SUFFIXES or ext == '.zst':
+        return 'single', ext
+    if ext in ('.rar', '.7z'):
+        return ext[1:], ext
+    return None, ext
+
+
+def normalize_member(name):
+    """统一归档条目名称：使用/分隔，去掉开头的./和末尾的/"""
+    name = name.replace('\\', '/')
+    while name.startswith('./'):
+        name = name[2:]
+    name = name.rstrip('/')
+    return '' if name == '.' else name
+
+
+def member_selector(members):
+    """返回判断条目是否被选中的函数，选中目录时包含目录中的所有条目；未选择时返回None"""
+    selected = {normalize_member(member) for member in members or ()} - {''}
+    if not selected:
+        return None
+
+    def match(name):
+        parts = normalize_member(name).split('/')
+        return any('/'.join(parts[:i]) in selected for i in range(1, len(parts) + 1))
+    return match
+
+
+class ExtractionCancelled(Exception):
+    """解压任务被取消"""
+
+
+class UnsafeEntryError(Exception):
+    """归档条目路径不安全"""
+
+
+def _is_within(path, root):
+    return path == root or path.startswith(root.rstrip('/') + '/')
+
+
+def _existing_ancestor(path):
+    """返回path自身或最近的已存在（含悬空符号链接）的上级路径"""
+    while not os.path.lexists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def safe_target_path(target_dir, name):
+    """计算条目的解压路径，拒绝绝对路径和跳出目标目录的路径
+
+    除了按名称检查外，还要求上级目录中最近的已存在路径解析符号链接后仍在目标目录之内，
+    这样随后的makedirs不会经由（归档先前写出的或原本就有的）符号链接写到目标目录之外；
+    返回的路径本身可能是已有的符号链接，写入前由调用方删除（见 _copy_stream）
+    """
+    name = name.replace('\\', '/')
+    if name.startswith('/') or re.match(r'^[A-Za-z]:', name):
+        raise UnsafeEntryError(f"归档中包含绝对路径: {name}")
+    dest = os.path.normpath(os.path.join(target_dir, name))
+    if not _is_within(dest, target_dir):
+        raise UnsafeEntryError(f"归档条目试图写出目标目录: {name}")
+    if dest == target_dir:
+        # 归档根目录条目（如 ./）
+        return dest
+    real_ancestor = os.path.realpath(_existing_ancestor(os.path.dirname(dest)))
+    if not _is_within(real_ancestor, os.path.realpath(target_dir)):
+        raise UnsafeEntryError(f"归档条目经由符号链接写出目标目录: {name}")
+    return dest
+
+
+def _check_link_target(target_dir, dest, link_name):
+    """检查符号链接目标（相对于解析后的所在目录）仍在目标目录之内"""
+    if link_name.startswith('/'):
+        raise UnsafeEntryError(f"符号链接指向绝对路径: {link_name}")
+    real_parent = os.path.realpath(os.path.dirname(dest))
+    resolved = os.path.realpath(os.path.join(real_parent, link_name))
+    if not _is_within(resolved, os.path.realpath(target_dir)):
+        raise UnsafeEntryError(f"符号链接指向目标目录之外: {link_name}")
+
+
+class _CountingReader:
+    """统计已读取的压缩数据字节数，用于计算进度"""
+
+    def __init__(self, f, job):
+        self.f = f
+        self.job = job
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.job.input_bytes += len(data)
+        return data
+
+
+class ExtractionJob:
+    """解压任务
+
+    members: 只解压这些条目（目录包含其中的所有条目）
+    index: 归档的条目索引（archive_browser.ArchiveIndex），只解压部分条目时用于直接定位或提前结束
+    source: 从该流读取归档内容而不是打开archive_path（此时archive_path只用于判断格式），仅支持tar系列
+    """
+
+    def __init__(self, archive_path, target_dir, workers=4, members=None, index=None, source=None,
+                 source_size=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.archive_path = archive_path
+        self.target_dir = os.path.normpath(target_dir)
+        self.workers = workers
+        self.members = list(members) if members else None
+        self._selected = member_selector(members)
+        self.index = index if self._selected else None
+        # 硬链接路径 -> 已经按普通文件写出（只解压部分条目且源文件未被选中时）
+        self._materialized = set()
+        self.state = 'pending'  # pending, running, completed, failed, cancelled
+        self.error = None
+        self.source = source
+        self.input_size = (source_size or 0) if source is not None else os.path.getsize(archive_path)
+        self.input_bytes = 0
+        self.entries_done = 0
+        self.entries_total = None
+        self.bytes_written = 0
+        self.bytes_total = None
+        self.skipped = []
+        self.current = None
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._process = None
+
+    def cancel(self):
+        self._cancel.set()
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+
+    def _check_cancel(self):
+        if self._cancel.is_set():
+            raise ExtractionCancelled()
+
+    def _add_written(self, count):
+        with self._lock:
+            self.bytes_written += count
+
+    def _entry_done(self):
+        with self._lock:
+            self.entries_done += 1
+
+    def _skip(self, name, reason):
+        logger.warning(f"跳过归档条目 {name}: {reason}")
+        if len(self.skipped) < 100:
+            self.skipped.append({'name': name, 'reason': reason})
+
+    def _copy_stream(self, src, dest_path, mode=None):
+        # 目标位置已有的符号链接（如指向目标目录之外的 server.properties）先删除，不写入链接指向的文件
+        if os.path.islink(dest_path):
+            os.unlink(dest_path)
+        fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o644)
+        with open(fd, 'wb') as out:
+            while True:
+                self._check_cancel()
+                data = src.read(COPY_CHUNK_SIZE)
+                if not data:
+                    break
+                out.write(data)
+                self._add_written(len(data))
+        if mode is not None:
+            os.chmod(dest_path, mode & 0o777)
+
+    def progress(self):
+        """进度摘要；不知道解压后总大小时按已读取的压缩数据计算"""
+        if self.bytes_total:
+            bytes_done, bytes_total = self.bytes_written, self.bytes_total
+        else:
+            bytes_done, bytes_total = self.input_bytes, self.input_size
+        return {
+            'items_done': self.entries_done,
+            'items_total': self.entries_total,
+            'bytes_done': bytes_done,
+            'bytes_total': bytes_total,
+            'current': self.current
+        }
+
+    def to_dict(self):
+        if self.bytes_total:
+            progress = self.bytes_written / self.bytes_total
+        elif self.input_size:
+            progress = self.input_bytes / self.input_size
+        else:
+            progress = 0
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'error': self.error,
+            'archive': self.archive_path,
+            'target_dir': self.target_dir,
+            'members': self.members,
+            'entries_done': self.entries_done,
+            'entries_total': self.entries_total,
+            'bytes_written': self.bytes_written,
+            'bytes_total': self.bytes_total,
+            'input_bytes': self.input_bytes,
+            'input_size': self.input_size,
+            'progress': round(min(progress, 1.0) * 100, 1) if self.state != 'completed' else 100.0,
+            'current': self.current,
+            'skipped': self.skipped,
+            'elapsed': round(elapsed, 3),
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+    def run(self):
+        self.state = 'running'
+        self.started_at = time.time()
+        try:
+            os.makedirs(self.target_dir, exist_ok=True)
+            kind, detail = detect_format(self.archive_path)
+            if self.source is not None and kind != 'tar':
+                raise ValueError('只有tar格式（.tar/.tar.gz/.tar.bz2/.tar.xz/.tar.zst）支持边上传边解压')
+            if kind == 'tar':
+                self._extract_tar(detail)
+            elif kind == 'zip':
+                self._extract_zip()
+            elif kind == 'single':
+                self._extract_single(detail)
+            elif kind == 'rar':
+                self._extract_rar()
+            elif kind == '7z':
+                self._extract_7z()
+            else:
+                raise ValueError(f'不支持的文件格式: {detail}')
+            self.state = 'completed'
+            logger.info(f"文件已解压: {self.archive_path} -> {self.target_dir}")
+        except ExtractionCancelled:
+            self.state = 'cancelled'
+            logger.info(f"解压已取消: {self.archive_path}")
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            logger.error(f"解压文件失败 {self.archive_path}: {str(e)}")
+        finally:
+            self.current = None
+            # 不再引用请求体等外部流
+            self.source = None
+            self.finished_at = time.time()
+
+    def _extract_tar(self, compression):
+        wanted = None
+        sources = {}
+        if self.index is not None:
+            wanted = {entry['path'] for entry in self.index.entries if self._selected(entry['path'])}
+            self.entries_total = len(wanted)
+            # 选中的硬链接的源文件没有被选中时，读到源文件时把内容写到硬链接的位置
+            for path in wanted:
+                entry = self.index.by_path[path]
+                source = normalize_member(entry['link'] or '')
+                if entry['type'] == 'hardlink' and source in self.index.by_path and source not in wanted:
+                    sources.setdefault(source, []).append(entry['member'])
+            wanted |= set(sources)
+            if self.index.seekable:
+                self._extract_tar_indexed(wanted, sources)
+                return
+
+        opened = contextlib.nullcontext(self.source) if self.source is not None else open(self.archive_path, 'rb')
+        with opened as raw:
+            source = _CountingReader(raw, self)
+            if compression == 'zst':
+                stream = zstd.ZstdDecompressor().stream_reader(source, read_across_frames=True)
+                mode = 'r|'
+            else:
+                stream = source
+                mode = f'r|{compression}' if compression else 'r|'
+            with tarfile.open(fileobj=stream, mode=mode) as tar:
+                links = []
+                for member in tar:
+                    self._check_cancel()
+                    name = normalize_member(member.name)
+                    if name in sources and member.isreg():
+                        self._materialize_links(tar, member, sources[name])
+                    elif self._selected and not self._selected(member.name):
+                        continue
+                    else:
+                        self._extract_tar_member(tar, member, links)
+                    if wanted is not None:
+                        wanted.discard(name)
+                        if not wanted:
+                            # 选中的条目都已找到，不必读完整个归档
+                            break
+                self._extract_tar_links(links)
+
+    def _extract_tar_indexed(self, wanted, sources):
+        """未压缩的tar按索引中的偏移直接定位选中的条目"""
+        entries = sorted((self.index.by_path[path] for path in wanted), key=lambda entry: entry['offset'])
+        with open(self.archive_path, 'rb') as raw, tarfile.open(fileobj=raw, mode='r:') as tar:
+            links = []
+            for entry in entries:
+                self._check_cancel()
+                raw.seek(entry['offset'])
+                member = tarfile.TarInfo.fromtarfile(tar)
+                if entry['path'] in sources and member.isreg():
+                    self._materialize_links(tar, member, sources[entry['path']])
+                else:
+                    self._extract_tar_member(tar, member, links)
+                self.input_bytes = max(self.input_bytes, member.offset_data + member.size)
+            self._extract_tar_links(links)
+
+    def _extract_tar_member(self, tar, member, links):
+        """写出一个tar条目，硬链接加入links稍后处理"""
+        self.current = member.name
+        try:
+            dest = safe_target_path(self.target_dir, member.name)
+        except UnsafeEntryError as e:
+            self._skip(member.name, str(e))
+            return
+
+        if member.isdir():
+            os.makedirs(dest, exist_ok=True)
+        elif member.isreg():
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            self._copy_stream(tar.extractfile(member), dest, member.mode)
+            os.utime(dest, (member.mtime, member.mtime))
+        elif member.issym():
+            try:
+                _check_link_target(self.target_dir, dest, member.linkname)
+            except UnsafeEntryError as e:
+                self._skip(member.name, str(e))
+                return
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            os.symlink(member.linkname, dest)
+        elif member.islnk():
+            if normalize_member(member.name) not in self._materialized:
+                # 硬链接的源文件可能在后面才出现，最后统一处理
+                links.append((member, dest))
+            return
+        else:
+            self._skip(member.name, '不支持的条目类型（设备文件或管道）')
+            return
+        self._entry_done()
+
+    def _materialize_links(self, tar, source, link_names):
+        """把未选中的源文件的内容写到选中的硬链接位置，同一源文件的多个硬链接之间仍然是硬链接"""
+        first = None
+        for name in link_names:
+            try:
+                dest = safe_target_path(self.target_dir, name)
+            except UnsafeEntryError as e:
+                self._skip(name, str(e))
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            if first is None:
+                self.current = name
+                self._copy_stream(tar.extractfile(source), dest, source.mode)
+                os.utime(dest, (source.mtime, source.mtime))
+                first = dest
+            else:
+                os.link(first, dest)
+            self._materialized.add(normalize_member(name))
+            self._entry_done()
+
+    def _extract_tar_links(self, links):
+        for member, dest in links:
+            try:
+                source_path = safe_target_path(self.target_dir, member.linkname)
+            except UnsafeEntryError as e:
+                self._skip(member.name, str(e))
+                continue
+            if not os.path.isfile(source_path) or os.path.islink(source_path):
+                self._skip(member.name, '硬链接的源文件不存在（只解压部分条目时需要同时选中源文件）'
+                           if self._selected else '硬链接的源文件不存在')
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            os.link(source_path, dest)
+            self._entry_done()
+
+    def _extract_zip(self):
+        with zipfile.ZipFile(self.archive_path) as zf:
+            infos = zf.infolist()
+        if self._selected:
+            infos = [info for info in infos if self._selected(info.filename)]
+        self.entries_total = len(infos)
+        self.bytes_total = sum(info.file_size for info in infos)
+        local = threading.local()
+
+        def extract_member(info, dest):
+            self._check_cancel()
+            zf_local = getattr(local, 'zf', None)
+            if zf_local is None:
+                zf_local = local.zf = zipfile.ZipFile(self.archive_path)
+                opened.append(zf_local)
+            self.current = info.filename
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with zf_local.open(info) as src:
+                self._copy_stream(src, dest)
+            mode = (info.external_attr >> 16) & 0o777
+            if mode:
+                os.chmod(dest, mode)
+            self._entry_done()
+
+        opened = []
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = []
+                for info in infos:
+                    self._check_cancel()
+                    try:
+                        dest = safe_target_path(self.target_dir, info.filename)
+                    except UnsafeEntryError as e:
+                        self._skip(info.filename, str(e))
+                        continue
+                    if info.is_dir():
+                        os.makedirs(dest, exist_ok=True)
+                        self._entry_done()
+                        continue
+                    futures.append(executor.submit(extract_member, info, dest))
+                for future in concurrent.futures.as_completed(futures):
+                    if self._cancel.is_set():
+                        # 取消尚未开始的条目，正在写出的条目会在下一个数据块时退出
+                        for pending in futures:
+                            pending.cancel()
+                        break
+                    future.result()
+        finally:
+            for zf_local in opened:
+                zf_local.close()
+        self._check_cancel()
+
+    def _extract_single(self, ext):
+        dest = safe_target_path(self.target_dir, os.path.splitext(os.path.basename(self.archive_path))[0])
+        self.entries_total = 1
+        self.current = os.path.basename(dest)
+        with open(self.archive_path, 'rb') as raw:
+            source = _CountingReader(raw, self)
+            if ext == '.zst':
+                stream = zstd.ZstdDecompressor().stream_reader(source, read_across_frames=True)
+            else:
+                stream = SINGLE_FILE_SUFFIXES[ext](source, 'rb')
+            with stream:
+                self._copy_stream(stream, dest)
+        self._entry_done()
+
+    def _extract_rar(self):
+        with rarfile.RarFile(self.archive_path) as rf:
+            infos = rf.infolist()
+            if self._selected:
+                infos = [info for info in infos if self._selected(info.filename)]
+            self.entries_total = len(infos)
+            self.bytes_total = sum(info.file_size for info in infos)
+            for info in infos:
+                self._check_cancel()
+                self.current = info.filename
+                try:
+                    dest = safe_target_path(self.target_dir, info.filename)
+                except UnsafeEntryError as e:
+                    self._skip(info.filename, str(e))
+                    continue
+                if info.is_dir():
+                    os.makedirs(dest, exist_ok=True)
+                elif info.is_symlink():
+                    self._skip(info.filename, '不解压RAR中的符号链接')
+                    continue
+                else:
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    with rf.open(info) as src:
+                        self._copy_stream(src, dest)
+                self._entry_done()
+
+    def _list_7z(self):
+        """用 7z l -slt 列出条目，返回 [(名称, 是否目录, 是否符号链接, 大小)]"""
+        try:
+            result = subprocess.run(['7z', 'l', '-slt', self.archive_path],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise RuntimeError('解压7Z文件失败，系统未安装7z命令')
+        if result.returncode != 0:
+            raise RuntimeError(f"读取7z条目失败: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        output = result.stdout.decode('utf-8', errors='replace')
+        # 条目信息在 "----------" 之后，每个条目一段，以空行分隔
+        _, _, body = output.partition('\n----------\n')
+        entries = []
+        for block in re.split(r'\n\s*\n', body):
+            fields = dict(line.split(' = ', 1) for line in block.splitlines() if ' = ' in line)
+            name = fields.get('Path')
+            if not name:
+                continue
+            attributes = fields.get('Attributes', '')
+            is_link = bool(fields.get('Symbolic Link')) or re.search(r'(^|\s)l[rwxsStT-]{9}', attributes) is not None
+            is_dir = fields.get('Folder') == '+' or 'D' in attributes.split(' ')[0]
+            size = int(fields['Size']) if fields.get('Size', '').isdigit() else 0
+            entries.append((name, is_dir, is_link, size))
+        return entries
+
+    def _extract_7z(self):
+        # 7z自行写出文件，先按条目列表逐个检查，不安全的条目和符号链接用 -x! 排除
+        excluded = []
+        entries_total = 0
+        bytes_total = 0
+        for name, is_dir, is_link, size in self._list_7z():
+            if self._selected and not self._selected(name):
+                continue
+            try:
+                safe_target_path(self.target_dir, name)
+                if is_link:
+                    raise UnsafeEntryError('不解压7Z中的符号链接')
+            except UnsafeEntryError as e:
+                self._skip(name, str(e))
+                excluded.append(name)
+                continue
+            entries_total += 1
+            bytes_total += size
+        self.entries_total = entries_total
+        if excluded and any(name.startswith('/') or '..' in name.replace('\\', '/').split('/')
+                            for name in excluded):
+            # 7z按自身规则处理绝对路径和..，无法可靠地用 -x! 排除，整个归档拒绝解压
+            raise UnsafeEntryError('7z归档中包含绝对路径或跳出目标目录的条目，已拒绝解压')
+
+        # -bsp1 将进度输出到标准输出，形如 " 42% 13 - path/to/file"
+        command = ['7z', 'x', '-y', '-bsp1', '-bb0', self.archive_path, f'-o{self.target_dir}']
+        command += [f'-x!{name}' for name in excluded]
+        if self.members:
+            # 7z按名称匹配条目，选中目录时包含其中的内容
+            command += ['--'] + [normalize_member(member) for member in self.members]
+        try:
+            self._process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise RuntimeError('解压7Z文件失败，系统未安装7z命令')
+        buffer = b''
+        while True:
+            data = self._process.stdout.read1(4096)
+            if not data:
+                break
+            buffer += data
+            # 7z用退格符刷新同一行进度
+            parts = re.split(rb'[\r\n\x08]+', buffer)
+            buffer = parts.pop()
+            for part in parts:
+                match = re.match(rb'\s*(\d+)%(?:\s+(\d+))?(?:\s+-\s+(.*))?', part)
+                if match:
+                    self.input_bytes = self.input_size * int(match.group(1)) // 100
+                    if match.group(2):
+                        self.entries_done = int(match.group(2))
+                    if match.group(3):
+                        self.current = match.group(3).decode('utf-8', errors='replace').strip()
+        return_code = self._process.wait()
+        self._check_cancel()
+        if return_code != 0:
+            stderr = self._process.stderr.read().decode('utf-8', errors='replace')
+            raise RuntimeError(f"7z解压失败: {stderr.strip()}")
+
+
+class ExtractionManager:
+    """解压任务管理器"""
+
+    def __init__(self):
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def _cleanup(self):
+        now = time.time()
+        with self._lock:
+            for job_id, job in list(self.jobs.items()):
+                if job.finished_at and now - job.finished_at > FINISHED_JOB_TTL:
+                    del self.jobs[job_id]
+
+    def create(self, archive_path, target_dir, members=None, index=None):
+        self._cleanup()
+        job = ExtractionJob(archive_path, target_dir, members=members, index=index)
+        with self._lock:
+            self.jobs[job.id] = job
+        return job
+
+    def create_streaming(self, filename, source, source_size, target_dir, job_id=None):
+        """创建从流（如上传中的请求体）读取的解压任务；job_id可以由客户端预先生成，以便上传期间查询进度"""
+        self._cleanup()
+        if job_id is not None and not re.fullmatch(r'[0-9a-f]{32}', job_id):
+            raise ValueError('无效的任务ID')
+        job = ExtractionJob(filename, target_dir, source=source, source_size=source_size, job_id=job_id)
+        with self._lock:
+            if job.id in self.jobs:
+                raise ValueError('任务ID已存在')
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+
+# 创建全局解压任务管理器实例
+extraction_manager = ExtractionManager()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式打包模块
+边遍历目录边生成 zip（存储或deflate）/ tar / tar.gz / tar.zst 数据流，
+不写临时文件，内存占用与目录大小无关
+"""
+
+import io
+import os
+import stat
+import zlib
+import logging
+import tarfile
+import zipfile
+import zstandard as zstd
+
+logger = logging.getLogger("archive_stream")
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# 输出缓冲达到该大小时交给响应
+FLUSH_SIZE = 256 * 1024
+
+# 格式 -> (扩展名, MIME类型)
+STREAM_FORMATS = {
+    'zip': ('.zip', 'application/zip'),
+    'tar': ('.tar', 'application/x-tar'),
+    'tgz': ('.tar.gz', 'application/gzip'),
+    'tzst': ('.tar.zst', 'application/zstd')
+}
+
+
+class _StreamBuffer:
+    """只写缓冲区，供zipfile写入，由生成器定期取走数据"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+            self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+def iter_entries(paths, base_dir):
+    """遍历要打包的路径，产出 (完整路径, 归档内名称, lstat结果)，目录先于其内容"""
+    for path in paths:
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                st = os.lstat(current)
+            except OSError as e:
+                logger.warning(f"跳过无法访问的路径 {current}: {str(e)}")
+                continue
+            arcname = os.path.relpath(current, base_dir)
+            yield current, arcname, st
+            if stat.S_ISDIR(st.st_mode):
+                try:
+                    with os.scandir(current) as it:
+                        children = sorted(entry.path for entry in it)
+                except OSError as e:
+                    logger.warning(f"无法读取目录 {current}: {str(e)}")
+                    continue
+                stack.extend(reversed(children))
+
+
+def _iter_file_chunks(f, limit=None):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        data = f.read(READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining))
+        if not data:
+            break
+        if remaining is not None:
+            remaining -= len(data)
+        yield data
+
+
+def stream_zip(paths, base_dir, compress=True, level=6):
+    """流式生成zip，不可寻址输出时zipfile会使用数据描述符"""
+    buffer = _StreamBuffer()
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(buffer, 'w', compression, allowZip64=True, compresslevel=level if compress else None) as zf:
+        for path, arcname, st in iter_entries(paths, base_dir):
+            if stat.S_ISDIR(st.st_mode):
+                if arcname != '.':
+                    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+                    zf.writestr(zinfo, b'')
+            elif stat.S_ISREG(st.st_mode) or (stat.S_ISLNK(st.st_mode) and os.path.isfile(path)):
+                try:
+                    f = open(path, 'rb')
+                except OSError as e:
+                    logger.warning(f"跳过无法读取的文件 {path}: {str(e)}")
+                    continue
+                with f:
+                    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+                    zinfo.compress_type = compression
+                    with zf.open(zinfo, 'w', force_zip64=zinfo.file_size > 0x7fffffff) as dest:
+                        for data in _iter_file_chunks(f):
+                            dest.write(data)
+                            if buffer.size >= FLUSH_SIZE:
+                                yield buffer.drain()
+            if buffer.size >= FLUSH_SIZE:
+                yield buffer.drain()
+    yield buffer.drain()
+
+
+def stream_tar(paths, base_dir):
+    """流式生成tar（PAX格式），直接拼接头部和文件数据"""
+    helper = tarfile.open(fileobj=io.BytesIO(), mode='w', format=tarfile.PAX_FORMAT)
+    written = 0
+    for path, arcname, st in iter_entries(paths, base_dir):
+        if arcname == '.':
+            continue
+        try:
+            tarinfo = helper.gettarinfo(path, arcname)
+        except OSError as e:
+            logger.warning(f"跳过无法访问的路径 {path}: {str(e)}")
+            continue
+        if tarinfo is None:
+            # 套接字等无法打包的类型
+            continue
+
+        f = None
+        if tarinfo.isreg():
+            try:
+                f = open(path, 'rb')
+            except OSError as e:
+                logger.warning(f"跳过无法读取的文件 {path}: {str(e)}")
+                continue
+
+        header = tarinfo.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, 'surrogateescape')
+        written += len(header)
+        yield header
+        if f is not None:
+            with f:
+                sent = 0
+                for data in _iter_file_chunks(f, tarinfo.size):
+                    sent += len(data)
+                    yield data
+                # 打包过程中文件被截断时用0补齐，保证归档结构有效
+                while sent < tarinfo.size:
+                    padding = min(READ_CHUNK_SIZE, tarinfo.size - sent)
+                    sent += padding
+                    yield b'\0' * padding
+            written += tarinfo.size
+            remainder = tarinfo.size % tarfile.BLOCKSIZE
+            if remainder:
+                yield b'\0' * (tarfile.BLOCKSIZE - remainder)
+                written += tarfile.BLOCKSIZE - remainder
+
+    # 结尾两个空块，并补齐到记录大小
+    end = b'\0' * (tarfile.BLOCKSIZE * 2)
+    written += len(end)
+    remainder = written % tarfile.RECORDSIZE
+    if remainder:
+        end += b'\0' * (tarfile.RECORDSIZE - remainder)
+    yield end
+
+
+def _compress_stream(chunks, compressor):
+    pending = []
+    pending_size = 0
+    for data in chunks:
+        out = compressor.compress(data)
+        if out:
+            pending.append(out)
+            pending_size += len(out)
+            if pending_size >= FLUSH_SIZE:
+                yield b''.join(pending)
+                pending = []
+                pending_size = 0
+    pending.append(compressor.flush())
+    yield b''.join(pending)
+
+
+def stream_archive(paths, base_dir, format='zip', compress=True, level=6):
+    """按格式生成归档数据流"""
+    if format == 'zip':
+        return stream_zip(paths, base_dir, compress, level)
+    if format == 'tar':
+        return stream_tar(paths, base_dir)
+    if format == 'tgz':
+        return _compress_stream(stream_tar(paths, base_dir), zlib.compressobj(level, zlib.DEFLATED, 31))
+    if format == 'tzst':
+        return _compress_stream(stream_tar(paths, base_dir), zstd.ZstdCompressor(level=level, threads=-1).compressobj())
+    raise ValueError(f"不支持的格式: {format}")
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量文件操作模块
+一次请求提交多个删除、移动、复制、修改权限、重命名操作：先整体校验（后面的操作可以引用前面操作产生的路径），
+有冲突的操作（涉及相同路径或互为上下级目录，且至少一方会修改）按提交顺序依次执行，其余操作并行执行，
+返回每个操作的结果；前置操作失败时，依赖它的操作被跳过
+"""
+
+import os
+import logging
+import threading
+import concurrent.futures
+
+from job_manager import JobCancelled
+
+logger = logging.getLogger("batch_ops")
+
+OPERATIONS = ('delete', 'move', 'copy', 'chmod', 'rename')
+
+MAX_OPERATIONS = 10000
+
+# 并行执行的操作数
+BATCH_WORKERS = 4
+
+
+class BatchValidationError(Exception):
+    """批量操作校验失败，errors为 [{'index', 'message'}]"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} 个操作校验失败')
+        self.errors = errors
+
+
+def _valid_path(path):
+    return isinstance(path, str) and path.startswith('/') and '..' not in path and path.rstrip('/') != ''
+
+
+class _Namespace:
+    """校验时模拟前面的操作对路径是否存在的影响"""
+
+    def __init__(self):
+        self.state = {}  # 路径 -> True（已创建）/ False（已删除）
+
+    def exists(self, path):
+        current = path
+        while True:
+            if current in self.state:
+                # 自身或上级目录被前面的操作删除或创建
+                return self.state[current]
+            if current == '/':
+                return os.path.lexists(path)
+            current = os.path.dirname(current)
+
+    def is_dir(self, path):
+        # 由前面的操作创建的路径无法确定类型时按存在处理
+        return self.exists(path) and (os.path.isdir(path) or path in self.state)
+
+    def remove(self, path):
+        self.state[path] = False
+
+    def create(self, path):
+        self.state[path] = True
+
+
+def plan(operations):
+    """校验并规范化操作列表，返回 [{'index', 'op', 'path', 'destination', ...}]，有错误时抛出BatchValidationError
+
+    每个操作的格式：
+    - {'op': 'delete', 'path': ..., 'permanent': false}
+    - {'op': 'move' | 'copy', 'path': ..., 'destination': ...}
+    - {'op': 'rename', 'path': ..., 'newName': ...} 或 {'op': 'rename', 'path': ..., 'destination': ...}
+    - {'op': 'chmod', 'path': ..., 'mode': '755', 'recursive': false}
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BatchValidationError([{'index': None, 'message': '缺少操作列表'}])
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchValidationError([{'index': None, 'message': f'操作数超过上限 {MAX_OPERATIONS}'}])
+
+    namespace = _Namespace()
+    planned = []
+    errors = []
+    for index, raw in enumerate(operations):
+        def fail(message):
+            errors.append({'index': index, 'message': message})
+
+        if not isinstance(raw, dict) or raw.get('op') not in OPERATIONS:
+            fail(f"未知的操作类型，可用: {', '.join(OPERATIONS)}")
+            continue
+        kind = raw['op']
+        path = raw.get('path')
+        if not _valid_path(path):
+            fail(f'无效的路径: {path}')
+            continue
+        path = path.rstrip('/')
+        if not namespace.exists(path):
+            fail(f'路径不存在: {path}')
+            continue
+        op = {'index': index, 'op': kind, 'path': path, 'destination': None}
+
+        if kind in ('move', 'copy', 'rename'):
+            destination = raw.get('destination')
+            if kind == 'rename' and raw.get('newName') is not None:
+                name = raw['newName']
+                if not isinstance(name, str) or not name or '/' in name or name in ('.', '..'):
+                    fail(f'无效的新名称: {name}')
+                    continue
+                destination = os.path.join(os.path.dirname(path), name)
+            if not _valid_path(destination):
+                fail(f'无效的目标路径: {destination}')
+                continue
+            destination = destination.rstrip('/')
+            if destination == path:
+                fail('目标路径与源路径相同')
+                continue
+            if destination.startswith(path + '/'):
+                fail('不能把目录移动或复制到它自己的子目录中')
+                continue
+            if not namespace.is_dir(os.path.dirname(destination)):
+                fail(f'目标目录不存在: {os.path.dirname(destination)}')
+                continue
+            if kind == 'rename' and namespace.exists(destination):
+                fail(f'目标路径已存在: {destination}')
+                continue
+            op['destination'] = destination
+        elif kind == 'chmod':
+            mode = raw.get('mode')
+            try:
+                mode = mode if isinstance(mode, int) else int(str(mode), 8)
+            except ValueError:
+                fail(f'无效的权限值: {mode}')
+                continue
+            if not 0 <= mode <= 0o7777:
+                fail(f'无效的权限值: {oct(mode)}')
+                continue
+            op['mode'] = mode
+            op['recursive'] = bool(raw.get('recursive'))
+        elif kind == 'delete':
+            op['permanent'] = bool(raw.get('permanent'))
+
+        if kind in ('delete', 'move', 'rename'):
+            namespace.remove(path)
+        if op['destination']:
+            namespace.create(op['destination'])
+        planned.append(op)
+
+    if errors:
+        raise BatchValidationError(errors)
+    _add_dependencies(planned)
+    return planned
+
+
+def _touched(op):
+    """操作涉及的 (路径, 是否修改)"""
+    if op['op'] == 'copy':
+        return [(op['path'], False), (op['destination'], True)]
+    touched = [(op['path'], True)]
+    if op['destination']:
+        touched.append((op['destination'], True))
+    return touched
+
+
+def _add_dependencies(planned):
+    """为每个操作找出必须先完成的、与它冲突的前面的操作"""
+    exact = {}  # 路径 -> [(操作序号, 是否修改)]
+    below = {}  # 路径 -> 该路径之下被涉及的 [(操作序号, 是否修改)]
+    for position, op in enumerate(planned):
+        depends = set()
+        for path, write in _touched(op):
+            candidates = list(exact.get(path, ())) + list(below.get(path, ()))
+            ancestor = os.path.dirname(path)
+            while True:
+                candidates.extend(exact.get(ancestor, ()))
+                if ancestor == '/':
+                    break
+                ancestor = os.path.dirname(ancestor)
+            depends.update(other for other, other_write in candidates if write or other_write)
+        op['depends'] = sorted(depends)
+        for path, write in _touched(op):
+            exact.setdefault(path, []).append((position, write))
+            ancestor = os.path.dirname(path)
+            while True:
+                below.setdefault(ancestor, []).append((position, write))
+                if ancestor == '/':
+                    break
+                ancestor = os.path.dirname(ancestor)
+
+
+class _OperationContext:
+    """转发给批量任务进度的子上下文：子操作的条目数不计入，字节数累加"""
+
+    def __init__(self, ctx, lock):
+        self._ctx = ctx
+        self._lock = lock
+
+    @property
+    def cancelled(self):
+        return self._ctx.cancelled
+
+    def check_cancel(self):
+        self._ctx.check_cancel()
+
+    def set_total(self, items=None, bytes=None):
+        pass
+
+    def advance(self, items=0, bytes=0, current=None):
+        with self._lock:
+            self._ctx.advance(0, bytes, current)
+
+    def on_cancel(self, callback):
+        self._ctx.on_cancel(callback)
+
+
+def run(ctx, planned, execute, workers=BATCH_WORKERS):
+    """执行校验后的操作，execute(ctx, op) 执行单个操作并返回附加结果（dict或None）
+
+    返回按提交顺序排列的结果 [{'index', 'op', 'path', 'status', 'message', ...}]，
+    status为success、error、skipped（依赖的操作未成功）或cancelled
+    """
+    ctx.set_total(len(planned))
+    lock = threading.Lock()
+    results = [None] * len(planned)
+    dependents = [[] for _ in planned]
+    waiting = [len(op['depends']) for op in planned]
+    for position, op in enumerate(planned):
+        for depend in op['depends']:
+            dependents[depend].append(position)
+
+    def finish(position, status, message=None, extra=None):
+        op = planned[position]
+        result = {'index': op['index'], 'op': op['op'], 'path': op['path'], 'status': status}
+        if op['destination']:
+            result['destination'] = op['destination']
+        if message:
+            result['message'] = message
+        if extra:
+            result.update(extra)
+        results[position] = result
+        with lock:
+            try:
+                ctx.advance(items=1, current=op['path'])
+            except JobCancelled:
+                pass
+
+    def execute_one(position):
+        op = planned[position]
+        if ctx.cancelled:
+            finish(position, 'cancelled', '任务已取消')
+            return position
+        try:
+            extra = execute(_OperationContext(ctx, lock), op)
+        except Exception as e:
+            if ctx.cancelled:
+                finish(position, 'cancelled', '任务已取消')
+            else:
+                logger.warning(f"批量操作 {op['op']} {op['path']} 失败: {str(e)}")
+                finish(position, 'error', str(e))
+        else:
+            finish(position, 'success', extra=extra)
+        return position
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {executor.submit(execute_one, position) for position in range(len(planned)) if not waiting[position]}
+        while running:
+            done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            # 已结束的操作依次解除对后续操作的阻塞，不执行的操作继续向后传递
+            resolved = [future.result() for future in done]
+            while resolved:
+                position = resolved.pop()
+                for dependent in dependents[position]:
+                    if results[position]['status'] != 'success' and results[dependent] is None:
+                        if ctx.cancelled:
+                            finish(dependent, 'cancelled', '任务已取消')
+                        else:
+                            finish(dependent, 'skipped', f"依赖的操作 #{planned[position]['index']} 未成功")
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        if results[dependent] is None:
+                            running.add(executor.submit(execute_one, dependent))
+                        else:
+                            resolved.append(dependent)
+    return results
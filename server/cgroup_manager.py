@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cgroup v2 资源管理模块
+为每个游戏服务器创建独立的cgroup子树，用于限制CPU、内存、IO和进程数，
+并直接从cgroup文件读取资源使用情况，避免用psutil遍历进程树
+"""
+
+import os
+import re
+import logging
+import threading
+import time
+
+logger = logging.getLogger("cgroup_manager")
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+# 面板自身进程所在的叶子cgroup（cgroup v2 要求启用控制器的节点不能直接包含进程）
+PANEL_CGROUP_NAME = "gsm_panel"
+# 游戏服务器cgroup的父节点
+SERVERS_CGROUP_NAME = "gsm_servers"
+# 需要启用的控制器
+WANTED_CONTROLLERS = ("cpu", "memory", "io", "pids")
+# CPU配额周期（微秒）
+CPU_PERIOD_US = 100000
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$', re.IGNORECASE)
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(value):
+    """解析内存大小，支持整数字节数或 512M、4G 这样的字符串"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = _SIZE_RE.match(str(value))
+    if not match:
+        raise ValueError(f"无效的内存大小: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def normalize_limits(limits):
+    """校验并规范化资源限制配置
+
+    支持的字段:
+        cpu_quota: CPU核心数，如 1.5 表示最多使用1.5个核心
+        memory_max: 内存硬上限
+        memory_high: 内存软上限，超过后内核会积极回收
+        io_weight: IO权重，1-10000，默认100
+        pids_max: 最大进程/线程数
+    """
+    limits = limits or {}
+    normalized = {}
+
+    cpu_quota = limits.get('cpu_quota')
+    if cpu_quota not in (None, ''):
+        cpu_quota = float(cpu_quota)
+        if cpu_quota <= 0:
+            raise ValueError("CPU配额必须大于0")
+        normalized['cpu_quota'] = cpu_quota
+
+    for key in ('memory_max', 'memory_high'):
+        size = parse_size(limits.get(key))
+        if size is not None:
+            if size < 16 * 1024 * 1024:
+                raise ValueError(f"{key} 不能小于16M")
+            normalized[key] = size
+
+    if 'memory_max' in normalized and 'memory_high' in normalized and normalized['memory_high'] > normalized['memory_max']:
+        raise ValueError("memory_high 不能大于 memory_max")
+
+    io_weight = limits.get('io_weight')
+    if io_weight not in (None, ''):
+        io_weight = int(io_weight)
+        if not 1 <= io_weight <= 10000:
+            raise ValueError("IO权重必须在1到10000之间")
+        normalized['io_weight'] = io_weight
+
+    pids_max = limits.get('pids_max')
+    if pids_max not in (None, ''):
+        pids_max = int(pids_max)
+        if pids_max < 8:
+            raise ValueError("最大进程数不能小于8")
+        normalized['pids_max'] = pids_max
+
+    return normalized
+
+
+def _read_file(path):
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+
+def _write_file(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def _read_flat_keyed(path):
+    """读取 key value 格式的文件，如 cpu.stat、memory.stat"""
+    result = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    result[parts[0]] = int(parts[1])
+    except (OSError, ValueError):
+        pass
+    return result
+
+
+def _read_pressure(path):
+    """读取PSI压力信息，如 cpu.pressure"""
+    result = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                values = {}
+                for item in parts[1:]:
+                    key, _, value = item.partition('=')
+                    values[key] = float(value) if key != 'total' else int(value)
+                result[parts[0]] = values
+    except (OSError, ValueError):
+        pass
+    return result
+
+
+def process_cgroup(pid):
+    """返回进程所在的cgroup v2目录，无法读取时返回None"""
+    try:
+        with open(f"/proc/{pid}/cgroup", 'r') as f:
+            for line in f:
+                if line.startswith("0::"):
+                    return os.path.normpath(os.path.join(CGROUP_ROOT, line[3:].strip().lstrip('/')))
+    except OSError:
+        pass
+    return None
+
+
+def _safe_name(game_id):
+    """将游戏ID转换为合法的cgroup目录名"""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(game_id)) or '_'
+
+
+class CgroupManager:
+    """cgroup v2 管理类"""
+
+    def __init__(self):
+        self.available = None  # None 表示尚未检测
+        self.reason = None
+        self.base_path = None
+        self.servers_path = None
+        self.controllers = ()
+        self._lock = threading.Lock()
+        self._cpu_marks = {}  # (game_id, 调用方) -> (采样时间, usage_usec)
+        self._cpu_percent = {}  # game_id -> 最近一次计算的CPU使用率
+
+    def _detect(self):
+        """检测cgroup v2是否可用，并把面板进程移到叶子节点以便为子节点启用控制器"""
+        if not os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+            return False, "主机未使用cgroup v2统一层级"
+
+        own_path = None
+        try:
+            with open("/proc/self/cgroup", 'r') as f:
+                for line in f:
+                    if line.startswith("0::"):
+                        own_path = line[3:].strip()
+                        break
+        except OSError as e:
+            return False, f"无法读取进程cgroup信息: {str(e)}"
+        if own_path is None:
+            return False, "无法确定面板所在的cgroup"
+
+        base_path = os.path.normpath(os.path.join(CGROUP_ROOT, own_path.lstrip('/')))
+        # 如果面板已经位于自己创建的叶子节点中（例如重启后），使用其父节点
+        if os.path.basename(base_path) == PANEL_CGROUP_NAME:
+            base_path = os.path.dirname(base_path)
+
+        if not os.access(os.path.join(base_path, "cgroup.subtree_control"), os.W_OK):
+            return False, f"没有权限管理cgroup: {base_path}"
+
+        try:
+            available = _read_file(os.path.join(base_path, "cgroup.controllers")).split()
+            controllers = tuple(c for c in WANTED_CONTROLLERS if c in available)
+            if not controllers:
+                return False, "cgroup中没有可用的控制器"
+
+            # 将当前节点中的所有进程移动到面板叶子节点
+            panel_path = os.path.join(base_path, PANEL_CGROUP_NAME)
+            os.makedirs(panel_path, exist_ok=True)
+            procs = _read_file(os.path.join(base_path, "cgroup.procs")).split()
+            for pid in procs:
+                try:
+                    _write_file(os.path.join(panel_path, "cgroup.procs"), pid)
+                except OSError:
+                    # 内核线程或已退出的进程无法移动，忽略
+                    pass
+
+            enable = ' '.join(f'+{c}' for c in controllers)
+            _write_file(os.path.join(base_path, "cgroup.subtree_control"), enable)
+
+            servers_path = os.path.join(base_path, SERVERS_CGROUP_NAME)
+            os.makedirs(servers_path, exist_ok=True)
+            _write_file(os.path.join(servers_path, "cgroup.subtree_control"), enable)
+        except OSError as e:
+            return False, f"初始化cgroup失败: {str(e)}"
+
+        self.base_path = base_path
+        self.servers_path = servers_path
+        self.controllers = controllers
+        return True, None
+
+    def is_available(self):
+        """检查是否可以为游戏服务器创建cgroup（只检测一次）"""
+        if self.available is None:
+            with self._lock:
+                if self.available is None:
+                    self.available, self.reason = self._detect()
+                    if self.available:
+                        logger.info(f"cgroup v2 可用，游戏服务器cgroup位于 {self.servers_path}，控制器: {', '.join(self.controllers)}")
+                    else:
+                        logger.info(f"cgroup v2 不可用，游戏服务器将不做资源限制: {self.reason}")
+        return self.available
+
+    def get_server_path(self, game_id):
+        """获取游戏服务器的cgroup路径，不存在时返回None"""
+        if not self.servers_path:
+            return None
+        path = os.path.join(self.servers_path, _safe_name(game_id))
+        return path if os.path.isdir(path) else None
+
+    def prepare_server(self, game_id, limits=None):
+        """创建（或复用）游戏服务器的cgroup并应用限制，返回cgroup路径；不可用时返回None"""
+        if not self.is_available():
+            return None
+        path = os.path.join(self.servers_path, _safe_name(game_id))
+        try:
+            os.makedirs(path, exist_ok=True)
+            self.apply_limits(path, limits)
+            self._forget_cpu_marks(game_id)
+            return path
+        except (OSError, ValueError) as e:
+            logger.error(f"为游戏服务器 {game_id} 准备cgroup失败: {str(e)}")
+            return None
+
+    def apply_limits(self, path, limits):
+        """向cgroup写入资源限制，未设置的项恢复为不限制"""
+        limits = normalize_limits(limits)
+
+        if 'cpu' in self.controllers:
+            if 'cpu_quota' in limits:
+                quota = max(1000, int(limits['cpu_quota'] * CPU_PERIOD_US))
+                _write_file(os.path.join(path, "cpu.max"), f"{quota} {CPU_PERIOD_US}")
+            else:
+                _write_file(os.path.join(path, "cpu.max"), f"max {CPU_PERIOD_US}")
+
+        if 'memory' in self.controllers:
+            _write_file(os.path.join(path, "memory.high"), str(limits.get('memory_high', 'max')))
+            _write_file(os.path.join(path, "memory.max"), str(limits.get('memory_max', 'max')))
+
+        if 'io' in self.controllers:
+            io_weight_file = os.path.join(path, "io.weight")
+            if os.path.exists(io_weight_file):
+                _write_file(io_weight_file, f"default {limits.get('io_weight', 100)}")
+
+        if 'pids' in self.controllers:
+            _write_file(os.path.join(path, "pids.max"), str(limits.get('pids_max', 'max')))
+
+        return limits
+
+    def update_limits(self, game_id, limits):
+        """更新运行中游戏服务器的资源限制，返回是否已实时生效"""
+        path = self.get_server_path(game_id)
+        if not path:
+            return False
+        self.apply_limits(path, limits)
+        return True
+
+    def release_server(self, game_id):
+        """游戏服务器退出后删除其cgroup（仍有残留进程时保留）"""
+        path = self.get_server_path(game_id)
+        if not path:
+            return
+        try:
+            os.rmdir(path)
+            self._forget_cpu_marks(game_id)
+            logger.info(f"已删除游戏服务器 {game_id} 的cgroup")
+        except OSError as e:
+            logger.warning(f"删除游戏服务器 {game_id} 的cgroup失败（可能仍有残留进程）: {str(e)}")
+
+    def _forget_cpu_marks(self, game_id):
+        with self._lock:
+            for key in [key for key in self._cpu_marks if key[0] == game_id]:
+                del self._cpu_marks[key]
+            self._cpu_percent.pop(game_id, None)
+
+    def read_usage(self, game_id, consumer=None):
+        """从cgroup文件读取游戏服务器的资源使用情况，cgroup不存在时返回None
+
+        consumer是定期采样的调用方名称，CPU使用率根据该调用方两次读取之间的增量计算，各调用方互不干扰；
+        不指定时不更新采样点，返回最近一次计算的CPU使用率（由后台采样线程更新）
+        """
+        path = self.get_server_path(game_id)
+        if not path:
+            return None
+
+        now = time.time()
+        cpu_stat = _read_flat_keyed(os.path.join(path, "cpu.stat"))
+        usage_usec = cpu_stat.get('usage_usec', 0)
+
+        # 根据同一调用方两次读取之间的CPU时间增量计算使用率
+        with self._lock:
+            if consumer is None:
+                cpu_percent = self._cpu_percent.get(game_id)
+            else:
+                cpu_percent = None
+                last_mark = self._cpu_marks.get((game_id, consumer))
+                if last_mark and now > last_mark[0]:
+                    cpu_percent = round((usage_usec - last_mark[1]) / ((now - last_mark[0]) * 1000000) * 100, 2)
+                    self._cpu_percent[game_id] = cpu_percent
+                self._cpu_marks[(game_id, consumer)] = (now, usage_usec)
+
+        memory_stat = _read_flat_keyed(os.path.join(path, "memory.stat"))
+        usage = {
+            'cgroup': path,
+            'cpu_percent': cpu_percent,
+            'cpu_usage_usec': usage_usec,
+            'cpu_user_usec': cpu_stat.get('user_usec', 0),
+            'cpu_system_usec': cpu_stat.get('system_usec', 0),
+            'cpu_throttled_usec': cpu_stat.get('throttled_usec', 0),
+            'cpu_nr_throttled': cpu_stat.get('nr_throttled', 0),
+            'memory_anon': memory_stat.get('anon', 0),
+            'memory_file': memory_stat.get('file', 0),
+            # 匿名内存加文件映射内存，近似等于进程树的RSS
+            'memory_rss': memory_stat.get('anon', 0) + memory_stat.get('file_mapped', 0),
+            'pressure': {
+                'cpu': _read_pressure(os.path.join(path, "cpu.pressure")),
+                'memory': _read_pressure(os.path.join(path, "memory.pressure")),
+                'io': _read_pressure(os.path.join(path, "io.pressure"))
+            }
+        }
+
+        for key, filename in (('memory_current', "memory.current"), ('memory_peak', "memory.peak"),
+                              ('pids_current', "pids.current")):
+            try:
+                usage[key] = int(_read_file(os.path.join(path, filename)))
+            except (OSError, ValueError):
+                usage[key] = None
+
+        memory_events = _read_flat_keyed(os.path.join(path, "memory.events"))
+        usage['memory_oom_kills'] = memory_events.get('oom_kill', 0)
+        usage['memory_high_events'] = memory_events.get('high', 0)
+
+        return usage
+
+
+# 创建全局cgroup管理器实例
+cgroup_manager = CgroupManager()
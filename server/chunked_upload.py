@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分片上传模块
+创建上传会话后，客户端可以并行上传编号分片；分片通过pwrite写入预分配的临时文件，
+会话信息持久化到磁盘，断线或面板重启后可查询缺失的分片继续上传，完成时可校验整体哈希
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger("chunked_upload")
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+HASH_ALGORITHMS = ('sha256', 'sha1', 'md5')
+
+# 未完成会话的保留时间（秒）
+SESSION_TTL = 24 * 3600
+
+
+class UploadError(Exception):
+    """上传会话错误，附带HTTP状态码"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChunkedUploadManager:
+    """分片上传会话管理器"""
+
+    def __init__(self, state_dir='/home/steam/server/uploads'):
+        self.state_dir = state_dir
+        self._lock = threading.Lock()
+        self._sessions = {}  # 会话ID -> 会话信息
+        self._writers = {}  # 会话ID -> 正在写入的分片数
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.state_dir, f"{upload_id}.json")
+
+    def _save(self, session):
+        os.makedirs(self.state_dir, exist_ok=True)
+        meta_path = self._meta_path(session['id'])
+        temp_path = meta_path + '.tmp'
+        data = dict(session, received=sorted(session['received']))
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, meta_path)
+
+    def _load(self, upload_id):
+        """从内存或磁盘获取会话"""
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError('无效的上传会话ID')
+        session = self._sessions.get(upload_id)
+        if session is not None:
+            return session
+        try:
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                session = json.load(f)
+        except FileNotFoundError:
+            raise UploadError('上传会话不存在或已过期', 404)
+        session['received'] = set(session['received'])
+        self._sessions[upload_id] = session
+        return session
+
+    def cleanup_expired(self):
+        """清理超时未完成的会话及其临时文件"""
+        if not os.path.isdir(self.state_dir):
+            return
+        now = time.time()
+        for name in os.listdir(self.state_dir):
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-5]
+            try:
+                with self._lock:
+                    session = self._load(upload_id)
+                    if now - session['updated'] < SESSION_TTL:
+                        continue
+                    self._discard(session)
+                logger.info(f"已清理过期的上传会话: {upload_id}")
+            except Exception as e:
+                logger.warning(f"清理上传会话 {upload_id} 失败: {str(e)}")
+
+    def _discard(self, session):
+        if session['state'] != 'completed' and os.path.exists(session['temp_path']):
+            os.remove(session['temp_path'])
+        try:
+            os.remove(self._meta_path(session['id']))
+        except FileNotFoundError:
+            pass
+        self._sessions.pop(session['id'], None)
+
+    def create(self, target_dir, filename, size, chunk_size=None, hash_algorithm=None, expected_hash=None,
+               overwrite=False, username=None):
+        """创建上传会话并预分配临时文件"""
+        self.cleanup_expired()
+
+        if size is None or int(size) < 0:
+            raise UploadError('文件大小无效')
+        size = int(size)
+        chunk_size = int(chunk_size or DEFAULT_CHUNK_SIZE)
+        if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+            raise UploadError(f'分片大小必须在 {MIN_CHUNK_SIZE} 到 {MAX_CHUNK_SIZE} 字节之间')
+        if hash_algorithm:
+            hash_algorithm = hash_algorithm.lower()
+            if hash_algorithm not in HASH_ALGORITHMS:
+                raise UploadError(f'不支持的哈希算法: {hash_algorithm}')
+            if not expected_hash:
+                raise UploadError('指定哈希算法时必须提供哈希值')
+
+        final_path = os.path.join(target_dir, filename)
+        if os.path.exists(final_path) and not overwrite:
+            raise UploadError('目标文件已存在', 409)
+        if shutil.disk_usage(target_dir).free < size:
+            raise UploadError('磁盘空间不足', 507)
+
+        upload_id = uuid.uuid4().hex
+        # 临时文件放在目标目录中，完成时可以原子重命名
+        temp_path = os.path.join(target_dir, f".{filename}.{upload_id}.upload")
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            if size:
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    # 部分文件系统不支持fallocate
+                    os.ftruncate(fd, size)
+        except Exception:
+            os.close(fd)
+            os.remove(temp_path)
+            raise
+        os.close(fd)
+
+        now = time.time()
+        session = {
+            'id': upload_id,
+            'state': 'uploading',
+            'target_dir': target_dir,
+            'filename': filename,
+            'final_path': final_path,
+            'temp_path': temp_path,
+            'size': size,
+            'chunk_size': chunk_size,
+            'total_chunks': max(1, (size + chunk_size - 1) // chunk_size),
+            'received': set(),
+            'hash_algorithm': hash_algorithm,
+            'expected_hash': expected_hash.lower() if expected_hash else None,
+            'overwrite': bool(overwrite),
+            'username': username,
+            'created': now,
+            'updated': now
+        }
+        with self._lock:
+            self._sessions[upload_id] = session
+            self._save(session)
+        logger.info(f"创建上传会话 {upload_id}: {final_path} ({size} 字节，{session['total_chunks']} 个分片)")
+        return session
+
+    def write_chunk(self, upload_id, index, stream, content_length):
+        """把一个分片写入临时文件的对应位置"""
+        with self._lock:
+            session = self._load(upload_id)
+            if session['state'] != 'uploading':
+                raise UploadError('上传会话已完成', 409)
+            if not 0 <= index < session['total_chunks']:
+                raise UploadError('分片编号超出范围')
+            offset = index * session['chunk_size']
+            expected_length = min(session['chunk_size'], session['size'] - offset)
+            if content_length is not None and content_length != expected_length:
+                raise UploadError(f'分片 {index} 的长度应为 {expected_length} 字节')
+            # 登记正在写入的分片，complete()在有写入时拒绝完成，避免写入已校验并重命名的文件
+            self._writers[upload_id] = self._writers.get(upload_id, 0) + 1
+
+        try:
+            written = 0
+            fd = os.open(session['temp_path'], os.O_WRONLY)
+            try:
+                while written < expected_length:
+                    data = stream.read(min(1024 * 1024, expected_length - written))
+                    if not data:
+                        break
+                    view = memoryview(data)
+                    while view:
+                        count = os.pwrite(fd, view, offset + written)
+                        written += count
+                        view = view[count:]
+            finally:
+                os.close(fd)
+
+            if written != expected_length:
+                raise UploadError(f'分片 {index} 数据不完整: 收到 {written} 字节，应为 {expected_length} 字节')
+
+            with self._lock:
+                # 写入期间会话可能已被取消
+                if session['state'] != 'uploading' or self._sessions.get(upload_id) is not session:
+                    raise UploadError('上传会话已完成或已取消', 409)
+                session['received'].add(index)
+                session['updated'] = time.time()
+                self._save(session)
+            return session
+        finally:
+            with self._lock:
+                remaining = self._writers.get(upload_id, 1) - 1
+                if remaining > 0:
+                    self._writers[upload_id] = remaining
+                else:
+                    self._writers.pop(upload_id, None)
+
+    def get_status(self, upload_id):
+        with self._lock:
+            session = self._load(upload_id)
+            received = set(session['received'])
+        missing = [i for i in range(session['total_chunks']) if i not in received]
+        return {
+            'upload_id': session['id'],
+            'state': session['state'],
+            'path': session['final_path'],
+            'size': session['size'],
+            'chunk_size': session['chunk_size'],
+            'total_chunks': session['total_chunks'],
+            'received_chunks': len(received),
+            'received_bytes': sum(min(session['chunk_size'], session['size'] - i * session['chunk_size']) for i in received),
+            'missing_chunks': missing,
+            'missing_offsets': [i * session['chunk_size'] for i in missing],
+            'created': session['created'],
+            'updated': session['updated']
+        }
+
+    def _hash_file(self, path, algorithm):
+        digest = hashlib.new(algorithm)
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(4 * 1024 * 1024)
+                if not data:
+                    break
+                digest.update(data)
+        return digest.hexdigest()
+
+    def complete(self, upload_id):
+        """校验并完成上传，把临时文件原子重命名为目标文件"""
+        with self._lock:
+            session = self._load(upload_id)
+            if session['state'] == 'completed':
+                return session
+            missing = session['total_chunks'] - len(session['received'])
+            if session['size'] and missing:
+                raise UploadError(f'还有 {missing} 个分片未上传', 409)
+            if self._writers.get(upload_id):
+                raise UploadError('仍有分片正在写入，请稍后重试', 409)
+            session['state'] = 'finalizing'
+
+        try:
+            fd = os.open(session['temp_path'], os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            if session['hash_algorithm']:
+                actual = self._hash_file(session['temp_path'], session['hash_algorithm'])
+                if actual != session['expected_hash']:
+                    raise UploadError(f"文件校验失败: {session['hash_algorithm']} 应为 {session['expected_hash']}，实际为 {actual}", 422)
+
+            if os.path.exists(session['final_path']) and not session['overwrite']:
+                raise UploadError('目标文件已存在', 409)
+            os.replace(session['temp_path'], session['final_path'])
+        except Exception:
+            with self._lock:
+                session['state'] = 'uploading'
+            raise
+
+        with self._lock:
+            session['state'] = 'completed'
+            session['updated'] = time.time()
+            self._save(session)
+        logger.info(f"上传完成: {session['final_path']}, 用户: {session.get('username')}")
+        return session
+
+    def get_completed_file(self, upload_id):
+        """返回已完成上传的文件路径；会话保留，文件被取走后调用release结束会话"""
+        with self._lock:
+            session = self._load(upload_id)
+            if session['state'] != 'completed':
+                raise UploadError('上传尚未完成', 409)
+            if not os.path.exists(session['final_path']):
+                raise UploadError('上传的文件已不存在', 404)
+        return session['final_path']
+
+    def release(self, upload_id):
+        """结束已完成的上传会话（只删除会话信息，不删除上传的文件）"""
+        with self._lock:
+            session = self._load(upload_id)
+            if session['state'] != 'completed':
+                raise UploadError('上传尚未完成', 409)
+            self._discard(session)
+
+    def abort(self, upload_id):
+        """取消上传并删除临时文件"""
+        with self._lock:
+            session = self._load(upload_id)
+            self._discard(session)
+
+
+# 创建全局分片上传管理器实例
+upload_manager = ChunkedUploadManager()
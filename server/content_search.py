@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件内容搜索模块
+使用线程池和mmap并行扫描文件，按内容嗅探跳过二进制文件，
+每次搜索都有时间、读取字节数和结果数上限，并限制同时进行的搜索数量
+"""
+
+import os
+import re
+import mmap
+import time
+import queue
+import fnmatch
+import logging
+import threading
+import concurrent.futures
+
+from process_priority import apply_sched_profile
+
+logger = logging.getLogger("content_search")
+
+# 搜索线程使用较低的IO优先级
+SEARCH_SCHED_PROFILE = {'nice': 5, 'ionice_class': 'best-effort', 'ionice_level': 7}
+
+# 嗅探二进制文件时读取的字节数
+SNIFF_SIZE = 8192
+
+# 单行输出的最大长度
+MAX_LINE_LENGTH = 500
+
+# 每次正则搜索的窗口大小（按行对齐），窗口之间检查是否需要停止
+SEARCH_WINDOW = 1024 * 1024
+
+
+class SearchLimits:
+    """单次搜索的资源上限和计数"""
+
+    def __init__(self, max_results, max_bytes, timeout):
+        self.max_results = max_results
+        self.max_bytes = max_bytes
+        self.deadline = time.monotonic() + timeout
+        self.results = 0
+        self.bytes_scanned = 0
+        self.files_scanned = 0
+        self.files_skipped = 0
+        self.stop_reason = None
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def stop(self, reason):
+        if self.stop_reason is None:
+            self.stop_reason = reason
+        self.cancelled.set()
+
+    def should_stop(self):
+        if self.cancelled.is_set():
+            return True
+        if time.monotonic() > self.deadline:
+            self.stop('timeout')
+            return True
+        return False
+
+    def reserve_bytes(self, size):
+        """为即将扫描的文件预留读取字节数，超出上限时返回False"""
+        with self._lock:
+            if self.bytes_scanned + size > self.max_bytes:
+                self.stop('max_bytes')
+                return False
+            self.bytes_scanned += size
+            self.files_scanned += 1
+            return True
+
+    def add_result(self):
+        with self._lock:
+            if self.results >= self.max_results:
+                self.stop('max_results')
+                return False
+            self.results += 1
+            return True
+
+    def skip_file(self):
+        with self._lock:
+            self.files_skipped += 1
+
+
+def _put_event(events, event, limits):
+    """放入事件队列；客户端已断开时放弃，避免工作线程阻塞"""
+    while True:
+        try:
+            events.put(event, timeout=0.5)
+            return True
+        except queue.Full:
+            if limits.cancelled.is_set():
+                return False
+
+
+def _match_globs(rel_path, name, patterns):
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel_path, p) for p in patterns)
+
+
+class ContentSearcher:
+    """文件内容搜索器"""
+
+    def __init__(self, workers=4, max_concurrent=2):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    @staticmethod
+    def compile_pattern(pattern, use_regex=False, case_sensitive=False):
+        """编译搜索表达式，按字节匹配以便直接在mmap上搜索"""
+        source = pattern.encode('utf-8')
+        if not use_regex:
+            source = re.escape(source)
+        flags = re.MULTILINE if case_sensitive else re.MULTILINE | re.IGNORECASE
+        return re.compile(source, flags)
+
+    def _iter_files(self, root, include, exclude, max_file_size, limits):
+        """遍历目录，产出符合过滤条件的文件路径和大小"""
+        stack = [root]
+        while stack and not limits.should_stop():
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                rel_path = os.path.relpath(entry.path, root)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not (exclude and _match_globs(rel_path, entry.name, exclude)):
+                            stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    size = entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+                if include and not _match_globs(rel_path, entry.name, include):
+                    continue
+                if exclude and _match_globs(rel_path, entry.name, exclude):
+                    continue
+                if size == 0 or size > max_file_size:
+                    limits.skip_file()
+                    continue
+                yield entry.path, size
+
+    def _scan_file(self, path, size, regex, limits, events):
+        """扫描单个文件，把匹配行放入事件队列"""
+        if limits.should_stop() or not limits.reserve_bytes(size):
+            return
+        try:
+            with open(path, 'rb') as f:
+                if b'\0' in f.read(SNIFF_SIZE):
+                    limits.skip_file()
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    line_no = 1
+                    counted = 0
+                    window_start = 0
+                    while window_start < len(mm):
+                        if limits.should_stop():
+                            return
+                        # 窗口结束于换行符之前，单次search不会扫描整个大文件，跨窗口的多行匹配不会被报告
+                        window_end = mm.find(b'\n', window_start + SEARCH_WINDOW)
+                        if window_end < 0:
+                            window_end = len(mm)
+                        pos = window_start
+                        while pos <= window_end:
+                            match = regex.search(mm, pos, window_end)
+                            if not match:
+                                break
+                            start = match.start()
+                            line_start = mm.rfind(b'\n', 0, start) + 1
+                            line_end = mm.find(b'\n', match.end())
+                            if line_end < 0:
+                                line_end = len(mm)
+                            line_no += mm[counted:line_start].count(b'\n')
+                            counted = line_start
+                            if not limits.add_result():
+                                return
+                            text = mm[line_start:min(line_end, line_start + MAX_LINE_LENGTH * 4)].decode('utf-8', errors='replace')
+                            _put_event(events, {
+                                'type': 'match',
+                                'path': path,
+                                'line': line_no,
+                                'column': len(mm[line_start:start].decode('utf-8', errors='replace')) + 1,
+                                'text': text.rstrip('\r')[:MAX_LINE_LENGTH]
+                            }, limits)
+                            # 每行只报告一次，从下一行继续
+                            pos = line_end + 1
+                            if limits.should_stop():
+                                return
+                        window_start = max(pos, window_end + 1)
+        except (OSError, ValueError) as e:
+            logger.debug(f"扫描文件 {path} 失败: {str(e)}")
+            limits.skip_file()
+
+    @staticmethod
+    def _init_worker():
+        try:
+            apply_sched_profile(SEARCH_SCHED_PROFILE, threading.get_native_id())
+        except Exception:
+            pass
+
+    def search(self, root, regex, include=None, exclude=None, max_results=500, max_bytes=512 * 1024 * 1024,
+               timeout=30, max_file_size=50 * 1024 * 1024):
+        """执行搜索，以生成器形式逐条产出事件（match/progress/done）
+
+        调用方关闭生成器（如客户端断开）时会取消剩余的扫描任务
+        """
+        limits = SearchLimits(max_results, max_bytes, timeout)
+        events = queue.Queue(maxsize=1000)
+
+        if not self._slots.acquire(timeout=5):
+            yield {'type': 'error', 'message': '当前进行中的搜索过多，请稍后再试'}
+            return
+
+        def producer():
+            try:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                           initializer=self._init_worker) as executor:
+                    pending = set()
+                    for path, size in self._iter_files(root, include, exclude, max_file_size, limits):
+                        pending.add(executor.submit(self._scan_file, path, size, regex, limits, events))
+                        # 控制排队任务数量，避免遍历远超扫描进度
+                        if len(pending) >= self.workers * 4:
+                            _, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        if limits.should_stop():
+                            break
+                    if limits.cancelled.is_set():
+                        for future in pending:
+                            future.cancel()
+            except Exception as e:
+                logger.error(f"内容搜索出错: {str(e)}")
+                _put_event(events, {'type': 'error', 'message': str(e)}, limits)
+            finally:
+                _put_event(events, None, limits)
+
+        started = time.monotonic()
+        producer_thread = threading.Thread(target=producer, daemon=True)
+        producer_thread.start()
+        last_progress = started
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=1)
+                except queue.Empty:
+                    # 结束标记可能因达到上限而被丢弃
+                    if not producer_thread.is_alive():
+                        break
+                    event = {}
+                if event is None:
+                    break
+                if event:
+                    yield event
+                now = time.monotonic()
+                if now - last_progress >= 1:
+                    last_progress = now
+                    yield {'type': 'progress', 'files_scanned': limits.files_scanned,
+                           'bytes_scanned': limits.bytes_scanned, 'results': limits.results}
+            yield {
+                'type': 'done',
+                'files_scanned': limits.files_scanned,
+                'files_skipped': limits.files_skipped,
+                'bytes_scanned': limits.bytes_scanned,
+                'results': limits.results,
+                'elapsed': round(time.monotonic() - started, 3),
+                'stopped': limits.stop_reason
+            }
+        finally:
+            limits.stop(limits.stop_reason or 'cancelled')
+            self._slots.release()
+
+
+# 创建全局内容搜索器实例
+content_searcher = ContentSearcher()
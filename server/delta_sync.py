@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量同步模块（rsync算法）
+服务器为目标目录中的文件生成分块签名（弱校验Adler-32 + 强校验BLAKE2b-128），客户端用滚动校验在本地文件中
+查找相同的块，只上传差异：复制旧文件中的块或写入新数据。服务器按增量流在目标文件旁重建临时文件，
+校验整个文件的SHA-256后原子替换，中途失败不会破坏原文件
+
+增量流格式（整数均为大端序）：
+    b'GSMDELTA' 版本(1字节，当前为1)
+    之后是若干记录，每条以1字节类型开头：
+    F  路径长度(u16) 路径(UTF-8，相对目标目录) 大小(u64) 块大小(u32) mtime纳秒(u64，0表示不设置) 权限(u32，0表示不变)
+       —— 开始重建一个文件，块大小必须与签名中该文件的块大小一致
+    C  起始块号(u32) 块数(u32)         —— 复制旧文件中连续的若干块
+    L  长度(u32) 数据                  —— 写入新数据
+    E  SHA-256(32字节)                 —— 结束当前文件，校验后替换
+    M  路径长度(u16) 路径              —— 创建目录
+    D  路径长度(u16) 路径              —— 删除文件或目录
+    Z                                  —— 流结束
+"""
+
+import os
+import math
+import zlib
+import uuid
+import base64
+import shutil
+import struct
+import hashlib
+import logging
+
+from archive_extract import safe_target_path, UnsafeEntryError
+
+logger = logging.getLogger("delta_sync")
+
+DELTA_MAGIC = b'GSMDELTA'
+DELTA_VERSION = 1
+
+# 默认块大小取文件大小的平方根（与rsync相同），限制在以下范围内并按1KB对齐
+MIN_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 128 * 1024
+
+STRONG_DIGEST_SIZE = 16
+BLOCK_RECORD = struct.Struct(f'>I{STRONG_DIGEST_SIZE}s')
+
+# 单条新数据记录的上限
+MAX_LITERAL_SIZE = 64 * 1024 * 1024
+
+READ_SIZE = 1024 * 1024
+
+
+class DeltaError(Exception):
+    """增量流格式错误，无法继续"""
+
+
+class _FileError(Exception):
+    """单个文件重建失败，增量流仍可继续"""
+
+
+def default_block_size(size):
+    block_size = int(math.sqrt(size)) if size else MIN_BLOCK_SIZE
+    block_size = (block_size + 1023) // 1024 * 1024
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, block_size))
+
+
+def file_signature(path, block_size=None):
+    """生成文件的分块签名，blocks为每块 (Adler-32, BLAKE2b-128) 紧凑排列后的base64"""
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        block_size = block_size or default_block_size(st.st_size)
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        packed = bytearray()
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            packed += BLOCK_RECORD.pack(zlib.adler32(block),
+                                        hashlib.blake2b(block, digest_size=STRONG_DIGEST_SIZE).digest())
+    return {
+        'size': st.st_size,
+        'block_size': block_size,
+        'block_count': len(packed) // BLOCK_RECORD.size,
+        'blocks': base64.b64encode(bytes(packed)).decode('ascii')
+    }
+
+
+def tree_signatures(root, files=None, include_blocks=True, block_size=None):
+    """列出目录中的文件（大小、mtime），include_blocks时附带分块签名；files为相对路径时只处理这些文件"""
+    if os.path.isfile(root):
+        entries = [(os.path.basename(root), root)]
+        directories = []
+    else:
+        entries = []
+        directories = []
+        if files is None:
+            for current, dirs, names in os.walk(root):
+                dirs.sort()
+                for name in dirs:
+                    if os.path.islink(os.path.join(current, name)):
+                        continue
+                    directories.append(os.path.relpath(os.path.join(current, name), root))
+                for name in sorted(names):
+                    path = os.path.join(current, name)
+                    if os.path.isfile(path) and not os.path.islink(path):
+                        entries.append((os.path.relpath(path, root), path))
+        else:
+            for relative in files:
+                entries.append((relative, safe_target_path(root, relative)))
+
+    result = []
+    for relative, path in entries:
+        try:
+            st = os.stat(path)
+            info = {'path': relative, 'size': st.st_size, 'mtime': st.st_mtime, 'mtime_ns': st.st_mtime_ns,
+                    'mode': oct(st.st_mode & 0o7777)}
+            if include_blocks:
+                info.update(file_signature(path, block_size))
+        except FileNotFoundError:
+            info = {'path': relative, 'missing': True}
+        result.append(info)
+    return {'files': result, 'directories': directories}
+
+
+class _CopyWriter:
+    """把旧文件的块或新数据写入临时文件"""
+
+    def __init__(self, old_fd, out_fd):
+        self.old_fd = old_fd
+        self.out_fd = out_fd
+        self.offset = 0
+        self.copied = 0
+        self.literal = 0
+        self.use_copy_range = True
+
+    def copy(self, offset, length):
+        end = offset + length
+        while offset < end:
+            count = min(end - offset, 64 * 1024 * 1024)
+            copied = 0
+            if self.use_copy_range:
+                try:
+                    # 同一文件系统内由内核复制，btrfs/XFS上可能直接共享数据块
+                    copied = os.copy_file_range(self.old_fd, self.out_fd, count, offset, self.offset)
+                except OSError:
+                    self.use_copy_range = False
+            if not copied:
+                data = os.pread(self.old_fd, min(count, READ_SIZE), offset)
+                if not data:
+                    raise _FileError('复制的块超出了旧文件的范围')
+                copied = os.pwrite(self.out_fd, data, self.offset)
+            offset += copied
+            self.offset += copied
+            self.copied += copied
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.out_fd, view, self.offset)
+            view = view[written:]
+            self.offset += written
+            self.literal += written
+
+
+class DeltaApplier:
+    """读取增量流并在root下重建文件
+
+    remove: 删除路径的函数（例如移入回收站），默认直接删除
+    """
+
+    def __init__(self, root, stream, remove=None):
+        self.root = os.path.normpath(root)
+        self.stream = stream
+        self.remove = remove or self._remove
+        self.results = []
+        self.bytes_received = 0
+
+    def _read(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.stream.read(size - len(data))
+            if not chunk:
+                raise DeltaError('增量流意外结束')
+            data += chunk
+        self.bytes_received += size
+        return bytes(data)
+
+    def _read_struct(self, fmt):
+        return struct.unpack(fmt, self._read(struct.calcsize(fmt)))
+
+    def _read_path(self):
+        length, = self._read_struct('>H')
+        return self._read(length).decode('utf-8')
+
+    @staticmethod
+    def _remove(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    def _target_path(self, relative):
+        """条目在同步目录中的路径；空路径、'.'、'a/..'等会解析为同步目录本身，不能作为条目"""
+        path = safe_target_path(self.root, relative)
+        if path == self.root:
+            raise UnsafeEntryError(f"路径指向同步目录本身: {relative!r}")
+        return path
+
+    def apply(self):
+        """处理整个增量流，返回每个路径的结果；流格式错误时抛出DeltaError（已完成的文件保留）"""
+        header = self._read(len(DELTA_MAGIC) + 1)
+        if header[:len(DELTA_MAGIC)] != DELTA_MAGIC:
+            raise DeltaError('不是有效的增量流')
+        if header[-1] != DELTA_VERSION:
+            raise DeltaError(f'不支持的增量流版本: {header[-1]}')
+
+        while True:
+            record, = self._read_struct('>c')
+            if record == b'Z':
+                return self.results
+            if record == b'F':
+                self._apply_file()
+            elif record in (b'M', b'D'):
+                relative = self._read_path()
+                try:
+                    path = self._target_path(relative)
+                    if record == b'M':
+                        os.makedirs(path, exist_ok=True)
+                        self.results.append({'path': relative, 'status': 'created'})
+                    elif os.path.lexists(path):
+                        self.remove(path)
+                        self.results.append({'path': relative, 'status': 'deleted'})
+                except (UnsafeEntryError, OSError) as e:
+                    self.results.append({'path': relative, 'status': 'error', 'message': str(e)})
+            else:
+                raise DeltaError(f'未知的记录类型: {record!r}')
+
+    def _apply_file(self):
+        relative = self._read_path()
+        size, block_size, mtime_ns, mode = self._read_struct('>QIQI')
+        try:
+            target = self._target_path(relative)
+        except UnsafeEntryError as e:
+            # 仍需读完该文件的记录
+            target = None
+            error = str(e)
+        if block_size <= 0:
+            raise DeltaError(f'{relative}: 无效的块大小')
+
+        old_fd = out_fd = None
+        temp_path = None
+        writer = None
+        if target is not None:
+            try:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if os.path.isfile(target):
+                    old_fd = os.open(target, os.O_RDONLY)
+                    existing = os.fstat(old_fd)
+                else:
+                    existing = None
+                temp_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.sync-{uuid.uuid4().hex[:8]}")
+                out_fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+                os.fchmod(out_fd, mode & 0o7777 or (existing.st_mode & 0o7777 if existing else 0o644))
+                writer = _CopyWriter(old_fd, out_fd)
+            except OSError as e:
+                error = str(e)
+                target = None
+
+        digest = hashlib.sha256()
+        ended = False
+        try:
+            while True:
+                record, = self._read_struct('>c')
+                if record == b'C':
+                    index, count = self._read_struct('>II')
+                    if writer is None:
+                        continue
+                    if old_fd is None:
+                        raise _FileError('目标文件不存在，不能复制旧数据块')
+                    offset = index * block_size
+                    if not count or offset >= existing.st_size:
+                        raise _FileError(f'复制的块超出了旧文件的范围: {index}')
+                    start = writer.offset
+                    writer.copy(offset, min(count * block_size, existing.st_size - offset))
+                    self._digest_range(digest, out_fd, start, writer.offset)
+                elif record == b'L':
+                    length, = self._read_struct('>I')
+                    if length > MAX_LITERAL_SIZE:
+                        raise DeltaError(f'{relative}: 数据记录过大')
+                    remaining = length
+                    while remaining:
+                        data = self._read(min(remaining, READ_SIZE))
+                        remaining -= len(data)
+                        if writer is not None:
+                            writer.write(data)
+                            digest.update(data)
+                elif record == b'E':
+                    expected = self._read(32)
+                    ended = True
+                    break
+                else:
+                    raise DeltaError(f'{relative}: 文件记录中出现未知类型 {record!r}')
+            if writer is None:
+                self.results.append({'path': relative, 'status': 'error', 'message': error})
+                return
+            if writer.offset != size or digest.digest() != expected:
+                raise _FileError('重建后的文件校验失败（旧文件可能在生成签名后被修改），请重新获取签名')
+
+            if existing:
+                try:
+                    os.fchown(out_fd, existing.st_uid, existing.st_gid)
+                except PermissionError:
+                    pass
+            os.fsync(out_fd)
+            os.close(out_fd)
+            out_fd = None
+            if mtime_ns:
+                os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+            os.replace(temp_path, target)
+            temp_path = None
+            dir_fd = os.open(os.path.dirname(target), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            self.results.append({'path': relative, 'status': 'updated' if existing else 'created', 'size': size,
+                                 'copied_bytes': writer.copied, 'literal_bytes': writer.literal})
+        except _FileError as e:
+            self.results.append({'path': relative, 'status': 'error', 'message': str(e)})
+            if not ended:
+                # 跳过该文件剩余的记录
+                self._skip_file()
+        finally:
+            if out_fd is not None:
+                os.close(out_fd)
+            if old_fd is not None:
+                os.close(old_fd)
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def _digest_range(digest, fd, start, end):
+        while start < end:
+            data = os.pread(fd, min(end - start, READ_SIZE), start)
+            if not data:
+                break
+            digest.update(data)
+            start += len(data)
+
+    def _skip_file(self):
+        while True:
+            record, = self._read_struct('>c')
+            if record == b'C':
+                self._read(8)
+            elif record == b'L':
+                length, = self._read_struct('>I')
+                while length:
+                    length -= len(self._read(min(length, READ_SIZE)))
+            elif record == b'E':
+                self._read(32)
+                return
+            else:
+                raise DeltaError(f'文件记录中出现未知类型 {record!r}')
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快速复制模块
+按 FICLONE 引用链接（btrfs/XFS）-> copy_file_range -> sendfile -> 缓冲读写 的顺序选择复制方式，
+稀疏文件只复制数据段并保留空洞，目录中的文件由线程池并行复制；
+复制先写入目标旁的临时路径，完成后再替换已有的目标，失败或取消时不会破坏原来的目标
+"""
+
+import os
+import time
+import uuid
+import errno
+import fcntl
+import shutil
+import logging
+import threading
+import concurrent.futures
+
+from trash_manager import trash_manager
+
+logger = logging.getLogger("fast_copy")
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# 单次copy_file_range/sendfile的最大字节数，同时决定进度回调和取消检查的粒度
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+BUFFER_SIZE = 1024 * 1024
+
+STRATEGIES = ('reflink', 'copy_file_range', 'sendfile', 'buffered')
+
+# 这些错误表示当前文件系统或内核不支持该复制方式，应回退到下一种
+UNSUPPORTED_ERRNOS = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM}
+
+
+class CopyAborted(Exception):
+    """其他线程出错或任务取消后，停止剩余的复制"""
+
+
+class FastCopier:
+    """快速复制器"""
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        # 不支持某种复制方式的 (源设备, 目标设备)，避免每个文件都重试
+        self._unsupported = set()
+
+    def _supported(self, strategy, src_dev, dst_dev):
+        return (strategy, src_dev, dst_dev) not in self._unsupported
+
+    def _mark_unsupported(self, strategy, src_dev, dst_dev, error):
+        key = (strategy, src_dev, dst_dev)
+        if key not in self._unsupported:
+            self._unsupported.add(key)
+            logger.debug(f"设备 {src_dev}->{dst_dev} 不支持 {strategy}: {str(error)}")
+
+    @staticmethod
+    def _data_segments(fd, size, st):
+        """返回文件的数据段 [(偏移, 长度)]；非稀疏文件或不支持SEEK_DATA时返回整个文件"""
+        if st.st_blocks * 512 >= size:
+            return [(0, size)], False
+        segments = []
+        offset = 0
+        try:
+            while offset < size:
+                try:
+                    start = os.lseek(fd, offset, os.SEEK_DATA)
+                except OSError as e:
+                    if e.errno == errno.ENXIO:
+                        # 之后全是空洞
+                        break
+                    raise
+                end = os.lseek(fd, start, os.SEEK_HOLE)
+                segments.append((start, min(end, size) - start))
+                offset = end
+        except OSError:
+            return [(0, size)], False
+        return segments, True
+
+    def _copy_range(self, strategy, src_fd, dst_fd, offset, length, advance):
+        """用指定方式复制一段数据"""
+        end = offset + length
+        while offset < end:
+            count = min(COPY_CHUNK_SIZE if strategy != 'buffered' else BUFFER_SIZE, end - offset)
+            if strategy == 'copy_file_range':
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+            elif strategy == 'sendfile':
+                os.lseek(dst_fd, offset, os.SEEK_SET)
+                copied = os.sendfile(dst_fd, src_fd, offset, count)
+            else:
+                data = os.pread(src_fd, count, offset)
+                copied = 0
+                view = memoryview(data)
+                while copied < len(data):
+                    copied += os.pwrite(dst_fd, view[copied:], offset + copied)
+            if copied == 0:
+                # 复制过程中源文件被截断
+                break
+            offset += copied
+            advance(copied)
+
+    def copy_file(self, source, destination, advance=None):
+        """复制单个文件并保留权限和时间戳，返回 (使用的复制方式, 是否为稀疏文件)"""
+        advance = advance or (lambda count: None)
+        st = os.stat(source)
+        dst_dev = os.stat(os.path.dirname(destination) or '.').st_dev
+        src_fd = os.open(source, os.O_RDONLY)
+        try:
+            dst_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, st.st_mode & 0o7777)
+            try:
+                strategy, sparse = self._copy_fds(src_fd, dst_fd, st, dst_dev, advance)
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+        shutil.copystat(source, destination)
+        return strategy, sparse
+
+    def _copy_fds(self, src_fd, dst_fd, st, dst_dev, advance):
+        size = st.st_size
+        if size and self._supported('reflink', st.st_dev, dst_dev):
+            try:
+                fcntl.ioctl(dst_fd, FICLONE, src_fd)
+                advance(size)
+                return 'reflink', False
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRNOS:
+                    raise
+                self._mark_unsupported('reflink', st.st_dev, dst_dev, e)
+
+        segments, sparse = self._data_segments(src_fd, size, st)
+        for strategy in STRATEGIES[1:]:
+            if strategy != 'buffered' and not self._supported(strategy, st.st_dev, dst_dev):
+                continue
+            try:
+                done = [0]
+
+                def counted(count):
+                    done[0] += count
+                    advance(count)
+
+                for offset, length in segments:
+                    self._copy_range(strategy, src_fd, dst_fd, offset, length, counted)
+                # 保留末尾的空洞
+                os.ftruncate(dst_fd, size)
+                return strategy, sparse
+            except OSError as e:
+                if strategy == 'buffered' or e.errno not in UNSUPPORTED_ERRNOS or done[0]:
+                    raise
+                self._mark_unsupported(strategy, st.st_dev, dst_dev, e)
+
+    def _copy_tree(self, source, destination, stats, advance, abort):
+        """把目录复制到不存在的destination，文件并行复制"""
+        copied_dirs = []
+        futures = []
+
+        def copy_one(src, dst):
+            if abort.is_set():
+                raise CopyAborted()
+            strategy, sparse = self.copy_file(src, dst, lambda count: advance(0, count, None))
+            with stats_lock:
+                stats['files'] += 1
+                stats['strategies'][strategy] = stats['strategies'].get(strategy, 0) + 1
+                if sparse:
+                    stats['sparse_files'] += 1
+            advance(1, 0, src)
+
+        stats_lock = threading.Lock()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                for root, dirs, files in os.walk(source):
+                    if abort.is_set():
+                        raise CopyAborted()
+                    target_root = os.path.normpath(os.path.join(destination, os.path.relpath(root, source)))
+                    os.makedirs(target_root, exist_ok=True)
+                    copied_dirs.append((root, target_root))
+                    stats['dirs'] += 1
+                    advance(1, 0, root)
+                    for name in dirs + files:
+                        item = os.path.join(root, name)
+                        target = os.path.join(target_root, name)
+                        if os.path.islink(item):
+                            # os.walk不跟随目录链接，链接一律按链接本身复制
+                            os.symlink(os.readlink(item), target)
+                            stats['symlinks'] += 1
+                            advance(1, 0, None)
+                        elif os.path.isfile(item):
+                            futures.append(executor.submit(copy_one, item, target))
+                        elif not os.path.isdir(item):
+                            logger.warning(f"跳过特殊文件: {item}")
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+                for future in done:
+                    if future.exception():
+                        raise future.exception()
+            except BaseException:
+                abort.set()
+                for future in futures:
+                    future.cancel()
+                raise
+
+        # 最后恢复目录的时间戳和权限，避免被写入子项改变
+        for root, target_root in reversed(copied_dirs):
+            shutil.copystat(root, target_root)
+
+    def copy(self, source, destination, progress=None):
+        """复制文件或目录到destination，已存在的目标在复制成功后才被替换
+
+        progress: 进度回调 progress(条目数, 字节数, 当前路径)，可能在多个线程中调用（已加锁），
+                  抛出异常可中止复制
+        返回统计信息，strategies 记录每种复制方式处理的文件数
+        """
+        if os.path.isdir(source) and os.path.realpath(destination).startswith(os.path.realpath(source).rstrip('/') + '/'):
+            raise ValueError('不能把目录复制到它自己的子目录中')
+        started = time.time()
+        stats = {'files': 0, 'dirs': 0, 'symlinks': 0, 'sparse_files': 0, 'bytes': 0, 'strategies': {}}
+        progress_lock = threading.Lock()
+        abort = threading.Event()
+
+        def advance(items, count, current):
+            with progress_lock:
+                stats['bytes'] += count
+                if progress:
+                    progress(items, count, current)
+
+        parent = os.path.dirname(destination.rstrip('/')) or '/'
+        name = os.path.basename(destination.rstrip('/'))
+        staging = os.path.join(parent, f".{name}.copy-{uuid.uuid4().hex[:8]}")
+        try:
+            if os.path.islink(source):
+                os.symlink(os.readlink(source), staging)
+                stats['symlinks'] += 1
+                advance(1, 0, source)
+            elif os.path.isdir(source):
+                self._copy_tree(source, staging, stats, advance, abort)
+            else:
+                strategy, sparse = self.copy_file(source, staging, lambda count: advance(0, count, None))
+                stats['files'] += 1
+                stats['sparse_files'] += int(sparse)
+                stats['strategies'][strategy] = 1
+                advance(1, 0, source)
+        except BaseException:
+            self._remove(staging)
+            raise
+
+        # 用重命名替换已有的目标，旧目标在替换后交给回收线程删除
+        old = None
+        try:
+            if os.path.lexists(destination):
+                old = os.path.join(parent, f".{name}.old-{uuid.uuid4().hex[:8]}")
+                os.rename(destination, old)
+            os.rename(staging, destination)
+        except BaseException:
+            if old and os.path.lexists(old):
+                os.rename(old, destination)
+            self._remove(staging)
+            raise
+        if old:
+            trash_manager.discard(old)
+
+        stats['elapsed'] = round(time.time() - started, 3)
+        logger.info(f"复制完成: {source} -> {destination}, {stats['files']} 个文件, {stats['bytes']} 字节, "
+                    f"方式: {stats['strategies']}, 用时 {stats['elapsed']} 秒")
+        return stats
+
+    @staticmethod
+    def _remove(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# 创建全局快速复制器实例
+fast_copier = FastCopier()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件哈希模块
+计算 sha1/sha256/sha512（安装了xxhash库时还支持xxh64/xxh3_64/xxh128），多个文件由线程池并行计算，
+一次读取同时计算多种算法；结果按 (设备, inode, 大小, mtime) 缓存并持久化，文件未变化时直接返回。
+工作线程使用较低的CPU和IO优先级，避免影响正在运行的游戏服务器
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+import concurrent.futures
+from collections import OrderedDict
+
+from process_priority import apply_sched_profile
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+logger = logging.getLogger("file_hash")
+
+# 工作线程的调度配置
+HASH_SCHED_PROFILE = {'nice': 10, 'ionice_class': 'best-effort', 'ionice_level': 7}
+
+READ_SIZE = 1024 * 1024
+
+# 大于该大小的文件（备份、归档等）读完后从页缓存中丢弃，避免挤掉游戏服务器常用的数据
+DROP_CACHE_SIZE = 256 * 1024 * 1024
+
+# 展开目录时最多处理的文件数
+MAX_FILES = 10000
+
+HASHLIB_ALGORITHMS = ('sha1', 'sha256', 'sha512')
+XXHASH_ALGORITHMS = {'xxh64': 'xxh64', 'xxh3_64': 'xxh3_64', 'xxh128': 'xxh3_128'}
+ALIASES = {'xxhash': 'xxh64', 'sha-1': 'sha1', 'sha-256': 'sha256', 'sha-512': 'sha512'}
+
+
+class HashError(Exception):
+    """哈希计算请求错误"""
+
+
+class FileChangedError(Exception):
+    """文件在计算过程中被修改"""
+
+
+def available_algorithms():
+    return list(HASHLIB_ALGORITHMS) + (list(XXHASH_ALGORITHMS) if xxhash else [])
+
+
+def normalize_algorithms(algorithms):
+    """检查并统一算法名称，返回去重后的列表"""
+    if isinstance(algorithms, str):
+        algorithms = algorithms.split(',')
+    result = []
+    for name in algorithms or ['sha256']:
+        name = ALIASES.get(name.strip().lower(), name.strip().lower())
+        if name in XXHASH_ALGORITHMS and xxhash is None:
+            raise HashError(f'未安装xxhash库，不支持 {name}')
+        if name not in HASHLIB_ALGORITHMS and name not in XXHASH_ALGORITHMS:
+            raise HashError(f"不支持的算法: {name}，可用算法: {', '.join(available_algorithms())}")
+        if name not in result:
+            result.append(name)
+    return result
+
+
+def _new_hasher(name):
+    if name in XXHASH_ALGORITHMS:
+        return getattr(xxhash, XXHASH_ALGORITHMS[name])()
+    return hashlib.new(name)
+
+
+class FileHasher:
+    """文件哈希计算服务"""
+
+    def __init__(self, workers=4, cache_file='/home/steam/server/hash_cache.json', max_cache_entries=20000):
+        self.workers = workers
+        self.cache_file = cache_file
+        self.max_cache_entries = max_cache_entries
+        self._cache = OrderedDict()  # "设备:inode:大小:mtime_ns" -> {算法: 摘要}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._loaded = False
+        self._dirty = False
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_hashed': 0}
+
+    def _get_executor(self):
+        """线程池按进程创建（兼容gunicorn的preload模式）"""
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._load()
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='file-hash', initializer=self._init_worker)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    @staticmethod
+    def _init_worker():
+        try:
+            apply_sched_profile(HASH_SCHED_PROFILE, threading.get_native_id())
+        except Exception as e:
+            logger.debug(f"设置哈希线程优先级失败: {str(e)}")
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                for key, digests in json.load(f):
+                    self._cache[key] = digests
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取哈希缓存失败: {str(e)}")
+
+    def _save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            records = list(self._cache.items())
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            temp_path = self.cache_file + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f)
+            os.replace(temp_path, self.cache_file)
+        except Exception as e:
+            logger.warning(f"保存哈希缓存失败: {str(e)}")
+
+    @staticmethod
+    def _cache_key(st):
+        return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+    def _cached(self, st, algorithms):
+        with self._lock:
+            self._load()
+            digests = self._cache.get(self._cache_key(st))
+            if digests is None:
+                return {}
+            self._cache.move_to_end(self._cache_key(st))
+            return {name: digests[name] for name in algorithms if name in digests}
+
+    def _store(self, st, digests):
+        key = self._cache_key(st)
+        with self._lock:
+            self._cache.setdefault(key, {}).update(digests)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+            self._dirty = True
+
+    def _compute(self, path, algorithms, advance):
+        """读取一遍文件，同时计算多种算法，返回 (stat, {算法: 摘要})"""
+        hashers = {name: _new_hasher(name) for name in algorithms}
+        buffer = bytearray(READ_SIZE)
+        view = memoryview(buffer)
+        with open(path, 'rb', buffering=0) as f:
+            fd = f.fileno()
+            before = os.fstat(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            done = 0
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                chunk = view[:count]
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+                done += count
+                advance(count)
+            if before.st_size >= DROP_CACHE_SIZE:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            after = os.fstat(fd)
+        if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns) or done != before.st_size:
+            raise FileChangedError()
+        return after, {name: hasher.hexdigest() for name, hasher in hashers.items()}
+
+    def hash_file(self, path, algorithms, advance=None):
+        """计算单个文件的哈希，返回结果字典；未变化的文件使用缓存"""
+        advance = advance or (lambda count: None)
+        st = os.stat(path)
+        digests = self._cached(st, algorithms)
+        missing = [name for name in algorithms if name not in digests]
+        cached = not missing
+        if missing:
+            computed = None
+            for attempt in range(2):
+                try:
+                    current, computed = self._compute(path, missing, advance)
+                except FileChangedError:
+                    continue
+                if self._cache_key(current) == self._cache_key(st) or len(missing) == len(algorithms):
+                    break
+                # 查询缓存之后文件被修改，缓存中的摘要已经失效
+                st, digests, missing, computed = current, {}, list(algorithms), None
+            if computed is None:
+                raise RuntimeError('文件在计算过程中被修改')
+            st = current
+            self._store(st, computed)
+            digests.update(computed)
+            with self._lock:
+                self.stats['misses'] += 1
+                self.stats['bytes_hashed'] += st.st_size
+        else:
+            advance(st.st_size)
+            with self._lock:
+                self.stats['hits'] += 1
+        return {
+            'path': path,
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'hashes': {name: digests[name] for name in algorithms},
+            'cached': cached
+        }
+
+    @staticmethod
+    def expand_paths(paths, recursive=False):
+        """把目录展开为其中的文件（不跟随符号链接），返回 (文件列表, 错误列表)"""
+        files = []
+        errors = []
+        for path in paths:
+            if os.path.isdir(path):
+                if not recursive:
+                    errors.append({'path': path, 'error': '路径是目录，需要 recursive 参数'})
+                    continue
+                for root, dirs, names in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(names):
+                        file_path = os.path.join(root, name)
+                        if os.path.isfile(file_path) and not os.path.islink(file_path):
+                            files.append(file_path)
+            elif os.path.isfile(path):
+                files.append(path)
+            else:
+                errors.append({'path': path, 'error': '文件不存在'})
+            if len(files) > MAX_FILES:
+                raise HashError(f'文件数超过上限 {MAX_FILES}')
+        return files, errors
+
+    def hash_paths(self, files, algorithms, progress=None):
+        """并行计算多个文件的哈希，结果顺序与files一致
+
+        progress: 进度回调 progress(文件数, 字节数, 当前路径)，已加锁，抛出异常可中止计算
+        """
+        executor = self._get_executor()
+        progress_lock = threading.Lock()
+        abort = threading.Event()
+
+        def report(items, count, current):
+            if abort.is_set():
+                raise concurrent.futures.CancelledError()
+            if progress:
+                with progress_lock:
+                    progress(items, count, current)
+
+        def run(path):
+            try:
+                result = self.hash_file(path, algorithms, lambda count: report(0, count, None))
+            except (OSError, RuntimeError) as e:
+                result = {'path': path, 'error': str(e)}
+            report(1, 0, path)
+            return result
+
+        futures = [executor.submit(run, path) for path in files]
+        try:
+            results = [future.result() for future in futures]
+        except BaseException:
+            abort.set()
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            self._save()
+        return results
+
+    def get_status(self):
+        with self._lock:
+            return dict(self.stats, cache_entries=len(self._cache), algorithms=available_algorithms())
+
+
+# 创建全局文件哈希服务实例
+file_hasher = FileHasher()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名索引模块
+在后台把文件树写入SQLite（支持时使用FTS5 trigram），按目录mtime增量重扫保持更新，
+为文件管理器搜索提供前缀、子串和通配符查询
+"""
+
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+from process_priority import apply_sched_profile
+
+logger = logging.getLogger("file_index")
+
+# 索引线程使用低CPU和空闲IO优先级，避免影响游戏服务器
+INDEXER_SCHED_PROFILE = {'nice': 10, 'ionice_class': 'idle'}
+
+GLOB_CHARS = set('*?[')
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _scope_bounds(scope):
+    """返回路径范围查询的上下界，'/'之后的字符是'0'，因此 [scope/, scope0) 覆盖整个子树"""
+    scope = scope.rstrip('/')
+    return scope + '/', scope + '0'
+
+
+class FileIndex:
+    """文件名索引"""
+
+    def __init__(self, db_path='/home/steam/server/file_index.db', roots=('/home/steam',), rescan_interval=60):
+        self.db_path = db_path
+        self.roots = [root.rstrip('/') or '/' for root in roots]
+        # 数据库所在目录不建立索引：每次提交都会改变该目录的mtime，导致每轮都重新扫描并把数据库文件本身写入索引
+        self.excluded_dir = os.path.dirname(os.path.abspath(db_path))
+        self.rescan_interval = rescan_interval
+        self.fts_enabled = False
+        self.ready = False
+        self.last_scan = None
+        self.last_scan_duration = None
+        self._local = threading.local()
+        self._worker_pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = self._connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                parent TEXT NOT NULL,
+                name TEXT NOT NULL,
+                is_dir INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS files_parent ON files(parent);
+            CREATE INDEX IF NOT EXISTS files_name ON files(name COLLATE NOCASE);
+        ''')
+        try:
+            conn.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+                    name, content='files', content_rowid='id', tokenize='trigram'
+                );
+                CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+                    INSERT INTO files_fts(rowid, name) VALUES (new.id, new.name);
+                END;
+                CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+                    INSERT INTO files_fts(files_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                END;
+                CREATE TRIGGER IF NOT EXISTS files_au AFTER UPDATE ON files BEGIN
+                    INSERT INTO files_fts(files_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                    INSERT INTO files_fts(rowid, name) VALUES (new.id, new.name);
+                END;
+            ''')
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite不支持FTS5 trigram，搜索将使用LIKE: {str(e)}")
+            self.fts_enabled = False
+        # 清除旧版本为数据库所在目录建立的记录
+        low, high = _scope_bounds(self.excluded_dir)
+        conn.execute('DELETE FROM files WHERE path >= ? AND path < ?', (low, high))
+        conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (self.excluded_dir, low, high))
+        conn.commit()
+
+    def ensure_started(self):
+        """确保当前进程中的索引线程已启动"""
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                threading.Thread(target=self._worker, daemon=True).start()
+                self._worker_pid = os.getpid()
+
+    def request_rescan(self):
+        """立即触发一次增量重扫"""
+        self._wakeup.set()
+
+    def _worker(self):
+        try:
+            apply_sched_profile(INDEXER_SCHED_PROFILE, threading.get_native_id())
+        except Exception as e:
+            logger.debug(f"设置索引线程优先级失败: {str(e)}")
+        try:
+            self._init_db()
+        except Exception as e:
+            logger.error(f"初始化文件索引数据库失败: {str(e)}")
+            return
+        while True:
+            started = time.time()
+            try:
+                for root in self.roots:
+                    if os.path.isdir(root):
+                        self._scan_tree(root)
+                self.ready = True
+                self.last_scan = time.time()
+                self.last_scan_duration = round(self.last_scan - started, 3)
+            except Exception as e:
+                logger.error(f"扫描文件索引失败: {str(e)}")
+            self._wakeup.wait(self.rescan_interval)
+            self._wakeup.clear()
+
+    def _scan_tree(self, root):
+        """从root开始遍历目录，只重新读取mtime发生变化的目录"""
+        conn = self._connect()
+        known = dict(conn.execute('SELECT path, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)',
+                                  (root,) + _scope_bounds(root)))
+        seen = set()
+        stack = [root]
+        pending = 0
+        while stack:
+            path = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(path)
+
+            if known.get(path) == mtime_ns:
+                # 目录未变化，只需继续检查子目录
+                stack.extend(row[0] for row in conn.execute('SELECT path FROM files WHERE parent = ? AND is_dir = 1', (path,))
+                             if row[0] != self.excluded_dir)
+                continue
+
+            rows = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.name.startswith('.'):
+                            continue
+                        try:
+                            entry.path.encode('utf-8')
+                        except UnicodeEncodeError:
+                            # SQLite无法保存非UTF-8文件名
+                            continue
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        rows.append((entry.path, path, entry.name, 1 if is_dir else 0, 0 if is_dir else st.st_size, st.st_mtime))
+                        if is_dir and entry.path != self.excluded_dir:
+                            stack.append(entry.path)
+            except OSError as e:
+                logger.debug(f"无法读取目录 {path}: {str(e)}")
+                continue
+
+            current = {row[0]: row[3] for row in rows}
+            for (old_path, old_is_dir) in conn.execute('SELECT path, is_dir FROM files WHERE parent = ?', (path,)).fetchall():
+                if current.get(old_path) != old_is_dir:
+                    # 已删除，或目录和文件类型发生了变化
+                    self._remove_path(conn, old_path, old_is_dir)
+            conn.executemany('''
+                INSERT INTO files(path, parent, name, is_dir, size, mtime) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET is_dir = excluded.is_dir, size = excluded.size, mtime = excluded.mtime
+                WHERE is_dir != excluded.is_dir OR size != excluded.size OR mtime != excluded.mtime
+            ''', rows)
+            conn.execute('INSERT OR REPLACE INTO dirs(path, mtime_ns) VALUES (?, ?)', (path, mtime_ns))
+
+            pending += len(rows) + 1
+            if pending >= 5000:
+                conn.commit()
+                pending = 0
+
+        # 清理已经不存在的目录记录
+        for path in set(known) - seen:
+            conn.execute('DELETE FROM dirs WHERE path = ?', (path,))
+        conn.commit()
+
+    def _remove_path(self, conn, path, is_dir):
+        conn.execute('DELETE FROM files WHERE path = ?', (path,))
+        if is_dir:
+            low, high = _scope_bounds(path)
+            conn.execute('DELETE FROM files WHERE path >= ? AND path < ?', (low, high))
+            conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+
+    def covers(self, path):
+        """判断路径是否在已建立索引的范围内"""
+        if not self.ready:
+            return False
+        path = path.rstrip('/') or '/'
+        if path == self.excluded_dir or path.startswith(self.excluded_dir + '/'):
+            return False
+        return any(path == root or path.startswith(root.rstrip('/') + '/') for root in self.roots)
+
+    def search(self, query, scope, item_type='all', case_sensitive=False, mode=None, limit=100):
+        """查询索引，返回 (结果列表, 是否被截断)
+
+        mode: substring（默认）、prefix 或 glob，查询中包含 * ? [ 时自动使用glob
+        """
+        if mode is None:
+            mode = 'glob' if GLOB_CHARS & set(query) else 'substring'
+
+        conditions = []
+        params = []
+        scope = scope.rstrip('/') or '/'
+        if scope != '/':
+            low, high = _scope_bounds(scope)
+            conditions.append('files.path >= ? AND files.path < ?')
+            params.extend([low, high])
+        if item_type == 'file':
+            conditions.append('files.is_dir = 0')
+        elif item_type == 'directory':
+            conditions.append('files.is_dir = 1')
+
+        source = 'files'
+        if mode == 'glob':
+            if case_sensitive:
+                conditions.append('files.name GLOB ?')
+                params.append(query)
+            else:
+                conditions.append('lower(files.name) GLOB ?')
+                params.append(query.lower())
+        elif mode == 'prefix':
+            conditions.append("files.name LIKE ? ESCAPE '\\'")
+            params.append(_escape_like(query) + '%')
+        elif self.fts_enabled and len(query) >= 3:
+            source = 'files_fts JOIN files ON files.id = files_fts.rowid'
+            conditions.append('files_fts MATCH ?')
+            params.append('"' + query.replace('"', '""') + '"')
+        else:
+            conditions.append("files.name LIKE ? ESCAPE '\\'")
+            params.append('%' + _escape_like(query) + '%')
+
+        sql = f'''SELECT files.path, files.parent, files.name, files.is_dir, files.size, files.mtime FROM {source}
+                  WHERE {' AND '.join(conditions)} ORDER BY files.is_dir DESC, files.name'''
+
+        results = []
+        truncated = False
+        needle = query if case_sensitive else query.lower()
+        for path, parent, name, is_dir, size, mtime in self._connect().execute(sql, params):
+            # LIKE和trigram不区分大小写，区分大小写时需要再过滤一次
+            if case_sensitive and mode == 'substring' and needle not in name:
+                continue
+            if case_sensitive and mode == 'prefix' and not name.startswith(needle):
+                continue
+            if len(results) >= limit:
+                truncated = True
+                break
+            results.append({
+                'name': name,
+                'path': path,
+                'relative_path': os.path.relpath(path, scope),
+                'type': 'directory' if is_dir else 'file',
+                'size': size,
+                'modified': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime)),
+                'parent_dir': parent
+            })
+        return results, truncated
+
+    def get_status(self):
+        status = {
+            'ready': self.ready,
+            'fts_enabled': self.fts_enabled,
+            'roots': self.roots,
+            'last_scan': self.last_scan,
+            'last_scan_duration': self.last_scan_duration,
+            'entries': None
+        }
+        if self.ready:
+            status['entries'] = self._connect().execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        return status
+
+
+# 创建全局文件索引实例
+file_index = FileIndex()
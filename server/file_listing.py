@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录列表模块
+基于os.scandir读取目录，按目录mtime缓存排序结果，并提供过滤、游标分页和ETag
+"""
+
+import os
+import time
+import json
+import base64
+import hashlib
+import logging
+import threading
+import collections
+
+logger = logging.getLogger("file_listing")
+
+SORT_FIELDS = ('name', 'size', 'modified', 'type')
+
+
+def _scan_directory(path):
+    """扫描目录，返回条目列表"""
+    items = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                stat_result = entry.stat()
+                is_dir = entry.is_dir()
+            except OSError:
+                # 失效的符号链接等，退回到链接本身的信息
+                try:
+                    stat_result = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                is_dir = False
+            items.append({
+                'name': entry.name,
+                'path': entry.path,
+                'type': 'directory' if is_dir else 'file',
+                'size': 0 if is_dir else stat_result.st_size,
+                'modified': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat_result.st_mtime)),
+                '_mtime': stat_result.st_mtime
+            })
+    return items
+
+
+def _content_digest(items):
+    """根据条目名称、大小和修改时间计算摘要，用于发现目录mtime不变时的文件内容变化"""
+    digest = hashlib.blake2b(digest_size=8)
+    for item in items:
+        digest.update(f"{item['name']}\0{item['type']}\0{item['size']}\0{item['_mtime']}\n".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+def encode_cursor(name, offset):
+    return base64.urlsafe_b64encode(json.dumps({'n': name, 'o': offset}).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return data['n'], int(data['o'])
+    except Exception:
+        raise ValueError("无效的分页游标")
+
+
+class DirectoryListingCache:
+    """目录列表缓存
+
+    目录mtime（增删改名时变化）未变且缓存未超过max_age时直接复用扫描结果；
+    超过max_age后重新扫描，以反映目录内文件大小和修改时间的变化
+    """
+
+    def __init__(self, max_entries=32, max_age=10.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._cache = collections.OrderedDict()  # path -> 缓存项
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _dir_key(path):
+        st = os.stat(path)
+        return (st.st_dev, st.st_ino, st.st_mtime_ns)
+
+    @staticmethod
+    def _cache_key(path):
+        # 缓存和失效都使用同一个规范化的路径作为键
+        return os.path.normpath(path)
+
+    def _get_entry(self, path):
+        key = self._cache_key(path)
+        dir_key = self._dir_key(path)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry['dir_key'] == dir_key and time.time() - entry['scanned_at'] < self.max_age:
+                self._cache.move_to_end(key)
+                return entry
+
+        items = _scan_directory(path)
+        digest = _content_digest(sorted(items, key=lambda x: x['name']))
+        etag = f'"{dir_key[0]:x}-{dir_key[1]:x}-{dir_key[2]:x}-{digest}"'
+        entry = {'dir_key': dir_key, 'scanned_at': time.time(), 'items': items, 'etag': etag, 'views': {}}
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return entry
+
+    def get_etag(self, path):
+        """返回目录当前的ETag，缓存有效时只需一次stat"""
+        return self._get_entry(path)['etag']
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(self._cache_key(path), None)
+
+    def _sorted_view(self, entry, sort, order, dirs_first):
+        view_key = (sort, order, dirs_first)
+        view = entry['views'].get(view_key)
+        if view is not None:
+            return view
+
+        if sort == 'size':
+            sort_key = lambda x: x['size']
+        elif sort == 'modified':
+            sort_key = lambda x: x['_mtime']
+        elif sort == 'type':
+            sort_key = lambda x: (os.path.splitext(x['name'])[1].lower(), x['name'])
+        else:
+            sort_key = lambda x: x['name']
+
+        view = sorted(entry['items'], key=sort_key, reverse=(order == 'desc'))
+        if dirs_first:
+            # sorted是稳定排序，再按类型排序即可保持组内顺序
+            view.sort(key=lambda x: 0 if x['type'] == 'directory' else 1)
+        entry['views'][view_key] = view
+        return view
+
+    def list(self, path, sort='name', order='asc', dirs_first=True, search=None, item_type=None,
+             limit=0, cursor=None):
+        """列出目录，返回 (条目, 总数, 下一页游标, ETag)"""
+        entry = self._get_entry(path)
+        if sort not in SORT_FIELDS:
+            sort = 'name'
+        items = self._sorted_view(entry, sort, 'desc' if order == 'desc' else 'asc', dirs_first)
+
+        if search:
+            needle = search.lower()
+            items = [x for x in items if needle in x['name'].lower()]
+        if item_type in ('file', 'directory'):
+            items = [x for x in items if x['type'] == item_type]
+
+        total = len(items)
+        start = 0
+        if cursor:
+            name, offset = decode_cursor(cursor)
+            if 0 < offset <= total and items[offset - 1]['name'] == name:
+                start = offset
+            else:
+                # 目录内容有变化，按名称重新定位
+                start = next((i + 1 for i, x in enumerate(items) if x['name'] == name), min(offset, total))
+
+        end = start + limit if limit > 0 else total
+        page = items[start:end]
+        next_cursor = encode_cursor(page[-1]['name'], end) if page and end < total else None
+
+        return [{k: v for k, v in x.items() if k != '_mtime'} for x in page], total, next_cursor, entry['etag']
+
+
+# 创建全局目录列表缓存实例
+directory_listing = DirectoryListingCache()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件保存模块
+保存时先写入同目录下的临时文件并fsync，再rename覆盖原文件，崩溃时不会留下写了一半的文件；
+可以要求文件的mtime或哈希与编辑开始时一致，以发现并发修改；
+大文件可以只提交修改的片段（与Monaco编辑器的 rangeOffset/rangeLength/text 变更格式一致）
+"""
+
+import os
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger("file_save")
+
+# 同一进程内对同一文件的保存串行执行
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+class SaveConflict(Exception):
+    """文件在编辑期间被修改"""
+
+    def __init__(self, message, current):
+        super().__init__(message)
+        self.current = current
+
+
+class PatchError(Exception):
+    """补丁无法应用"""
+
+
+def _lock_for(path):
+    with _path_locks_guard:
+        lock = _path_locks.get(path)
+        if lock is None:
+            lock = _path_locks[path] = threading.Lock()
+        return lock
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_version(path):
+    """返回文件当前的版本信息（mtime、大小和sha256），文件不存在时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            digest = hashlib.sha256()
+            while True:
+                data = f.read(1024 * 1024)
+                if not data:
+                    break
+                digest.update(data)
+    except FileNotFoundError:
+        return None
+    return {'mtime': st.st_mtime, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'hash': digest.hexdigest()}
+
+
+def _check_expected(path, expected_mtime, expected_hash):
+    """校验文件仍是编辑开始时的版本，返回当前版本"""
+    current = file_version(path)
+    if expected_hash:
+        if current is None or current['hash'] != expected_hash.lower():
+            raise SaveConflict('文件已被其他人修改', current)
+    if expected_mtime is not None:
+        # 兼容秒（浮点数）和纳秒（整数）两种写法
+        expected_mtime = float(expected_mtime)
+        if current is None:
+            raise SaveConflict('文件已被删除', current)
+        if expected_mtime > 1e12:
+            matches = int(expected_mtime) == current['mtime_ns']
+        else:
+            matches = abs(current['mtime'] - expected_mtime) < 1e-6
+        if not matches:
+            raise SaveConflict('文件已被其他人修改', current)
+    return current
+
+
+def apply_patch(text, edits):
+    """按顺序应用编辑，每个编辑的rangeOffset以前一个编辑应用后的文本为准
+
+    偏移量和长度与JavaScript字符串一致，按UTF-16码元计算
+    """
+    buffer = text.encode('utf-16-le', 'surrogatepass')
+    for edit in edits:
+        try:
+            offset = int(edit['rangeOffset'])
+            length = int(edit.get('rangeLength', 0))
+            replacement = edit.get('text', '')
+        except (KeyError, TypeError, ValueError):
+            raise PatchError('补丁格式错误，每个编辑需要 rangeOffset、rangeLength 和 text')
+        if not isinstance(replacement, str):
+            raise PatchError('补丁格式错误，text 必须是字符串')
+        if offset < 0 or length < 0 or (offset + length) * 2 > len(buffer):
+            raise PatchError(f'编辑范围超出文件内容: {offset}+{length}')
+        buffer = buffer[:offset * 2] + replacement.encode('utf-16-le', 'surrogatepass') + buffer[(offset + length) * 2:]
+    try:
+        return buffer.decode('utf-16-le')
+    except UnicodeDecodeError:
+        raise PatchError('编辑范围把一个字符从中间拆开了')
+
+
+def atomic_write(path, data):
+    """把数据写入同目录临时文件并fsync后重命名覆盖path，保留原文件的权限和属主"""
+    # 符号链接保持不变，写入其指向的文件
+    target = os.path.realpath(path)
+    directory = os.path.dirname(target)
+    try:
+        st = os.stat(target)
+    except FileNotFoundError:
+        st = None
+
+    temp_path = os.path.join(directory, f".{os.path.basename(target)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, st.st_mode & 0o7777 if st else 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        if st:
+            os.fchmod(fd, st.st_mode & 0o7777)
+            try:
+                os.fchown(fd, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        os.fsync(fd)
+    except BaseException:
+        os.close(fd)
+        os.remove(temp_path)
+        raise
+    os.close(fd)
+    try:
+        os.replace(temp_path, target)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    # 确保目录项的修改也已落盘
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def save_text(path, content=None, encoding='utf-8', edits=None, expected_mtime=None, expected_hash=None):
+    """保存文本文件，content为完整内容，edits为补丁；返回 (实际使用的编码, 新版本信息)"""
+    with _lock_for(os.path.realpath(path)):
+        _check_expected(path, expected_mtime, expected_hash)
+
+        if edits is not None:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            try:
+                original = raw.decode(encoding)
+            except UnicodeDecodeError:
+                raise PatchError(f'文件内容不是有效的 {encoding} 编码，无法应用补丁')
+            # 编辑器中的内容使用统一的换行符，偏移量以此为准
+            original = original.replace('\r\n', '\n').replace('\r', '\n')
+            content = apply_patch(original, edits)
+
+        try:
+            data = content.encode(encoding)
+        except UnicodeEncodeError:
+            # 如果指定编码失败，使用UTF-8
+            logger.warning(f"使用编码 {encoding} 保存文件失败，改用 UTF-8")
+            encoding = 'utf-8'
+            data = content.encode(encoding)
+
+        atomic_write(path, data)
+        return encoding, file_version(path)
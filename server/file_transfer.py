@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件传输模块
+为文件下载提供 Range / If-Range / If-None-Match / If-Modified-Since 支持，包括多段范围请求，
+在gunicorn下通过 wsgi.file_wrapper 使用sendfile零拷贝发送
+"""
+
+import os
+import uuid
+import logging
+import mimetypes
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date, parse_date
+
+logger = logging.getLogger("file_transfer")
+
+# 单个请求允许的最大范围数，超出时按完整文件返回
+MAX_RANGES = 64
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+def make_etag(st):
+    """根据inode、大小和修改时间生成强ETag"""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def parse_ranges(header, size):
+    """解析Range请求头，返回 [(start, end)]（end不包含），格式错误返回None，无可满足范围返回[]"""
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    specs = header[6:].split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    for spec in specs:
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        first, last = spec.split('-', 1)
+        try:
+            if not first:
+                # 后缀范围，如 -500 表示最后500字节
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(0, size - suffix), size
+            else:
+                start = int(first)
+                end = int(last) + 1 if last else size
+                if last and end <= start:
+                    return None
+                end = min(end, size)
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+
+    # 合并重叠或相邻的范围
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _if_range_matches(etag, st):
+    """检查If-Range条件是否成立，不成立时应返回完整文件"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    date = parse_date(if_range)
+    return date is not None and int(st.st_mtime) <= int(date.timestamp())
+
+
+def _not_modified(etag, st):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag.strip('"'))
+    if request.if_modified_since:
+        return int(st.st_mtime) <= int(request.if_modified_since.timestamp())
+    return False
+
+
+def _file_body(path, start, length):
+    """产出文件的一段内容；gunicorn下返回file_wrapper以使用sendfile"""
+    f = open(path, 'rb')
+    f.seek(start)
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    # gunicorn从文件当前位置sendfile，并按Content-Length截断；其他服务器的file_wrapper会读到文件末尾
+    if file_wrapper and request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        return file_wrapper(f, READ_CHUNK_SIZE)
+
+    def generate():
+        try:
+            remaining = length
+            while remaining > 0:
+                data = f.read(min(READ_CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        finally:
+            f.close()
+    return generate()
+
+
+def _multipart_body(path, ranges, parts_headers, boundary):
+    def generate():
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            for (start, end), part_header in zip(ranges, parts_headers):
+                yield part_header
+                offset = start
+                while offset < end:
+                    data = os.pread(fd, min(READ_CHUNK_SIZE, end - offset), offset)
+                    if not data:
+                        break
+                    offset += len(data)
+                    yield data
+            yield f"\r\n--{boundary}--\r\n".encode('ascii')
+        finally:
+            os.close(fd)
+    return generate()
+
+
+def send_file_ranges(path, mimetype=None, as_attachment=False, download_name=None):
+    """发送文件，支持条件请求和（多段）范围请求
+
+    返回 (响应, 实际发送的字节数)
+    """
+    st = os.stat(path)
+    size = st.st_size
+    etag = make_etag(st)
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'no-cache'
+    }
+    if as_attachment:
+        name = download_name or os.path.basename(path)
+        ascii_name = name.encode('ascii', 'ignore').decode('ascii').replace('"', '') or 'download'
+        headers['Content-Disposition'] = f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(name)}"
+
+    if _not_modified(etag, st):
+        return Response(status=304, headers=headers), 0
+
+    ranges = None
+    if request.headers.get('Range') and _if_range_matches(etag, st):
+        ranges = parse_ranges(request.headers.get('Range'), size)
+        if ranges == []:
+            headers['Content-Range'] = f'bytes */{size}'
+            return Response(status=416, headers=headers), 0
+
+    if not ranges:
+        headers['Content-Length'] = str(size)
+        return Response(_file_body(path, 0, size), status=200, mimetype=mimetype, headers=headers,
+                        direct_passthrough=True), size
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        headers['Content-Length'] = str(end - start)
+        return Response(_file_body(path, start, end - start), status=206, mimetype=mimetype, headers=headers,
+                        direct_passthrough=True), end - start
+
+    # 多段范围使用 multipart/byteranges
+    boundary = uuid.uuid4().hex
+    parts_headers = []
+    content_length = len(f"\r\n--{boundary}--\r\n")
+    sent = 0
+    for start, end in ranges:
+        part_header = (f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                       f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n").encode('ascii')
+        parts_headers.append(part_header)
+        content_length += len(part_header) + end - start
+        sent += end - start
+    headers['Content-Length'] = str(content_length)
+    return Response(_multipart_body(path, ranges, parts_headers, boundary), status=206,
+                    content_type=f'multipart/byteranges; boundary={boundary}', headers=headers,
+                    direct_passthrough=True), sent
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大文件分页查看模块
+用mmap为文件建立稀疏行索引（约每1MB记录一个行起点及其行号），索引按路径缓存并以mtime判断是否失效，
+追加写入的日志只对新增部分继续建索引；按行号读取、读取末尾若干行和跟随模式的开销只与返回的数据量有关
+"""
+
+import os
+import mmap
+import time
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("file_viewer")
+
+# 稀疏索引的间隔字节数
+CHECKPOINT_INTERVAL = 1024 * 1024
+
+# 单次返回的上限
+MAX_LINES = 5000
+MAX_BYTES = 1024 * 1024
+MAX_LINE_BYTES = 16 * 1024
+
+# 逐行按换行符切分时需要单字节兼容ASCII的编码
+PAGEABLE_ENCODINGS = ('utf-8', 'gbk', 'gb2312', 'big5', 'ascii', 'latin1')
+
+
+class LineIndex:
+    """单个文件的稀疏行索引"""
+
+    def __init__(self, st):
+        self.dev = st.st_dev
+        self.ino = st.st_ino
+        self.size = 0
+        self.mtime_ns = st.st_mtime_ns
+        # 已建索引部分的行起点检查点：行号（从0开始）和字节偏移
+        self.lines = [0]
+        self.offsets = [0]
+        # 已建索引部分的换行符总数，以及最后一个检查点之后的换行符数
+        self.newlines = 0
+        self.trailing_partial = False
+
+    def extend(self, mm, size):
+        """从已建索引的位置继续扫描到size"""
+        position = self.size
+        last_checkpoint = self.offsets[-1]
+        while position < size:
+            end = min(position + CHECKPOINT_INTERVAL, size)
+            self.newlines += mm[position:end].count(b'\n')
+            position = end
+            if position - last_checkpoint >= CHECKPOINT_INTERVAL and position < size:
+                # 在当前位置之后找到下一行的起点作为检查点
+                newline = mm.find(b'\n', position, min(position + CHECKPOINT_INTERVAL, size))
+                if newline == -1:
+                    continue
+                self.newlines += mm[position:newline + 1].count(b'\n')
+                position = newline + 1
+                if position < size:
+                    self.lines.append(self.newlines)
+                    self.offsets.append(position)
+                    last_checkpoint = position
+        self.size = size
+
+    def copy(self):
+        """复制索引，增量扩展在副本上进行，正在被其他请求使用的索引保持不变"""
+        index = LineIndex.__new__(LineIndex)
+        index.__dict__.update(self.__dict__)
+        index.lines = list(self.lines)
+        index.offsets = list(self.offsets)
+        return index
+
+    @property
+    def total_lines(self):
+        """总行数，最后一行没有换行符时也计为一行"""
+        return self.newlines + (1 if self.trailing_partial else 0)
+
+    def locate(self, line):
+        """返回不晚于line的检查点 (行号, 偏移)"""
+        index = bisect.bisect_right(self.lines, line) - 1
+        return self.lines[index], self.offsets[index]
+
+
+class FileViewer:
+    """分页查看器，缓存最近使用文件的行索引"""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_index(self, path, st, mm):
+        """获取最新的行索引；同一文件变长时增量扩展，被截断或替换时重建
+
+        缓存中的索引不会被修改：扩展在副本上完成后再替换缓存项，
+        并发请求各自扩展时不会重复计数换行符
+        """
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None:
+                self._cache.move_to_end(path)
+
+        index = cached
+        if (index is None or index.dev != st.st_dev or index.ino != st.st_ino or st.st_size < index.size):
+            index = LineIndex(st)
+        if index.size != st.st_size or index.mtime_ns != st.st_mtime_ns:
+            if index.size == st.st_size:
+                # 大小不变但内容被改写，只能重建
+                index = LineIndex(st)
+            elif index is cached:
+                index = index.copy()
+            started = time.time()
+            index.extend(mm, st.st_size)
+            index.mtime_ns = st.st_mtime_ns
+            elapsed = time.time() - started
+            if elapsed > 1:
+                logger.info(f"建立行索引 {path}: {st.st_size} 字节, 用时 {elapsed:.2f} 秒")
+        if index is cached:
+            return index
+        index.trailing_partial = st.st_size > 0 and mm[st.st_size - 1:st.st_size] != b'\n'
+
+        with self._lock:
+            current = self._cache.get(path)
+            # 其他请求已经换入了同一文件更新的索引时保留它
+            if current is None or current.dev != index.dev or current.ino != index.ino or \
+                    current.size <= index.size:
+                self._cache[path] = index
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return index
+
+    def get_cached_index(self, path, st):
+        """返回仍然有效的缓存索引，不触发建索引"""
+        with self._lock:
+            index = self._cache.get(path)
+        if index and index.dev == st.st_dev and index.ino == st.st_ino and \
+                index.size == st.st_size and index.mtime_ns == st.st_mtime_ns:
+            return index
+        return None
+
+    @staticmethod
+    def _decode_lines(raw_lines, encoding):
+        lines = []
+        truncated = []
+        for number, raw in raw_lines:
+            if len(raw) > MAX_LINE_BYTES:
+                raw = raw[:MAX_LINE_BYTES]
+                truncated.append(number)
+            if raw.endswith(b'\r'):
+                raw = raw[:-1]
+            lines.append(raw.decode(encoding, errors='replace'))
+        return lines, truncated
+
+    @staticmethod
+    def _collect(mm, offset, size, max_lines, max_bytes, first_number):
+        """从offset开始读取完整的行，返回 ([(行号, 原始字节)], 下一个偏移)"""
+        raw_lines = []
+        used = 0
+        number = first_number
+        while offset < size and len(raw_lines) < max_lines and used < max_bytes:
+            newline = mm.find(b'\n', offset, size)
+            end = size if newline == -1 else newline
+            raw = mm[offset:min(end, offset + MAX_LINE_BYTES + 1)]
+            raw_lines.append((number, raw))
+            used += len(raw)
+            number += 1
+            offset = size if newline == -1 else newline + 1
+        return raw_lines, offset
+
+    @staticmethod
+    def _open(path):
+        st = os.stat(path)
+        if st.st_size == 0:
+            return st, None, None
+        f = open(path, 'rb')
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            f.close()
+            raise
+        return st, f, mm
+
+    def read_lines(self, path, start=1, count=200, encoding='utf-8', max_bytes=MAX_BYTES):
+        """读取第start行（从1开始）起的count行"""
+        count = min(max(count, 1), MAX_LINES)
+        st, f, mm = self._open(path)
+        if mm is None:
+            return self._result(st, [], [], 1, 0, 0, encoding)
+        # mmap按打开时的大小映射，之后的stat结果以映射大小为准
+        size = len(mm)
+        try:
+            index = self._get_index(path, st, mm)
+            total = index.total_lines
+            start = min(max(start, 1), max(total, 1))
+            checkpoint_line, offset = index.locate(start - 1)
+            # 从检查点向后跳过不超过一个间隔的行
+            for _ in range(start - 1 - checkpoint_line):
+                newline = mm.find(b'\n', offset, size)
+                if newline == -1:
+                    offset = size
+                    break
+                offset = newline + 1
+            raw_lines, next_offset = self._collect(mm, offset, size, count, max_bytes, start)
+            lines, truncated = self._decode_lines(raw_lines, encoding)
+            return self._result(st, lines, truncated, start, total, next_offset, encoding)
+        finally:
+            mm.close()
+            f.close()
+
+    def tail(self, path, count=200, encoding='utf-8', max_bytes=MAX_BYTES):
+        """读取最后count行，从文件末尾向前查找，不需要完整索引"""
+        count = min(max(count, 1), MAX_LINES)
+        st, f, mm = self._open(path)
+        if mm is None:
+            return self._result(st, [], [], 1, 0, 0, encoding)
+        size = len(mm)
+        try:
+            # 文件以换行符结尾时，最后的换行符不算新的一行
+            position = size - 1 if mm[size - 1:size] == b'\n' else size
+            start = 0
+            found = 0
+            while True:
+                newline = mm.rfind(b'\n', 0, position)
+                if newline == -1:
+                    start = 0
+                    break
+                found += 1
+                start = newline + 1
+                if found >= count or size - start >= max_bytes:
+                    break
+                position = newline
+            raw_lines, next_offset = self._collect(mm, start, size, count, max_bytes, 0)
+
+            index = self.get_cached_index(path, st)
+            total = index.total_lines if index else None
+            first = total - len(raw_lines) + 1 if total is not None else None
+            if first is not None:
+                raw_lines = [(first + i, raw) for i, (_, raw) in enumerate(raw_lines)]
+            lines, truncated = self._decode_lines(raw_lines, encoding)
+            return self._result(st, lines, truncated, first, total, next_offset, encoding)
+        finally:
+            mm.close()
+            f.close()
+
+    def follow(self, path, offset, encoding='utf-8', max_bytes=MAX_BYTES, wait=0):
+        """跟随模式：返回offset之后新增的完整行；文件被截断或替换时reset为True并从头开始
+
+        offset位于一行中间时（例如上次返回的最后一行还没有换行符），第一行是该行的后续内容，continues_line为True
+        wait: 没有新内容时最多等待的秒数
+        """
+        deadline = time.time() + wait
+        while True:
+            st = os.stat(path)
+            if st.st_size != offset or time.time() >= deadline:
+                break
+            time.sleep(0.5)
+
+        reset = st.st_size < offset
+        if reset:
+            offset = 0
+        if st.st_size == offset:
+            return dict(self._result(st, [], [], None, None, offset, encoding), reset=reset, continues_line=False)
+
+        st, f, mm = self._open(path)
+        if mm is None:
+            return dict(self._result(st, [], [], None, None, 0, encoding), reset=True, continues_line=False)
+        size = len(mm)
+        try:
+            offset = min(offset, size)
+            continues_line = offset > 0 and mm[offset - 1:offset] != b'\n'
+            raw_lines, next_offset = self._collect(mm, offset, size, MAX_LINES, max_bytes, 0)
+            # 最后一行还没写完时留到下次返回
+            if raw_lines and next_offset == size and mm[size - 1:size] != b'\n':
+                raw_lines.pop()
+                next_offset = mm.rfind(b'\n', offset, size) + 1 or offset
+                if not raw_lines:
+                    continues_line = False
+            lines, _ = self._decode_lines(raw_lines, encoding)
+            return dict(self._result(st, lines, [], None, None, next_offset, encoding),
+                        reset=reset, continues_line=continues_line)
+        finally:
+            mm.close()
+            f.close()
+
+    @staticmethod
+    def _result(st, lines, truncated, start_line, total_lines, next_offset, encoding):
+        return {
+            'lines': lines,
+            'start_line': start_line,
+            'end_line': start_line + len(lines) - 1 if start_line is not None and lines else None,
+            'total_lines': total_lines,
+            'truncated_lines': truncated,
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'next_offset': next_offset,
+            'encoding': encoding
+        }
+
+
+# 创建全局分页查看器实例
+file_viewer = FileViewer()
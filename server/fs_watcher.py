@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件变化监听模块
+通过ctypes调用inotify监听客户端当前打开的目录，把创建、修改、删除和移动事件合并去抖后推送给订阅者；
+同一目录的多个订阅共用一个watch，没有订阅者一段时间后释放
+"""
+
+import os
+import time
+import queue
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+logger = logging.getLogger("fs_watcher")
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# 事件合并窗口（秒）：窗口内同一文件的多次变化只推送一次
+DEBOUNCE_SECONDS = 0.3
+
+# 持续变化的文件（如运行中服务器的日志）最迟在第一次变化后多久推送一次
+MAX_LATENCY_SECONDS = 1.0
+
+# 没有订阅者后保留watch的时间（秒），避免来回切换目录时反复添加
+RELEASE_DELAY = 10
+
+# 最多同时监听的目录数
+MAX_WATCHES = 512
+
+# 每个订阅者最多积压的事件批次，超出时只通知客户端重新加载
+MAX_PENDING_BATCHES = 100
+
+
+class WatchError(Exception):
+    """无法监听目录"""
+
+
+def _describe(path):
+    """生成与目录列表一致的条目信息，文件已不存在时返回None"""
+    try:
+        st = os.stat(path)
+        is_dir = os.path.isdir(path)
+    except OSError:
+        try:
+            st = os.lstat(path)
+            is_dir = False
+        except OSError:
+            return None
+    return {
+        'name': os.path.basename(path),
+        'path': path,
+        'type': 'directory' if is_dir else 'file',
+        'size': 0 if is_dir else st.st_size,
+        'modified': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(st.st_mtime))
+    }
+
+
+class Subscription:
+    """一个客户端的订阅"""
+
+    def __init__(self, watcher, paths):
+        self.watcher = watcher
+        self.paths = paths
+        self.queue = queue.Queue(MAX_PENDING_BATCHES)
+        self.overflowed = False
+
+    def put(self, events):
+        try:
+            self.queue.put_nowait(events)
+        except queue.Full:
+            # 客户端处理不过来时丢弃积压，让它整体刷新
+            self.overflowed = True
+
+    def get(self, timeout):
+        """等待下一批事件，超时返回None"""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return [{'type': 'overflow'}]
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.watcher.unsubscribe(self)
+
+
+class FileSystemWatcher:
+    """基于inotify的目录监听服务"""
+
+    def __init__(self):
+        self._libc = None
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._watches = {}  # 目录 -> {'wd', 'refs', 'subscribers', 'released_at'}
+        self._wd_paths = {}  # wd -> 目录
+        self._pending = {}  # (目录, 名称) -> 事件
+        self._pending_moves = {}  # cookie -> (目录, 名称, 是否目录, 时间)
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """注册目录发生变化时的回调 callback(目录)，用于让缓存失效"""
+        self._listeners.append(callback)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise WatchError(f"inotify初始化失败: {os.strerror(ctypes.get_errno())}")
+        self._libc = libc
+        self._fd = fd
+        self._watches = {}
+        self._wd_paths = {}
+        self._pid = os.getpid()
+        threading.Thread(target=self._read_loop, name="fs-watcher", daemon=True).start()
+        threading.Thread(target=self._flush_loop, name="fs-watcher-flush", daemon=True).start()
+        logger.info("文件变化监听服务已启动")
+
+    def subscribe(self, paths):
+        """订阅若干目录的变化，返回Subscription"""
+        with self._lock:
+            self._ensure_started()
+            # 使用真实路径，经由符号链接打开同一目录时共用一个watch
+            paths = sorted({os.path.realpath(path) for path in paths})
+            added = []
+            try:
+                for path in paths:
+                    self._acquire(path)
+                    added.append(path)
+            except Exception:
+                for path in added:
+                    self._release(path)
+                raise
+            subscription = Subscription(self, paths)
+            for path in paths:
+                self._watches[path]['subscribers'].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for path in subscription.paths:
+                watch = self._watches.get(path)
+                if watch and subscription in watch['subscribers']:
+                    watch['subscribers'].discard(subscription)
+                    self._release(path)
+            subscription.paths = []
+
+    def _acquire(self, path):
+        """增加目录的引用，必要时添加watch，调用方持有锁"""
+        watch = self._watches.get(path)
+        if watch is None and len(self._watches) >= MAX_WATCHES:
+            self._expire_released(force=True)
+            if len(self._watches) >= MAX_WATCHES:
+                raise WatchError('监听的目录过多')
+        # 目录被删除后又重新创建时wd为None，需要重新添加watch
+        if watch is None or watch['wd'] is None:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise WatchError('inotify监听数量达到系统上限（fs.inotify.max_user_watches）')
+                raise WatchError(f"无法监听目录 {path}: {os.strerror(error)}")
+            if watch is None:
+                watch = self._watches[path] = {'wd': wd, 'refs': 0, 'subscribers': set(), 'released_at': None}
+            watch['wd'] = wd
+            self._wd_paths[wd] = path
+        watch['refs'] += 1
+        watch['released_at'] = None
+
+    def _release(self, path):
+        """减少目录的引用，引用为0时记录释放时间，延迟移除watch，调用方持有锁"""
+        watch = self._watches.get(path)
+        if watch is None:
+            return
+        watch['refs'] -= 1
+        if watch['refs'] <= 0:
+            watch['released_at'] = time.time()
+
+    def _expire_released(self, force=False):
+        """移除已经没有订阅者的watch，调用方持有锁"""
+        now = time.time()
+        for path, watch in list(self._watches.items()):
+            if watch['refs'] <= 0 and watch['released_at'] and (force or now - watch['released_at'] >= RELEASE_DELAY):
+                if watch['wd'] is not None:
+                    self._libc.inotify_rm_watch(self._fd, watch['wd'])
+                    self._wd_paths.pop(watch['wd'], None)
+                del self._watches[path]
+
+    def _read_loop(self):
+        fd = self._fd
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        while True:
+            try:
+                if not poller.poll(1000):
+                    continue
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except Exception as e:
+                logger.error(f"读取inotify事件失败: {str(e)}")
+                time.sleep(1)
+                continue
+            with self._lock:
+                self._parse(data)
+
+    def _parse(self, data):
+        """解析inotify事件并合并到待发送队列，调用方持有锁"""
+        offset = 0
+        now = time.time()
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            name = os.fsdecode(name)
+
+            if mask & IN_Q_OVERFLOW:
+                self._pending[(None, None)] = {'type': 'overflow', 'time': now}
+                continue
+            directory = self._wd_paths.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # 目录被删除或卸载后内核自动移除了watch
+                self._wd_paths.pop(wd, None)
+                if directory in self._watches:
+                    self._watches[directory]['wd'] = None
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self._pending[(directory, None)] = {'type': 'deleted_self', 'directory': directory, 'time': now}
+                continue
+
+            is_dir = bool(mask & IN_ISDIR)
+            if mask & IN_MOVED_FROM:
+                self._pending_moves[cookie] = (directory, name, is_dir, now)
+                continue
+            if mask & IN_MOVED_TO:
+                source = self._pending_moves.pop(cookie, None)
+                if source:
+                    self._merge(source[0], source[1], 'deleted', source[2], now)
+                    self._merge(directory, name, 'moved', is_dir, now,
+                                old_path=os.path.join(source[0], source[1]))
+                else:
+                    self._merge(directory, name, 'created', is_dir, now)
+                continue
+            if mask & IN_CREATE:
+                self._merge(directory, name, 'created', is_dir, now)
+            elif mask & IN_DELETE:
+                self._merge(directory, name, 'deleted', is_dir, now)
+            elif mask & (IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB):
+                self._merge(directory, name, 'modified', is_dir, now)
+
+    def _merge(self, directory, name, event_type, is_dir, now, old_path=None):
+        """合并同一文件在去抖窗口内的多个事件"""
+        key = (directory, name)
+        previous = self._pending.get(key)
+        if previous:
+            prev_type = previous['type']
+            if prev_type == 'created' and event_type == 'modified':
+                event_type = 'created'
+            elif prev_type in ('created', 'moved') and event_type == 'deleted':
+                # 窗口内创建又删除，客户端不需要知道；移动后又删除只保留源路径的删除
+                del self._pending[key]
+                return
+            elif prev_type == 'deleted' and event_type in ('created', 'moved', 'modified'):
+                # 删除后重建（例如原子保存），对客户端来说是修改
+                event_type = 'modified' if event_type != 'moved' else 'moved'
+            elif prev_type == 'moved' and event_type == 'modified':
+                event_type = 'moved'
+                old_path = previous.get('old_path')
+        self._pending[key] = {'type': event_type, 'directory': directory, 'name': name, 'is_dir': is_dir,
+                              'old_path': old_path, 'time': previous['time'] if previous else now, 'last': now}
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(DEBOUNCE_SECONDS / 2)
+            try:
+                self._flush()
+            except Exception as e:
+                logger.error(f"推送文件变化事件失败: {str(e)}")
+
+    def _flush(self):
+        now = time.time()
+        with self._lock:
+            # 只有一半的移动事件（移出监听范围）视为删除
+            for cookie, (directory, name, is_dir, moved_at) in list(self._pending_moves.items()):
+                if now - moved_at >= DEBOUNCE_SECONDS:
+                    del self._pending_moves[cookie]
+                    self._merge(directory, name, 'deleted', is_dir, now)
+            ready = [key for key, event in self._pending.items()
+                     if now - event.get('last', event['time']) >= DEBOUNCE_SECONDS
+                     or now - event['time'] >= MAX_LATENCY_SECONDS]
+            events = [self._pending.pop(key) for key in ready]
+            self._expire_released()
+            watches = {path: set(watch['subscribers']) for path, watch in self._watches.items()}
+
+        if not events:
+            return
+        if any(event['type'] == 'overflow' for event in events):
+            subscribers = set().union(*watches.values()) if watches else set()
+            for subscription in subscribers:
+                subscription.put([{'type': 'overflow'}])
+            return
+
+        batches = {}
+        changed_dirs = set()
+        for event in events:
+            directory = event['directory']
+            changed_dirs.add(directory)
+            if event['type'] == 'deleted_self':
+                message = {'type': 'deleted_self', 'directory': directory}
+            else:
+                path = os.path.join(directory, event['name'])
+                message = {'type': event['type'], 'directory': directory, 'name': event['name'], 'path': path}
+                if event['type'] == 'moved':
+                    message['old_path'] = event['old_path']
+                if event['type'] != 'deleted':
+                    message['item'] = _describe(path)
+                    if message['item'] is None:
+                        # 推送前已被删除
+                        message = {'type': 'deleted', 'directory': directory, 'name': event['name'], 'path': path}
+            for subscription in watches.get(directory, ()):
+                batches.setdefault(subscription, []).append(message)
+
+        for directory in changed_dirs:
+            for callback in self._listeners:
+                try:
+                    callback(directory)
+                except Exception as e:
+                    logger.debug(f"文件变化回调失败: {str(e)}")
+        for subscription, messages in batches.items():
+            subscription.put(messages)
+
+    def get_status(self):
+        with self._lock:
+            return {
+                'running': self._pid == os.getpid(),
+                'watches': len(self._watches),
+                'active_watches': sum(1 for watch in self._watches.values() if watch['refs'] > 0),
+                'subscribers': len(set().union(*(watch['subscribers'] for watch in self._watches.values())))
+                if self._watches else 0
+            }
+
+
+# 创建全局文件变化监听服务实例
+fs_watcher = FileSystemWatcher()
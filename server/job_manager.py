@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务模块
+复制、移动、删除、压缩、解压、部署等耗时的文件操作提交到有界的工作线程池中执行，
+工作线程使用较低的CPU和IO优先级，不占用请求线程；
+任务记录（状态、已处理的条目和字节数、预计剩余时间）持久化到磁盘，刷新页面或面板重启后仍可查询
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+
+from process_priority import apply_sched_profile
+
+logger = logging.getLogger("job_manager")
+
+# 工作线程的调度配置：降低nice值并使用best-effort最低IO优先级
+JOB_SCHED_PROFILE = {'nice': 10, 'ionice_class': 'best-effort', 'ionice_level': 7}
+
+ACTIVE_STATES = ('queued', 'running')
+
+# 已结束任务的保留时间（秒）和数量
+FINISHED_JOB_TTL = 24 * 3600
+MAX_FINISHED_JOBS = 200
+
+# 进度持久化的最小间隔（秒）
+SAVE_INTERVAL = 2.0
+
+
+class JobCancelled(Exception):
+    """任务被取消"""
+
+
+def measure_paths(paths):
+    """统计路径下的条目数和文件总字节数，用于计算进度"""
+    items = 0
+    total = 0
+    for path in paths:
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                st = os.lstat(current)
+            except OSError:
+                continue
+            items += 1
+            if os.path.isdir(current) and not os.path.islink(current):
+                try:
+                    with os.scandir(current) as it:
+                        stack.extend(entry.path for entry in it)
+                except OSError:
+                    continue
+            elif not os.path.islink(current):
+                total += st.st_size
+    return items, total
+
+
+class Job:
+    """后台任务记录"""
+
+    def __init__(self, job_type, title, params=None, username=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.type = job_type
+        self.title = title
+        self.params = params or {}
+        self.username = username
+        self.state = 'queued'
+        self.error = None
+        self.result = None
+        self.current = None
+        self.items_done = 0
+        self.items_total = None
+        self.bytes_done = 0
+        self.bytes_total = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.func = None
+        self.cancel_event = threading.Event()
+        self.cancel_callbacks = []
+        self.progress_source = None
+        # 任务结束（完成、失败或取消）时设置，run_inline等待它并重新抛出任务函数的异常
+        self.done_event = threading.Event()
+        self.exception = None
+
+    def to_dict(self):
+        items_done, items_total = self.items_done, self.items_total
+        bytes_done, bytes_total = self.bytes_done, self.bytes_total
+        if self.progress_source and self.state == 'running':
+            try:
+                progress = self.progress_source()
+                items_done = progress.get('items_done', items_done)
+                items_total = progress.get('items_total', items_total)
+                bytes_done = progress.get('bytes_done', bytes_done)
+                bytes_total = progress.get('bytes_total', bytes_total)
+                self.current = progress.get('current', self.current)
+            except Exception:
+                pass
+
+        percent = None
+        eta = None
+        if self.state == 'completed':
+            percent = 100.0
+        elif bytes_total:
+            percent = round(min(bytes_done / bytes_total, 1.0) * 100, 1)
+        elif items_total:
+            percent = round(min(items_done / items_total, 1.0) * 100, 1)
+        if self.state == 'running' and self.started and percent:
+            elapsed = time.time() - self.started
+            if elapsed > 1 and percent < 100:
+                eta = round(elapsed * (100 - percent) / percent)
+
+        return {
+            'job_id': self.id,
+            'type': self.type,
+            'title': self.title,
+            'params': self.params,
+            'username': self.username,
+            'state': self.state,
+            'error': self.error,
+            'result': self.result,
+            'current': self.current,
+            'items_done': items_done,
+            'items_total': items_total,
+            'bytes_done': bytes_done,
+            'bytes_total': bytes_total,
+            'percent': percent,
+            'eta': eta,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['type'], data.get('title'), data.get('params'), data.get('username'), data['job_id'])
+        for key in ('state', 'error', 'result', 'items_done', 'items_total', 'bytes_done', 'bytes_total',
+                    'created', 'started', 'finished'):
+            if key in data:
+                setattr(job, key, data[key])
+        return job
+
+
+class JobContext:
+    """传给任务函数的上下文，用于报告进度和检查取消"""
+
+    def __init__(self, job, manager=None):
+        self.job = job
+        self._manager = manager
+
+    @property
+    def job_id(self):
+        return self.job.id
+
+    @property
+    def cancelled(self):
+        return self.job.cancel_event.is_set()
+
+    def check_cancel(self):
+        if self.job.cancel_event.is_set():
+            raise JobCancelled()
+
+    def set_total(self, items=None, bytes=None):
+        if items is not None:
+            self.job.items_total = items
+        if bytes is not None:
+            self.job.bytes_total = bytes
+
+    def advance(self, items=0, bytes=0, current=None):
+        """累加进度，同时检查是否已被取消"""
+        self.job.items_done += items
+        self.job.bytes_done += bytes
+        if current is not None:
+            self.job.current = current
+        if self._manager:
+            self._manager._save_throttled()
+        self.check_cancel()
+
+    def on_cancel(self, callback):
+        """注册取消时执行的回调，用于终止子进程或内部任务"""
+        self.job.cancel_callbacks.append(callback)
+        if self.cancelled:
+            callback()
+
+    def track(self, source):
+        """使用外部进度来源（返回进度字典的函数）代替手动累加"""
+        self.job.progress_source = source
+
+
+class JobManager:
+    """后台任务管理器"""
+
+    def __init__(self, workers=2, state_file='/home/steam/server/jobs.json'):
+        self.workers = workers
+        self.state_file = state_file
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._last_save = 0
+        self._loaded = False
+
+    def ensure_started(self):
+        """启动工作线程（按进程检查，兼容gunicorn的preload模式）"""
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._load()
+            for i in range(self.workers):
+                threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+            self._started_pid = os.getpid()
+            logger.info(f"后台任务线程池已启动，工作线程数: {self.workers}")
+
+    def _load(self):
+        """加载持久化的任务记录，上次未完成的任务标记为中断"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"读取任务记录失败: {str(e)}")
+            return
+        for data in records:
+            try:
+                job = Job.from_dict(data)
+            except (KeyError, TypeError):
+                continue
+            if job.state in ACTIVE_STATES:
+                job.state = 'interrupted'
+                job.error = '面板重启，任务被中断'
+                job.finished = job.finished or time.time()
+            self.jobs[job.id] = job
+
+    def _save(self):
+        records = [job.to_dict() for job in list(self.jobs.values())]
+        try:
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            temp_path = self.state_file + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False)
+            os.replace(temp_path, self.state_file)
+        except Exception as e:
+            logger.warning(f"保存任务记录失败: {str(e)}")
+        self._last_save = time.time()
+
+    def _save_throttled(self):
+        if time.time() - self._last_save >= SAVE_INTERVAL:
+            with self._lock:
+                self._save()
+
+    def _prune(self):
+        """清理过期或超出数量的已结束任务，调用方持有锁"""
+        now = time.time()
+        finished = sorted((job for job in self.jobs.values() if job.state not in ACTIVE_STATES),
+                          key=lambda job: job.finished or 0, reverse=True)
+        for index, job in enumerate(finished):
+            if index >= MAX_FINISHED_JOBS or now - (job.finished or now) > FINISHED_JOB_TTL:
+                del self.jobs[job.id]
+
+    def submit(self, job_type, title, func, params=None, username=None, job_id=None):
+        """提交任务，func接收JobContext，返回值作为任务结果"""
+        self.ensure_started()
+        job = Job(job_type, title, params, username, job_id)
+        job.func = func
+        with self._lock:
+            self._prune()
+            self.jobs[job.id] = job
+            self._save()
+        self._queue.put(job.id)
+        logger.info(f"已提交后台任务 {job.id}: {title}")
+        return job
+
+    def run_inline(self, job_type, title, func, params=None, username=None, job_id=None):
+        """提交任务并等待其完成，返回任务结果，失败时抛出任务函数的异常
+
+        仍然在有界的线程池中以较低优先级执行，可以在任务列表中查看和取消；
+        请求线程只等待结果，同时进行的耗时操作数量受线程池大小限制
+        """
+        job = self.submit(job_type, title, func, params, username, job_id)
+        job.done_event.wait()
+        if job.state == 'cancelled':
+            raise job.exception or JobCancelled()
+        if job.state != 'completed':
+            raise job.exception or RuntimeError(job.error)
+        return job.result
+
+    def _worker(self):
+        try:
+            apply_sched_profile(JOB_SCHED_PROFILE, threading.get_native_id())
+        except Exception as e:
+            logger.debug(f"设置任务线程优先级失败: {str(e)}")
+        while True:
+            job_id = self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.state != 'queued':
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job.state = 'running'
+        job.started = time.time()
+        with self._lock:
+            self._save()
+        try:
+            job.result = job.func(JobContext(job, self))
+            job.state = 'completed'
+            logger.info(f"后台任务完成 {job.id}: {job.title}")
+        except JobCancelled as e:
+            job.state = 'cancelled'
+            job.exception = e
+            logger.info(f"后台任务已取消 {job.id}: {job.title}")
+        except Exception as e:
+            job.exception = e
+            if job.cancel_event.is_set():
+                job.state = 'cancelled'
+            else:
+                job.state = 'failed'
+                job.error = str(e)
+                logger.error(f"后台任务失败 {job.id}: {job.title}: {str(e)}")
+        finally:
+            if job.progress_source:
+                # 结束前记录最终进度，之后不再引用内部任务
+                try:
+                    progress = job.progress_source()
+                    job.items_done = progress.get('items_done', job.items_done)
+                    job.items_total = progress.get('items_total', job.items_total)
+                    job.bytes_done = progress.get('bytes_done', job.bytes_done)
+                    job.bytes_total = progress.get('bytes_total', job.bytes_total)
+                except Exception:
+                    pass
+                job.progress_source = None
+            job.func = None
+            job.current = None
+            job.finished = time.time()
+            with self._lock:
+                self._save()
+            job.done_event.set()
+
+    def get(self, job_id):
+        self.ensure_started()
+        return self.jobs.get(job_id)
+
+    def list(self, state=None, job_type=None):
+        self.ensure_started()
+        jobs = sorted(self.jobs.values(), key=lambda job: job.created, reverse=True)
+        if state == 'active':
+            jobs = [job for job in jobs if job.state in ACTIVE_STATES]
+        elif state:
+            jobs = [job for job in jobs if job.state == state]
+        if job_type:
+            jobs = [job for job in jobs if job.type == job_type]
+        return jobs
+
+    def cancel(self, job_id):
+        """取消任务；排队中的任务直接取消，运行中的任务在下一个检查点退出"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.state not in ACTIVE_STATES:
+            return job
+        job.cancel_event.set()
+        if job.state == 'queued':
+            job.state = 'cancelled'
+            job.finished = time.time()
+            with self._lock:
+                self._save()
+            job.done_event.set()
+        for callback in job.cancel_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"执行任务取消回调失败: {str(e)}")
+        return job
+
+    def remove(self, job_id):
+        """删除已结束的任务记录"""
+        job = self.get(job_id)
+        if job is None or job.state in ACTIVE_STATES:
+            return False
+        with self._lock:
+            self.jobs.pop(job_id, None)
+            self._save()
+        return True
+
+
+# 创建全局后台任务管理器实例
+job_manager = JobManager()
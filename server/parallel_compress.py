@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多线程压缩模块
+- tar.zst: tar流直接写入多线程zstd压缩器，不再生成中间tar文件
+- tar.gz / zip: 按块并行deflate（类似pigz，每块以前一块末尾32KB作为字典并以SYNC_FLUSH结束，
+  拼接后仍是单一的deflate流），zlib在压缩时会释放GIL，因此线程可以真正并行
+- 压缩结果放在受管理的临时目录中，下载完成或超时后自动清理
+"""
+
+import os
+import time
+import stat
+import shutil
+import struct
+import zlib
+import logging
+import tarfile
+import tempfile
+import threading
+import collections
+import concurrent.futures
+import zstandard as zstd
+
+logger = logging.getLogger("parallel_compress")
+
+# 压缩结果的临时目录及保留时间（秒）
+TEMP_ROOT = os.path.join(tempfile.gettempdir(), 'gsm_compress')
+TEMP_MAX_AGE = 3600
+
+BLOCK_SIZE = 1024 * 1024
+DICT_SIZE = 32 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+
+_cleanup_lock = threading.Lock()
+
+
+def default_workers():
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _deflate_block(data, dictionary, level, last):
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 9)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelDeflateWriter:
+    """并行deflate写入器，按写入顺序输出原始deflate数据，同时计算CRC32和大小"""
+
+    def __init__(self, output, executor, level=6, block_size=BLOCK_SIZE, max_pending=None):
+        self.output = output
+        self.executor = executor
+        self.level = level
+        self.block_size = block_size
+        self.max_pending = max_pending or default_workers() * 2
+        self.crc = 0
+        self.size = 0
+        self.compressed_size = 0
+        self._buffer = bytearray()
+        self._dictionary = None
+        self._pending = collections.deque()
+
+    def _submit(self, block, last):
+        self.crc = zlib.crc32(block, self.crc)
+        self.size += len(block)
+        self._pending.append(self.executor.submit(_deflate_block, block, self._dictionary, self.level, last))
+        self._dictionary = block[-DICT_SIZE:] if block else None
+        while self._pending and (len(self._pending) >= self.max_pending or last):
+            data = self._pending.popleft().result()
+            self.output.write(data)
+            self.compressed_size += len(data)
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block, False)
+        return len(data)
+
+    def close(self):
+        """写入最后一块并等待所有块完成"""
+        self._submit(bytes(self._buffer), True)
+        self._buffer = bytearray()
+
+
+class ParallelGzipWriter:
+    """输出单个gzip成员的并行压缩写入器，可作为tarfile的fileobj"""
+
+    def __init__(self, fileobj, executor, level=6):
+        self.fileobj = fileobj
+        self.fileobj.write(b'\x1f\x8b\x08\x00' + struct.pack('<L', int(time.time())) + b'\x00\xff')
+        self.deflater = ParallelDeflateWriter(fileobj, executor, level)
+
+    def write(self, data):
+        return self.deflater.write(data)
+
+    def close(self):
+        self.deflater.close()
+        self.fileobj.write(struct.pack('<LL', self.deflater.crc, self.deflater.size & 0xFFFFFFFF))
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(max(timestamp, 315532800))  # zip时间不能早于1980年
+    return ((t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday,
+            t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2)
+
+
+class ParallelZipWriter:
+    """按块并行deflate的zip写入器，支持zip64"""
+
+    def __init__(self, fileobj, executor, level=6):
+        self.fp = fileobj
+        self.executor = executor
+        self.level = level
+        self.entries = []
+
+    def _write_local_header(self, name, flags, method, dos_date, dos_time, zip64):
+        extra = struct.pack('<HHQQ', 1, 16, 0, 0) if zip64 else b''
+        size_field = ZIP64_LIMIT if zip64 else 0
+        header = struct.pack('<4s2B4HL2L2H', b'PK\x03\x04', 45 if zip64 else 20, 0, flags, method,
+                             dos_time, dos_date, 0, size_field, size_field, len(name), len(extra))
+        self.fp.write(header + name + extra)
+
+    def add(self, path, arcname, st):
+        """添加文件或目录"""
+        is_dir = stat.S_ISDIR(st.st_mode)
+        if is_dir and not arcname.endswith('/'):
+            arcname += '/'
+        name = arcname.encode('utf-8')
+        flags = 0x800 if not arcname.isascii() else 0
+        method = 0 if is_dir else 8
+        dos_date, dos_time = _dos_datetime(st.st_mtime)
+        offset = self.fp.tell()
+        # 不可压缩数据经deflate后会略微变大，留出余量判断是否需要zip64
+        zip64 = not is_dir and st.st_size * 1.01 + BLOCK_SIZE >= ZIP64_LIMIT
+
+        crc = size = compressed_size = 0
+        if is_dir:
+            self._write_local_header(name, flags, method, dos_date, dos_time, False)
+        else:
+            with open(path, 'rb') as f:
+                self._write_local_header(name, flags, method, dos_date, dos_time, zip64)
+                deflater = ParallelDeflateWriter(self.fp, self.executor, self.level)
+                while True:
+                    data = f.read(BLOCK_SIZE)
+                    if not data:
+                        break
+                    deflater.write(data)
+                deflater.close()
+                crc, size, compressed_size = deflater.crc, deflater.size, deflater.compressed_size
+
+            # 回写CRC和大小
+            end = self.fp.tell()
+            self.fp.seek(offset + 14)
+            if zip64:
+                self.fp.write(struct.pack('<L', crc))
+                self.fp.seek(offset + 30 + len(name) + 4)
+                self.fp.write(struct.pack('<QQ', size, compressed_size))
+            else:
+                if compressed_size >= ZIP64_LIMIT or size >= ZIP64_LIMIT:
+                    raise IOError(f"文件在压缩过程中变大，超出zip32限制: {path}")
+                self.fp.write(struct.pack('<LLL', crc, compressed_size, size))
+            self.fp.seek(end)
+
+        self.entries.append((name, flags, method, dos_date, dos_time, crc, compressed_size, size, offset,
+                             (st.st_mode & 0xFFFF) << 16 | (0x10 if is_dir else 0)))
+        return size, compressed_size
+
+    def close(self):
+        """写入中央目录"""
+        cd_offset = self.fp.tell()
+        for name, flags, method, dos_date, dos_time, crc, csize, usize, offset, attr in self.entries:
+            zip64 = max(csize, usize, offset) >= ZIP64_LIMIT
+            extra = struct.pack('<HHQQQ', 1, 24, usize, csize, offset) if zip64 else b''
+            if zip64:
+                csize = usize = offset = ZIP64_LIMIT
+            self.fp.write(struct.pack('<4s4B4HL2L5H2L', b'PK\x01\x02', 45 if zip64 else 20, 3,
+                                      45 if zip64 else 20, 0, flags, method, dos_time, dos_date, crc, csize, usize,
+                                      len(name), len(extra), 0, 0, 0, attr, offset) + name + extra)
+        cd_end = self.fp.tell()
+        cd_size = cd_end - cd_offset
+        count = len(self.entries)
+
+        if count >= 0xFFFF or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            self.fp.write(struct.pack('<4sQ2H2L4Q', b'PK\x06\x06', 44, 45, 45, 0, 0, count, count, cd_size, cd_offset))
+            self.fp.write(struct.pack('<4sLQL', b'PK\x06\x07', 0, cd_end, 1))
+            self.fp.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                      min(cd_size, ZIP64_LIMIT), min(cd_offset, ZIP64_LIMIT), 0))
+        else:
+            self.fp.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, count, count, cd_size, cd_offset, 0))
+
+
+def _iter_tree(paths, common_path):
+    for path in paths:
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                yield root, os.path.relpath(root, common_path)
+                for file in sorted(files):
+                    file_path = os.path.join(root, file)
+                    yield file_path, os.path.relpath(file_path, common_path)
+        else:
+            yield path, os.path.relpath(path, common_path)
+
+
+def compress_paths(paths, common_path, output_path, format='zip', level=6, workers=None, progress=None):
+    """压缩文件到output_path，返回统计信息
+
+    progress: 每处理一个条目调用一次 progress(条目数, 字节数)，抛出异常可中止压缩
+    """
+    workers = workers or default_workers()
+    started = time.time()
+    input_bytes = 0
+
+    def tar_filter(tarinfo):
+        if progress:
+            progress(1, tarinfo.size if tarinfo.isreg() else 0)
+        return tarinfo
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor, open(output_path, 'wb') as out:
+        if format == 'zip':
+            writer = ParallelZipWriter(out, executor, level)
+            for path, arcname in _iter_tree(paths, common_path):
+                try:
+                    st = os.stat(path)
+                except OSError as e:
+                    logger.warning(f"跳过无法访问的文件 {path}: {str(e)}")
+                    continue
+                if arcname == '.' or not (stat.S_ISREG(st.st_mode) or stat.S_ISDIR(st.st_mode)):
+                    continue
+                size, _ = writer.add(path, arcname, st)
+                input_bytes += size
+                if progress:
+                    progress(1, size)
+            writer.close()
+
+        elif format == 'tgz':
+            gz = ParallelGzipWriter(out, executor, level)
+            with tarfile.open(fileobj=gz, mode='w|') as tarf:
+                for path in paths:
+                    tarf.add(path, arcname=os.path.relpath(path, common_path), filter=tar_filter)
+            gz.close()
+            input_bytes = tarf.offset
+
+        elif format == 'tzst':
+            cctx = zstd.ZstdCompressor(level=level, threads=-1)
+            with cctx.stream_writer(out, closefd=False) as zst:
+                with tarfile.open(fileobj=zst, mode='w|') as tarf:
+                    for path in paths:
+                        tarf.add(path, arcname=os.path.relpath(path, common_path), filter=tar_filter)
+            input_bytes = tarf.offset
+
+        else:
+            # tar、tar.bz2、tar.xz 使用tarfile自带的单线程实现
+            mode = {'tar': 'w|', 'tbz2': 'w|bz2', 'txz': 'w|xz'}.get(format, 'w|')
+            with tarfile.open(fileobj=out, mode=mode) as tarf:
+                for path in paths:
+                    tarf.add(path, arcname=os.path.relpath(path, common_path), filter=tar_filter)
+            input_bytes = tarf.offset
+
+    elapsed = max(time.time() - started, 1e-6)
+    output_bytes = os.path.getsize(output_path)
+    return {
+        'format': format,
+        'threads': workers if format in ('zip', 'tgz', 'tzst') else 1,
+        'input_bytes': input_bytes,
+        'output_bytes': output_bytes,
+        'ratio': round(output_bytes / input_bytes, 4) if input_bytes else None,
+        'elapsed': round(elapsed, 3),
+        'throughput_mbps': round(input_bytes / elapsed / 1024 / 1024, 2)
+    }
+
+
+def create_temp_output_dir():
+    """在受管理的临时目录下为一次压缩创建子目录"""
+    os.makedirs(TEMP_ROOT, exist_ok=True)
+    return tempfile.mkdtemp(prefix='job_', dir=TEMP_ROOT)
+
+
+def cleanup_temp_outputs(max_age=TEMP_MAX_AGE):
+    """清理过期的压缩结果，以及内容已被移走的空任务目录"""
+    if not os.path.isdir(TEMP_ROOT):
+        return
+    with _cleanup_lock:
+        now = time.time()
+        for name in os.listdir(TEMP_ROOT):
+            job_dir = os.path.join(TEMP_ROOT, name)
+            try:
+                # 按目录及其中文件的最新修改时间计算：压缩进行中输出文件不断被写入，
+                # 目录本身的mtime却不会变化（其他gunicorn worker中的任务也能这样识别）
+                with os.scandir(job_dir) as it:
+                    mtimes = [entry.stat(follow_symlinks=False).st_mtime for entry in it]
+                age = now - max([os.path.getmtime(job_dir)] + mtimes)
+                # 空目录说明结果已被移走，留出余量避免删掉刚创建的任务目录
+                if age > max_age or (age > 60 and not os.listdir(job_dir)):
+                    shutil.rmtree(job_dir, ignore_errors=True)
+            except OSError:
+                continue
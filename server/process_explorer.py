@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程浏览器模块
+在后台保留psutil.Process对象并定期采样，使CPU使用率为真实的增量值；
+按游戏服务器对进程分组，并用缓存的 socket inode -> pid 映射表解析端口占用
+"""
+
+import os
+import socket
+import logging
+import threading
+import time
+import psutil
+
+logger = logging.getLogger("process_explorer")
+
+# /proc/net 中TCP状态码
+TCP_STATES = {
+    '01': 'ESTABLISHED', '02': 'SYN_SENT', '03': 'SYN_RECV', '04': 'FIN_WAIT1', '05': 'FIN_WAIT2',
+    '06': 'TIME_WAIT', '07': 'CLOSE', '08': 'CLOSE_WAIT', '09': 'LAST_ACK', '0A': 'LISTEN', '0B': 'CLOSING'
+}
+
+SORT_KEYS = ('cpu_percent', 'memory_percent', 'rss', 'pid', 'name', 'username', 'create_time', 'num_threads')
+
+
+def _decode_address(hex_address, family):
+    """解析 /proc/net/* 中的十六进制地址，如 0100007F:1F90"""
+    hex_ip, hex_port = hex_address.split(':')
+    raw = bytes.fromhex(hex_ip)
+    if family == socket.AF_INET:
+        ip = socket.inet_ntop(socket.AF_INET, raw[::-1])
+    else:
+        # IPv6地址由4个小端序32位整数组成
+        ip = socket.inet_ntop(socket.AF_INET6, b''.join(raw[i:i + 4][::-1] for i in range(0, 16, 4)))
+    return ip, int(hex_port, 16)
+
+
+class ProcessExplorer:
+    """进程快照服务"""
+
+    def __init__(self, sample_interval=2.0, idle_timeout=60.0, socket_table_ttl=5.0):
+        self.sample_interval = sample_interval
+        self.idle_timeout = idle_timeout
+        self.socket_table_ttl = socket_table_ttl
+        self._processes = {}  # pid -> psutil.Process，跨采样保留以计算CPU增量
+        self._snapshot = []
+        self._snapshot_time = 0
+        self._last_access = 0
+        self._lock = threading.Lock()
+        self._sampler_pid = None
+        self._server_resolver = None
+        self._socket_table = {}  # socket inode -> pid
+        self._socket_table_time = 0
+
+    def set_server_resolver(self, resolver):
+        """设置返回 {game_id: 根进程PID} 的回调，用于按游戏服务器分组"""
+        self._server_resolver = resolver
+
+    def _ensure_sampler_started(self):
+        if self._sampler_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sampler_pid != os.getpid():
+                threading.Thread(target=self._sample_loop, daemon=True).start()
+                self._sampler_pid = os.getpid()
+
+    def _sample_loop(self):
+        """有客户端访问时定期采样，空闲超过idle_timeout后暂停"""
+        while True:
+            time.sleep(self.sample_interval)
+            if time.time() - self._last_access > self.idle_timeout:
+                continue
+            try:
+                self._refresh()
+            except Exception as e:
+                logger.error(f"采样进程信息失败: {str(e)}")
+
+    def _refresh(self):
+        processes = {}
+        entries = []
+        for pid in psutil.pids():
+            if pid <= 1:
+                continue
+            proc = self._processes.get(pid)
+            try:
+                if proc is None or not proc.is_running():
+                    proc = psutil.Process(pid)
+                with proc.oneshot():
+                    name = proc.name()
+                    if not name:
+                        continue
+                    entry = {
+                        'pid': pid,
+                        'ppid': proc.ppid(),
+                        'name': name,
+                        'username': proc.username() or 'unknown',
+                        'status': proc.status(),
+                        'cpu_percent': round(proc.cpu_percent(None), 2),
+                        'memory_percent': round(proc.memory_percent(), 2),
+                        'rss': proc.memory_info().rss,
+                        'num_threads': proc.num_threads(),
+                        'create_time': proc.create_time(),
+                        'cmdline': ' '.join(proc.cmdline()),
+                        'server': None
+                    }
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                continue
+            except psutil.AccessDenied:
+                processes[pid] = proc
+                continue
+            processes[pid] = proc
+            entries.append(entry)
+
+        self._assign_servers(entries)
+
+        with self._lock:
+            self._processes = processes
+            self._snapshot = entries
+            self._snapshot_time = time.time()
+
+    def _assign_servers(self, entries):
+        """根据父子关系把进程归属到启动它的游戏服务器"""
+        if not self._server_resolver:
+            return
+        try:
+            roots = self._server_resolver()
+        except Exception as e:
+            logger.error(f"获取游戏服务器进程失败: {str(e)}")
+            return
+        if not roots:
+            return
+
+        children = {}
+        by_pid = {}
+        for entry in entries:
+            by_pid[entry['pid']] = entry
+            children.setdefault(entry['ppid'], []).append(entry['pid'])
+
+        for game_id, root_pid in roots.items():
+            stack = [root_pid]
+            while stack:
+                pid = stack.pop()
+                entry = by_pid.get(pid)
+                if entry is None or entry['server'] is not None:
+                    continue
+                entry['server'] = game_id
+                stack.extend(children.get(pid, ()))
+
+    def snapshot(self):
+        """返回最近一次采样结果和采样时间"""
+        self._last_access = time.time()
+        self._ensure_sampler_started()
+        if not self._snapshot_time:
+            self._refresh()
+        with self._lock:
+            return list(self._snapshot), self._snapshot_time
+
+    def query(self, sort='cpu_percent', order='desc', search=None, server=None, username=None,
+              page=None, page_size=None, group_by_server=False):
+        """按条件过滤、排序和分页"""
+        entries, sampled_at = self.snapshot()
+
+        if search:
+            needle = search.lower()
+            entries = [e for e in entries if needle in e['name'].lower() or needle in e['cmdline'].lower()
+                       or needle == str(e['pid'])]
+        if server:
+            entries = [e for e in entries if e['server'] == server]
+        if username:
+            entries = [e for e in entries if e['username'] == username]
+
+        if sort not in SORT_KEYS:
+            sort = 'cpu_percent'
+        entries.sort(key=lambda e: (e[sort] is None, e[sort] or 0) if sort not in ('name', 'username')
+                     else (e[sort] or '').lower(), reverse=(order != 'asc'))
+
+        result = {'total': len(entries), 'sampled_at': sampled_at}
+
+        if group_by_server:
+            groups = {}
+            for entry in entries:
+                group = groups.setdefault(entry['server'], {
+                    'server': entry['server'], 'process_count': 0, 'cpu_percent': 0.0, 'rss': 0, 'pids': []
+                })
+                group['process_count'] += 1
+                group['cpu_percent'] = round(group['cpu_percent'] + entry['cpu_percent'], 2)
+                group['rss'] += entry['rss']
+                group['pids'].append(entry['pid'])
+            result['groups'] = sorted(groups.values(), key=lambda g: (g['server'] is None, -g['cpu_percent']))
+
+        if page_size:
+            page = max(1, page or 1)
+            start = (page - 1) * page_size
+            entries = entries[start:start + page_size]
+            result['page'] = page
+            result['page_size'] = page_size
+
+        result['processes'] = entries
+        return result
+
+    def _refresh_socket_table(self):
+        """扫描 /proc/*/fd 建立 socket inode -> pid 映射表"""
+        table = {}
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            fd_dir = f'/proc/{pid}/fd'
+            try:
+                for fd in os.listdir(fd_dir):
+                    try:
+                        target = os.readlink(f'{fd_dir}/{fd}')
+                    except OSError:
+                        continue
+                    if target.startswith('socket:['):
+                        table[int(target[8:-1])] = int(pid)
+            except OSError:
+                continue
+        self._socket_table = table
+        self._socket_table_time = time.time()
+
+    def _lookup_socket_pid(self, inode):
+        if time.time() - self._socket_table_time > self.socket_table_ttl:
+            self._refresh_socket_table()
+        pid = self._socket_table.get(inode)
+        # 新建的socket可能不在缓存中，缓存超过1秒时重新扫描一次
+        if pid is None and time.time() - self._socket_table_time > 1.0:
+            self._refresh_socket_table()
+            pid = self._socket_table.get(inode)
+        return pid
+
+    def _read_sockets(self):
+        """读取TCP/UDP套接字，优先解析 /proc/net，非Linux系统回退到psutil"""
+        if not os.path.exists('/proc/net/tcp'):
+            sockets = []
+            for conn in psutil.net_connections(kind='inet'):
+                if not conn.laddr:
+                    continue
+                sockets.append({
+                    'family': conn.family,
+                    'type': 'TCP' if conn.type == socket.SOCK_STREAM else 'UDP',
+                    'laddr': (conn.laddr.ip, conn.laddr.port),
+                    'raddr': (conn.raddr.ip, conn.raddr.port) if conn.raddr else None,
+                    'state': conn.status if conn.type == socket.SOCK_STREAM else None,
+                    'inode': None,
+                    'pid': conn.pid
+                })
+            return sockets
+
+        sockets = []
+        for filename, family, sock_type in (('tcp', socket.AF_INET, 'TCP'), ('tcp6', socket.AF_INET6, 'TCP'),
+                                            ('udp', socket.AF_INET, 'UDP'), ('udp6', socket.AF_INET6, 'UDP')):
+            try:
+                with open(f'/proc/net/{filename}', 'r') as f:
+                    next(f, None)  # 跳过表头
+                    for line in f:
+                        fields = line.split()
+                        if len(fields) < 10:
+                            continue
+                        local_ip, local_port = _decode_address(fields[1], family)
+                        remote_ip, remote_port = _decode_address(fields[2], family)
+                        sockets.append({
+                            'family': family,
+                            'type': sock_type,
+                            'laddr': (local_ip, local_port),
+                            'raddr': (remote_ip, remote_port) if remote_port else None,
+                            'state': TCP_STATES.get(fields[3], fields[3]) if sock_type == 'TCP' else None,
+                            'inode': int(fields[9]),
+                            'pid': None
+                        })
+            except FileNotFoundError:
+                continue
+        return sockets
+
+    def list_ports(self):
+        """列出监听端口、已建立连接和UDP端口，以及对应的进程信息"""
+        entries, _ = self.snapshot()
+        by_pid = {e['pid']: e for e in entries}
+
+        ports = []
+        port_set = set()
+        for sock in self._read_sockets():
+            local_ip, local_port = sock['laddr']
+            if sock['type'] == 'TCP' and sock['state'] == 'LISTEN':
+                port_key = (local_port, local_ip, 'LISTEN')
+                status = 'LISTEN'
+            elif sock['type'] == 'TCP' and sock['state'] == 'ESTABLISHED':
+                port_key = (local_port, local_ip, 'ESTABLISHED')
+                remote_info = f"{sock['raddr'][0]}:{sock['raddr'][1]}" if sock['raddr'] else "Unknown"
+                status = f'ESTABLISHED -> {remote_info}'
+            elif sock['type'] == 'UDP':
+                port_key = (local_port, local_ip, 'UDP')
+                status = 'ACTIVE'
+            else:
+                continue
+
+            if port_key in port_set:
+                continue
+            port_set.add(port_key)
+
+            pid = sock['pid'] or (self._lookup_socket_pid(sock['inode']) if sock['inode'] else None)
+            port_info = {
+                'port': local_port,
+                'address': local_ip,
+                'family': 'IPv4' if sock['family'] == socket.AF_INET else 'IPv6',
+                'type': sock['type'],
+                'status': status,
+                'pid': pid,
+                'process_name': None,
+                'process_cmdline': None,
+                'server': None
+            }
+            if pid:
+                entry = by_pid.get(pid)
+                if entry:
+                    port_info['process_name'] = entry['name']
+                    cmdline = ' '.join(entry['cmdline'].split()[:3])  # 只取前3个参数
+                    port_info['process_cmdline'] = cmdline[:80] + '...' if len(cmdline) > 80 else cmdline
+                    port_info['server'] = entry['server']
+                else:
+                    port_info['process_name'] = 'Unknown'
+                    port_info['process_cmdline'] = 'Access Denied'
+            ports.append(port_info)
+
+        ports.sort(key=lambda x: x['port'])
+        return ports
+
+
+# 创建全局进程浏览器实例
+process_explorer = ProcessExplorer()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程调度优先级模块
+提供CPU亲和性、nice值、IO优先级和SCHED_BATCH调度策略的校验与应用
+"""
+
+import os
+import logging
+import psutil
+
+logger = logging.getLogger("process_priority")
+
+# IO调度类别名称 -> psutil常量
+IONICE_CLASSES = {
+    'realtime': psutil.IOPRIO_CLASS_RT,
+    'best-effort': psutil.IOPRIO_CLASS_BE,
+    'idle': psutil.IOPRIO_CLASS_IDLE,
+    'none': psutil.IOPRIO_CLASS_NONE
+}
+
+
+def parse_cpu_list(value):
+    """解析CPU列表，支持 [0, 1, 2] 或 "0-3,6" 这样的写法"""
+    if value is None or value == '' or value == []:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        cpus = {int(cpu) for cpu in value}
+    else:
+        cpus = set()
+        for part in str(value).split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start, end = int(start), int(end)
+                if start > end:
+                    raise ValueError(f"无效的CPU范围: {part}")
+                cpus.update(range(start, end + 1))
+            else:
+                cpus.add(int(part))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """将CPU编号列表格式化为 "0-3,6" 形式"""
+    cpus = sorted(cpus)
+    ranges = []
+    start = prev = None
+    for cpu in cpus:
+        if start is None:
+            start = prev = cpu
+        elif cpu == prev + 1:
+            prev = cpu
+        else:
+            ranges.append(f"{start}-{prev}" if start != prev else str(start))
+            start = prev = cpu
+    if start is not None:
+        ranges.append(f"{start}-{prev}" if start != prev else str(start))
+    return ','.join(ranges)
+
+
+def normalize_sched_profile(profile):
+    """校验并规范化调度配置
+
+    支持的字段:
+        cpus: 绑定的CPU核心列表
+        nice: nice值，-20到19
+        ionice_class: IO调度类别，realtime/best-effort/idle/none
+        ionice_level: IO优先级，0-7，仅realtime和best-effort有效
+        batch: 是否使用SCHED_BATCH调度策略（适合后台服务器）
+    """
+    profile = profile or {}
+    normalized = {}
+
+    cpus = parse_cpu_list(profile.get('cpus'))
+    if cpus:
+        available = os.sched_getaffinity(0)
+        invalid = [cpu for cpu in cpus if cpu not in available]
+        if invalid:
+            raise ValueError(f"CPU核心不可用: {format_cpu_list(invalid)}，可用核心: {format_cpu_list(available)}")
+        normalized['cpus'] = cpus
+
+    nice = profile.get('nice')
+    if nice not in (None, ''):
+        nice = int(nice)
+        if not -20 <= nice <= 19:
+            raise ValueError("nice值必须在-20到19之间")
+        normalized['nice'] = nice
+
+    ionice_class = profile.get('ionice_class')
+    if ionice_class not in (None, ''):
+        if ionice_class not in IONICE_CLASSES:
+            raise ValueError(f"无效的IO调度类别: {ionice_class}")
+        normalized['ionice_class'] = ionice_class
+        ionice_level = profile.get('ionice_level')
+        if ionice_level not in (None, '') and ionice_class in ('realtime', 'best-effort'):
+            ionice_level = int(ionice_level)
+            if not 0 <= ionice_level <= 7:
+                raise ValueError("IO优先级必须在0到7之间")
+            normalized['ionice_level'] = ionice_level
+
+    if profile.get('batch'):
+        normalized['batch'] = True
+
+    return normalized
+
+
+def _set_ionice(pid, profile):
+    ionice_class = profile.get('ionice_class')
+    if not ionice_class:
+        return
+    io_class = IONICE_CLASSES[ionice_class]
+    if ionice_class in ('realtime', 'best-effort'):
+        psutil.Process(pid).ionice(io_class, profile.get('ionice_level', 4))
+    else:
+        psutil.Process(pid).ionice(io_class)
+
+
+# ionice命令的调度类别编号
+IONICE_CLASS_NUMBERS = {'none': 0, 'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+
+def sched_profile_commands(profile):
+    """把调度配置转换为作用于当前shell（$$）的util-linux命令（taskset、renice、ionice、chrt）
+
+    用于启动脚本中在exec之前设置，fork之后不需要执行Python代码；配置需先经过normalize_sched_profile校验
+    """
+    commands = []
+    if not profile:
+        return commands
+    if profile.get('cpus'):
+        commands.append(f"taskset -p -c {format_cpu_list(profile['cpus'])} $$")
+    if 'nice' in profile:
+        commands.append(f"renice -n {int(profile['nice'])} -p $$")
+    ionice_class = profile.get('ionice_class')
+    if ionice_class:
+        command = f"ionice -c {IONICE_CLASS_NUMBERS[ionice_class]}"
+        if ionice_class in ('realtime', 'best-effort'):
+            command += f" -n {int(profile.get('ionice_level', 4))}"
+        commands.append(command + " -p $$")
+    if profile.get('batch'):
+        commands.append("chrt -b -p 0 $$")
+    return commands
+
+
+def apply_sched_profile(profile, pid=0):
+    """对指定进程（0表示当前进程）应用调度配置，子进程会继承这些设置"""
+    if not profile:
+        return
+    if profile.get('cpus'):
+        os.sched_setaffinity(pid, profile['cpus'])
+    if 'nice' in profile:
+        os.setpriority(os.PRIO_PROCESS, pid, profile['nice'])
+    _set_ionice(pid or os.getpid(), profile)
+    if profile.get('batch'):
+        os.sched_setscheduler(pid, os.SCHED_BATCH, os.sched_param(0))
+
+
+def default_sched_profile():
+    """清除调度配置时用于恢复运行中进程的默认设置：全部可用CPU、nice 0、默认IO优先级、普通调度策略"""
+    return {
+        'cpus': sorted(os.sched_getaffinity(0)),
+        'nice': 0,
+        'ionice_class': 'none'
+    }
+
+
+def _thread_ids(pid):
+    """进程的所有线程ID；setpriority、sched_setaffinity等调用只作用于单个线程"""
+    try:
+        return sorted(int(tid) for tid in os.listdir(f'/proc/{pid}/task'))
+    except (FileNotFoundError, ValueError):
+        return [pid]
+
+
+def apply_sched_profile_to_tree(root_pid, profile):
+    """对运行中的进程树的每个线程应用调度配置，返回成功应用的进程数
+
+    JVM等程序在应用配置前已经创建了工作线程和GC线程，只设置主线程不会影响它们
+    """
+    try:
+        root = psutil.Process(root_pid)
+        tree = [root] + root.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return 0
+
+    applied = 0
+    for proc in tree:
+        failed = False
+        for tid in _thread_ids(proc.pid):
+            try:
+                apply_sched_profile(profile, tid)
+                # 取消后台模式时需要把已运行的线程恢复为普通调度策略
+                if not profile.get('batch') and os.sched_getscheduler(tid) == os.SCHED_BATCH:
+                    os.sched_setscheduler(tid, os.SCHED_OTHER, os.sched_param(0))
+            except (psutil.NoSuchProcess, ProcessLookupError):
+                # 线程已退出
+                continue
+            except (psutil.AccessDenied, PermissionError, OSError) as e:
+                failed = True
+                logger.warning(f"对进程 {proc.pid} 的线程 {tid} 应用调度配置失败: {str(e)}")
+        if not failed and psutil.pid_exists(proc.pid):
+            applied += 1
+    return applied
+
+
+def _read_sched(tid):
+    proc = psutil.Process(tid)
+    ionice = proc.ionice()
+    io_class = next((name for name, value in IONICE_CLASSES.items() if value == ionice.ioclass), str(ionice.ioclass))
+    return {
+        'cpus': format_cpu_list(os.sched_getaffinity(tid)),
+        'nice': proc.nice(),
+        'ionice_class': io_class,
+        'ionice_level': ionice.value,
+        'batch': os.sched_getscheduler(tid) == os.SCHED_BATCH
+    }
+
+
+def get_effective_sched(pid, max_divergent=20, threads=True):
+    """读取进程当前生效的调度设置（以主线程为准）
+
+    threads为真时逐个读取所有线程：threads为线程数，divergent_threads列出设置与主线程不同的线程及其不同的字段；
+    为假时只读取主线程，用于频繁轮询的状态接口
+    """
+    try:
+        effective = _read_sched(pid)
+    except (psutil.NoSuchProcess, psutil.AccessDenied, ProcessLookupError, PermissionError, OSError):
+        return None
+    if not threads:
+        return effective
+
+    thread_ids = _thread_ids(pid)
+    divergent = []
+    for tid in thread_ids:
+        if tid == pid:
+            continue
+        try:
+            settings = _read_sched(tid)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, ProcessLookupError, PermissionError, OSError):
+            continue
+        diff = {key: value for key, value in settings.items() if value != effective[key]}
+        if diff:
+            divergent.append(dict(diff, tid=tid))
+    effective['threads'] = len(thread_ids)
+    effective['divergent_thread_count'] = len(divergent)
+    effective['divergent_threads'] = divergent[:max_divergent]
+    return effective
@@ -12,6 +12,9 @@ import psutil
 import re
 import termios
 
+from process_priority import sched_profile_commands
+from cgroup_manager import process_cgroup
+
 # 配置日志
 logger = logging.getLogger("pty_manager")
 
@@ -20,7 +23,7 @@ ANSI_ESCAPE_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
 class PTYProcess:
     """通用PTY进程管理类，用于处理各种需要交互式终端的进程"""
     
-    def __init__(self, process_id, cmd, cwd=None, env=None, log_prefix=None):
+    def __init__(self, process_id, cmd, cwd=None, env=None, log_prefix=None, cgroup_path=None, sched_profile=None):
         """
         初始化PTY进程
         
@@ -30,12 +33,16 @@ class PTYProcess:
             cwd: 工作目录
             env: 环境变量
             log_prefix: 日志文件前缀
+            cgroup_path: 子进程要加入的cgroup v2目录，为None时留在面板的cgroup中
+            sched_profile: 子进程的调度配置（CPU亲和性、nice、ionice、SCHED_BATCH）
         """
         self.process_id = process_id
         self.cmd = cmd
         self.cwd = cwd
         self.env = env or dict(os.environ, TERM="xterm")
         self.log_prefix = log_prefix or f"pty_{process_id}"
+        self.cgroup_path = cgroup_path
+        self.sched_profile = sched_profile
         
         # 进程状态
         self.process = None
@@ -82,8 +89,7 @@ class PTYProcess:
             
             # 启动进程，将输出连接到PTY从端
             self.process = subprocess.Popen(
-                self.cmd,
-                shell=True,
+                self._launch_args(),
                 stdin=self.slave_fd,
                 stdout=self.slave_fd,
                 stderr=self.slave_fd,
@@ -92,6 +98,14 @@ class PTYProcess:
                 env=self.env
             )
             
+            # 由父进程确认子进程确实加入了cgroup
+            if self.cgroup_path:
+                actual = process_cgroup(self.process.pid)
+                if actual is not None and actual != os.path.normpath(self.cgroup_path):
+                    logger.error(f"进程 {self.process_id} 未能加入cgroup {self.cgroup_path}（实际位于 {actual}），"
+                                 f"资源限制和统计不会生效")
+                    self.cgroup_path = None
+            
             # 关闭PTY从端，主进程只需要主端
             os.close(self.slave_fd)
             self.slave_fd = None
@@ -117,6 +131,25 @@ class PTYProcess:
             self.output_queue.put({'complete': True, 'status': 'error', 'message': f'启动错误: {str(e)}'})
             return False
     
+    def _launch_args(self):
+        """启动命令的参数列表
+
+        需要加入cgroup或应用调度配置时，由一个小的sh包装脚本先把自身（$$，exec后仍是同一个进程）写入cgroup.procs、
+        用taskset/renice/ionice/chrt设置调度参数，再exec原命令，之后派生的所有进程都会继承；
+        fork之后不执行Python代码（面板是多线程的，preexec_fn中的Python代码可能因fork时被持有的锁而死锁）
+        """
+        command = ['/bin/sh', '-c', self.cmd]
+        steps = []
+        if self.cgroup_path:
+            steps.append('echo $$ > "$1" || echo "加入cgroup失败: $1" >&2')
+        for step in sched_profile_commands(self.sched_profile):
+            steps.append(f'{step} > /dev/null || echo "应用调度配置失败: {step}" >&2')
+        if not steps:
+            return command
+        script = '; '.join(steps + ['shift', 'exec "$@"'])
+        procs_path = os.path.join(self.cgroup_path, "cgroup.procs") if self.cgroup_path else ''
+        return ['/bin/sh', '-c', script, 'gsm-launch', procs_path] + command
+    
     def wait(self, timeout=None):
         """等待进程完成"""
         if not self.process:
@@ -317,6 +350,12 @@ class PTYProcess:
             
         if self.output_file:
             status['output_file'] = self.output_file
+        
+        if self.cgroup_path:
+            status['cgroup'] = self.cgroup_path
+        
+        if self.sched_profile:
+            status['sched_profile'] = self.sched_profile
             
         return status
     
@@ -525,13 +564,13 @@ class PTYManager:
     def __init__(self):
         self.processes = {}  # process_id -> PTYProcess
     
-    def create_process(self, process_id, cmd, cwd=None, env=None, log_prefix=None):
+    def create_process(self, process_id, cmd, cwd=None, env=None, log_prefix=None, cgroup_path=None, sched_profile=None):
         """创建一个新的PTY进程"""
         if process_id in self.processes:
             logger.warning(f"进程ID {process_id} 已存在，将替换旧进程")
             self.terminate_process(process_id)
         
-        process = PTYProcess(process_id, cmd, cwd, env, log_prefix)
+        process = PTYProcess(process_id, cmd, cwd, env, log_prefix, cgroup_path, sched_profile)
         self.processes[process_id] = process
         return process
     
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求耗时分析模块
+为每个路由维护HDR风格（对数线性分桶）的延迟直方图，并记录最近的慢请求及其采样调用栈
+"""
+
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger("request_profiler")
+
+# 每个2的幂区间内的子分桶位数，5位即32个子分桶，相对误差约3%
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+
+class HdrHistogram:
+    """对数线性分桶的延迟直方图，记录单位为微秒，记录操作为O(1)"""
+
+    def __init__(self):
+        self.counts = {}  # 分桶索引 -> 计数
+        self.total_count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    @staticmethod
+    def _bucket_index(value):
+        if value < SUB_BUCKET_COUNT * 2:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        return (shift + 1) * SUB_BUCKET_COUNT + (value >> shift) - SUB_BUCKET_COUNT
+
+    @staticmethod
+    def _bucket_lower_bound(index):
+        if index < SUB_BUCKET_COUNT * 2:
+            return index
+        shift = index // SUB_BUCKET_COUNT - 1
+        return (index % SUB_BUCKET_COUNT + SUB_BUCKET_COUNT) << shift
+
+    def record(self, value_us):
+        value_us = max(0, int(value_us))
+        index = self._bucket_index(value_us)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total_count += 1
+        self.total_us += value_us
+        if self.min_us is None or value_us < self.min_us:
+            self.min_us = value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def percentiles(self, quantiles):
+        """一次遍历计算多个分位数，返回微秒值列表"""
+        if not self.total_count:
+            return [0 for _ in quantiles]
+        targets = sorted((max(1, int(q * self.total_count + 0.999999)), i) for i, q in enumerate(quantiles))
+        results = [0] * len(quantiles)
+        cumulative = 0
+        target_pos = 0
+        for index in sorted(self.counts):
+            cumulative += self.counts[index]
+            while target_pos < len(targets) and cumulative >= targets[target_pos][0]:
+                results[targets[target_pos][1]] = min(self._bucket_lower_bound(index), self.max_us)
+                target_pos += 1
+            if target_pos >= len(targets):
+                break
+        return results
+
+    def summary(self):
+        p50, p90, p99, p999 = self.percentiles([0.5, 0.9, 0.99, 0.999])
+        return {
+            'count': self.total_count,
+            'total_ms': round(self.total_us / 1000, 3),
+            'mean_ms': round(self.total_us / self.total_count / 1000, 3) if self.total_count else 0,
+            'min_ms': round((self.min_us or 0) / 1000, 3),
+            'max_ms': round(self.max_us / 1000, 3),
+            'p50_ms': round(p50 / 1000, 3),
+            'p90_ms': round(p90 / 1000, 3),
+            'p99_ms': round(p99 / 1000, 3),
+            'p999_ms': round(p999 / 1000, 3)
+        }
+
+
+class RequestProfiler:
+    """请求耗时分析器
+
+    begin/end 只做计时和字典操作；超过阈值仍未结束的请求由后台线程采样一次调用栈，
+    请求结束后与参数一起写入有界的慢请求日志
+    """
+
+    def __init__(self, slow_threshold=1.0, journal_size=200, sample_interval=0.25, max_stack_frames=40):
+        self.slow_threshold = slow_threshold
+        self.sample_interval = sample_interval
+        self.max_stack_frames = max_stack_frames
+        self.histograms = {}  # (method, route) -> HdrHistogram
+        self.journal = collections.deque(maxlen=journal_size)
+        self.in_flight = {}  # 线程ID -> [开始时间, 方法, 路径, 采样到的调用栈]
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._sampler_pid = None
+
+    def begin(self, method, path):
+        """记录请求开始，返回开始时间"""
+        started = time.perf_counter()
+        self.in_flight[threading.get_ident()] = [started, method, path, None]
+        return started
+
+    def end(self, started, method, route):
+        """记录请求结束，返回耗时（秒）和采样到的调用栈"""
+        duration = time.perf_counter() - started
+        entry = self.in_flight.pop(threading.get_ident(), None)
+        with self._lock:
+            histogram = self.histograms.get((method, route))
+            if histogram is None:
+                histogram = self.histograms[(method, route)] = HdrHistogram()
+            histogram.record(duration * 1000000)
+        stack = entry[3] if entry and entry[0] == started else None
+        return duration, stack
+
+    def record_slow(self, duration, method, route, path, status, args, stack):
+        """将慢请求写入日志"""
+        self.journal.append({
+            'timestamp': time.time(),
+            'duration_ms': round(duration * 1000, 3),
+            'method': method,
+            'route': route,
+            'path': path,
+            'status': status,
+            'args': args,
+            'stack': stack
+        })
+
+    def ensure_sampler_started(self):
+        """确保当前进程中的调用栈采样线程已启动"""
+        if self._sampler_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sampler_pid != os.getpid():
+                threading.Thread(target=self._sample_loop, daemon=True).start()
+                self._sampler_pid = os.getpid()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.sample_interval)
+            try:
+                now = time.perf_counter()
+                pending = [ident for ident, entry in list(self.in_flight.items())
+                           if entry[3] is None and now - entry[0] >= self.slow_threshold]
+                if not pending:
+                    continue
+                frames = sys._current_frames()
+                for ident in pending:
+                    entry = self.in_flight.get(ident)
+                    frame = frames.get(ident)
+                    if entry is not None and frame is not None:
+                        entry[3] = [line.rstrip() for line in traceback.format_stack(frame)[-self.max_stack_frames:]]
+                del frames
+            except Exception as e:
+                logger.error(f"采样慢请求调用栈时出错: {str(e)}")
+
+    def route_summaries(self):
+        """返回各路由的延迟统计，按总耗时降序"""
+        with self._lock:
+            items = [(key, histogram.summary()) for key, histogram in self.histograms.items()]
+        summaries = [dict(summary, method=method, route=route) for (method, route), summary in items]
+        summaries.sort(key=lambda s: s['total_ms'], reverse=True)
+        return summaries
+
+    def slow_requests(self, limit=50, sort='recent'):
+        entries = list(self.journal)
+        if sort == 'duration':
+            entries.sort(key=lambda e: e['duration_ms'], reverse=True)
+        else:
+            entries.reverse()
+        return entries[:limit]
+
+    def in_flight_requests(self):
+        now = time.perf_counter()
+        return [{'method': entry[1], 'path': entry[2], 'elapsed_ms': round((now - entry[0]) * 1000, 3)}
+                for entry in list(self.in_flight.values())]
+
+
+# 创建全局请求分析器实例
+request_profiler = RequestProfiler()
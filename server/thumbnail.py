@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片缩略图模块
+由线程池用Pillow生成小尺寸的WebP（不支持时为PNG）缩略图，保存在磁盘缓存中，按 (路径, mtime, 大小, 尺寸, 格式) 命名，
+超过容量时删除最久未使用的缩略图。目录列表可以附带缩略图地址，网格视图按需加载缩略图而不需要下载原图。
+工作线程使用较低的CPU和IO优先级，避免影响正在运行的游戏服务器
+"""
+
+import os
+import uuid
+import hashlib
+import logging
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from urllib.parse import quote
+
+from process_priority import apply_sched_profile
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+logger = logging.getLogger("thumbnail")
+
+# 工作线程的调度配置
+THUMBNAIL_SCHED_PROFILE = {'nice': 10, 'ionice_class': 'best-effort', 'ionice_level': 7}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff', '.ico', '.tga')
+
+THUMBNAIL_SIZES = (64, 128, 256, 512)
+DEFAULT_SIZE = 256
+
+# 超过该大小的原图不生成缩略图
+MAX_SOURCE_SIZE = 100 * 1024 * 1024
+
+# 生成失败的记录数上限（避免损坏的图片被反复解码）
+MAX_FAILURES = 1000
+
+# 预生成队列中最多等待的任务数
+MAX_PENDING = 512
+
+MIMETYPES = {'webp': 'image/webp', 'png': 'image/png'}
+
+
+class ThumbnailError(Exception):
+    """无法生成缩略图"""
+
+
+def is_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+class ThumbnailService:
+    """缩略图生成与缓存服务
+
+    磁盘缓存由各个进程共享，最近使用顺序由文件的mtime记录；每个进程启动后扫描一次缓存目录，
+    其他进程删除的缓存文件在下次访问时重新生成
+    """
+
+    def __init__(self, cache_dir='/home/steam/server/thumbnails', max_cache_bytes=512 * 1024 * 1024, workers=2):
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.workers = workers
+        self._entries = OrderedDict()  # 缓存文件名 -> 字节数，按最近使用排序
+        self._total_bytes = 0
+        self._pending = {}  # 缓存文件名 -> Future
+        self._failures = OrderedDict()  # 缓存文件名 -> 错误信息
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self.stats = {'hits': 0, 'generated': 0, 'failed': 0, 'evicted': 0}
+
+    @property
+    def available(self):
+        return Image is not None
+
+    @property
+    def default_format(self):
+        return 'webp' if Image is not None and features.check('webp') else 'png'
+
+    def _get_executor(self):
+        """线程池按进程创建（兼容gunicorn的preload模式）"""
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._scan_cache()
+                    self._pending = {}
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='thumbnail', initializer=self._init_worker)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    @staticmethod
+    def _init_worker():
+        try:
+            apply_sched_profile(THUMBNAIL_SCHED_PROFILE, threading.get_native_id())
+        except Exception as e:
+            logger.debug(f"设置缩略图线程优先级失败: {str(e)}")
+
+    def _scan_cache(self):
+        """读取已有的缓存文件，按mtime恢复使用顺序"""
+        self._entries.clear()
+        self._total_bytes = 0
+        found = []
+        try:
+            for bucket in os.scandir(self.cache_dir):
+                if not bucket.is_dir():
+                    continue
+                for entry in os.scandir(bucket.path):
+                    if entry.name.startswith('.'):
+                        continue
+                    st = entry.stat()
+                    found.append((st.st_mtime, entry.name, st.st_size))
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"扫描缩略图缓存失败: {str(e)}")
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    def _cache_name(self, path, st, size, fmt):
+        key = f"{os.path.realpath(path)}\0{st.st_mtime_ns}\0{st.st_size}\0{size}".encode('utf-8', 'surrogateescape')
+        return f"{hashlib.blake2b(key, digest_size=16).hexdigest()}.{fmt}"
+
+    def _cache_path(self, name):
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def _check_request(self, path, size, fmt):
+        if Image is None:
+            raise ThumbnailError('未安装Pillow库，无法生成缩略图')
+        if size not in THUMBNAIL_SIZES:
+            raise ThumbnailError(f"不支持的缩略图尺寸: {size}，可用: {', '.join(map(str, THUMBNAIL_SIZES))}")
+        fmt = fmt or self.default_format
+        if fmt not in MIMETYPES or (fmt == 'webp' and self.default_format != 'webp'):
+            raise ThumbnailError(f'不支持的缩略图格式: {fmt}')
+        if not is_image(path):
+            raise ThumbnailError('不支持的图片类型')
+        st = os.stat(path)
+        if st.st_size > MAX_SOURCE_SIZE:
+            raise ThumbnailError('图片过大，不生成缩略图')
+        return st, fmt
+
+    def get(self, path, size=DEFAULT_SIZE, fmt=None, timeout=30):
+        """返回 (缩略图文件路径, MIME类型)，缓存中没有时交给线程池生成并等待"""
+        st, fmt = self._check_request(path, size, fmt)
+        name = self._cache_name(path, st, size, fmt)
+        cache_path = self._cache_path(name)
+        future = self._submit(path, name, size, fmt)
+        if future is None:
+            with self._lock:
+                self.stats['hits'] += 1
+        else:
+            try:
+                future.result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                raise ThumbnailError('生成缩略图超时')
+        return cache_path, MIMETYPES[fmt]
+
+    def prefetch(self, paths, size=DEFAULT_SIZE, fmt=None):
+        """在后台为一批图片生成缩略图（例如目录列表的当前页），不等待结果"""
+        if Image is None:
+            return
+        for path in paths:
+            with self._lock:
+                if len(self._pending) >= MAX_PENDING:
+                    return
+            try:
+                st, current_fmt = self._check_request(path, size, fmt)
+                self._submit(path, self._cache_name(path, st, size, current_fmt), size, current_fmt)
+            except (ThumbnailError, OSError):
+                continue
+
+    def _submit(self, path, name, size, fmt):
+        """缓存命中时返回None，否则返回生成任务的Future（相同的缩略图只生成一次）"""
+        executor = self._get_executor()
+        with self._lock:
+            if name in self._failures:
+                raise ThumbnailError(self._failures[name])
+            if name in self._pending:
+                return self._pending[name]
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                hit = True
+            else:
+                hit = False
+        if not hit:
+            try:
+                # 其他进程已经生成
+                size_on_disk = os.path.getsize(self._cache_path(name))
+                with self._lock:
+                    if name not in self._entries:
+                        self._entries[name] = size_on_disk
+                        self._total_bytes += size_on_disk
+                hit = True
+            except FileNotFoundError:
+                pass
+        if hit:
+            try:
+                # 记录使用时间，重启后按此恢复使用顺序
+                os.utime(self._cache_path(name))
+                return None
+            except FileNotFoundError:
+                # 已被其他进程清理
+                with self._lock:
+                    self._total_bytes -= self._entries.pop(name, 0)
+        with self._lock:
+            if name in self._pending:
+                return self._pending[name]
+            future = executor.submit(self._generate, path, name, size, fmt)
+            self._pending[name] = future
+            return future
+
+    def _generate(self, path, name, size, fmt):
+        cache_path = self._cache_path(name)
+        temp_path = f"{os.path.dirname(cache_path)}/.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with Image.open(path) as image:
+                # JPEG在解码时直接缩小，大图只需要解码一小部分数据
+                image.draft('RGB', (size, size))
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((size, size))
+                if image.mode not in ('RGB', 'RGBA'):
+                    has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+                    image = image.convert('RGBA' if has_alpha else 'RGB')
+                if fmt == 'webp':
+                    image.save(temp_path, 'WEBP', quality=80, method=4)
+                else:
+                    image.save(temp_path, 'PNG', optimize=True)
+            os.replace(temp_path, cache_path)
+            written = os.path.getsize(cache_path)
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            message = f'生成缩略图失败: {str(e)}'
+            with self._lock:
+                self._pending.pop(name, None)
+                self._failures[name] = message
+                while len(self._failures) > MAX_FAILURES:
+                    self._failures.popitem(last=False)
+                self.stats['failed'] += 1
+            raise ThumbnailError(message)
+
+        with self._lock:
+            self._pending.pop(name, None)
+            self._total_bytes += written - self._entries.get(name, 0)
+            self._entries[name] = written
+            self._entries.move_to_end(name)
+            self.stats['generated'] += 1
+            evicted = []
+            while self._total_bytes > self.max_cache_bytes and len(self._entries) > 1:
+                old_name, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_name)
+            self.stats['evicted'] += len(evicted)
+        for old_name in evicted:
+            try:
+                os.remove(self._cache_path(old_name))
+            except FileNotFoundError:
+                pass
+        return cache_path
+
+    def thumbnail_url(self, item, size=DEFAULT_SIZE):
+        """目录列表条目的缩略图地址，v参数随文件大小和修改时间变化，浏览器可以长期缓存
+
+        与磁盘缓存的键一样使用st_mtime_ns（列表中的修改时间只精确到秒，同一秒内的修改不会改变v）
+        """
+        try:
+            st = os.stat(item['path'])
+            source = f"{st.st_size}\0{st.st_mtime_ns}"
+        except OSError:
+            source = f"{item['size']}\0{item['modified']}"
+        version = hashlib.blake2b(source.encode('utf-8'), digest_size=6).hexdigest()
+        return f"/api/files/thumbnail?path={quote(item['path'])}&size={size}&v={version}"
+
+    def get_status(self):
+        self._get_executor()
+        with self._lock:
+            return dict(self.stats, available=self.available, format=self.default_format if self.available else None,
+                        sizes=list(THUMBNAIL_SIZES), cache_entries=len(self._entries), cache_bytes=self._total_bytes,
+                        max_cache_bytes=self.max_cache_bytes, pending=len(self._pending))
+
+
+# 创建全局缩略图服务实例
+thumbnail_service = ThumbnailService()
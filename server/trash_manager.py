@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回收站模块
+删除时把目标rename到同一文件系统上的回收站目录，立即返回；
+保留期内可以还原，过期或被清空的条目由低优先级的后台线程按限定速率逐个删除，
+大文件分段截断后再删除，避免集中释放空间时占满磁盘IO影响正在运行的游戏服务器
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+
+from process_priority import apply_sched_profile
+
+logger = logging.getLogger("trash_manager")
+
+TRASH_DIR_NAME = '.gsm_trash'
+
+# 回收线程使用最低CPU优先级和空闲IO类别
+REAPER_SCHED_PROFILE = {'nice': 19, 'ionice_class': 'idle'}
+
+# 默认保留时间（秒）
+DEFAULT_RETENTION = 24 * 3600
+
+# 回收速率上限：每秒删除的条目数和释放的字节数
+REAP_FILES_PER_SECOND = 2000
+REAP_BYTES_PER_SECOND = 256 * 1024 * 1024
+
+# 大于该大小的文件按此步长逐段截断
+TRUNCATE_STEP = 1024 * 1024 * 1024
+
+
+class TrashError(Exception):
+    """回收站操作错误，附带HTTP状态码"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _RateLimiter:
+    """令牌桶限速"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def consume(self, amount):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            time.sleep(-self.tokens / self.rate)
+
+
+class TrashManager:
+    """回收站管理器"""
+
+    def __init__(self, state_file='/home/steam/server/trash.json', retention=DEFAULT_RETENTION):
+        self.state_file = state_file
+        self.retention = retention
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker_pid = None
+        self._loaded = False
+
+    def ensure_started(self):
+        """启动回收线程（按进程检查，兼容gunicorn的preload模式）"""
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._load()
+            threading.Thread(target=self._reaper, name="trash-reaper", daemon=True).start()
+            self._worker_pid = os.getpid()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                for entry in json.load(f):
+                    if os.path.lexists(entry['trash_path']):
+                        self.entries[entry['id']] = entry
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取回收站记录失败: {str(e)}")
+
+    def _save(self):
+        """保存回收站记录，调用方持有锁"""
+        try:
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            temp_path = self.state_file + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(self.entries.values()), f, ensure_ascii=False)
+            os.replace(temp_path, self.state_file)
+        except Exception as e:
+            logger.warning(f"保存回收站记录失败: {str(e)}")
+
+    @staticmethod
+    def trash_root_for(path):
+        """返回path所在文件系统上、可写的最上层祖先目录中的回收站目录"""
+        dev = os.lstat(path).st_dev
+        current = os.path.dirname(os.path.abspath(path).rstrip('/')) or '/'
+        root = None
+        while True:
+            try:
+                st = os.stat(current)
+            except OSError:
+                break
+            if st.st_dev != dev:
+                break
+            if os.access(current, os.W_OK | os.X_OK):
+                root = current
+            if current == '/':
+                break
+            current = os.path.dirname(current)
+        if root is None:
+            raise TrashError('找不到可用的回收站目录', 500)
+        return os.path.join(root, TRASH_DIR_NAME)
+
+    def trash(self, path, username=None):
+        """把路径移入回收站，返回条目信息"""
+        self.ensure_started()
+        path = os.path.abspath(path)
+        if not os.path.lexists(path):
+            raise TrashError('路径不存在', 404)
+        trash_root = self.trash_root_for(path)
+        if path == trash_root or path.startswith(trash_root + '/'):
+            raise TrashError('不能把回收站本身移入回收站')
+        os.makedirs(trash_root, mode=0o700, exist_ok=True)
+
+        entry_id = uuid.uuid4().hex
+        trash_path = os.path.join(trash_root, entry_id)
+        is_dir = os.path.isdir(path) and not os.path.islink(path)
+        os.rename(path, trash_path)
+
+        now = time.time()
+        entry = {
+            'id': entry_id,
+            'original_path': path,
+            'trash_path': trash_path,
+            'trash_root': trash_root,
+            'is_dir': is_dir,
+            'size': None if is_dir else os.lstat(trash_path).st_size,
+            'deleted_at': now,
+            'expires_at': now + self.retention,
+            'username': username,
+            'state': 'trashed'
+        }
+        with self._lock:
+            self.entries[entry_id] = entry
+            self._save()
+        self._wakeup.set()
+        logger.info(f"已移入回收站: {path} -> {trash_path}, 用户: {username}")
+        return dict(entry)
+
+    def discard(self, path):
+        """把路径交给回收线程在后台删除（不保留），用于替换目标时移到一旁的旧文件；
+        无法移入回收站时直接删除"""
+        try:
+            entry = self.trash(path)
+        except (TrashError, OSError) as e:
+            logger.warning(f"无法移入回收站，直接删除 {path}: {str(e)}")
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.lexists(path):
+                os.remove(path)
+            return None
+        self.purge(entry['id'])
+        return entry
+
+    def restore(self, entry_id, target_path=None):
+        """还原条目到原路径（或指定路径）"""
+        self.ensure_started()
+        with self._lock:
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                raise TrashError('回收站条目不存在', 404)
+            if entry['state'] != 'trashed':
+                raise TrashError('条目正在被清除，无法还原', 409)
+            target_path = target_path or entry['original_path']
+            if os.path.lexists(target_path):
+                raise TrashError('还原位置已存在同名文件或目录', 409)
+            # 回收站条目只能用重命名还原，不能还原到其他文件系统
+            ancestor = os.path.dirname(os.path.abspath(target_path))
+            while not os.path.exists(ancestor):
+                ancestor = os.path.dirname(ancestor)
+            if os.stat(ancestor).st_dev != os.lstat(entry['trash_path']).st_dev:
+                raise TrashError('还原位置必须与原位置在同一文件系统上')
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.rename(entry['trash_path'], target_path)
+            del self.entries[entry_id]
+            self._save()
+        logger.info(f"已从回收站还原: {target_path}")
+        return target_path
+
+    def purge(self, entry_id=None):
+        """让条目（不指定时为全部条目）立即过期，由回收线程删除"""
+        self.ensure_started()
+        with self._lock:
+            if entry_id and entry_id not in self.entries:
+                raise TrashError('回收站条目不存在', 404)
+            targets = [self.entries[entry_id]] if entry_id else list(self.entries.values())
+            for entry in targets:
+                entry['expires_at'] = 0
+            self._save()
+        self._wakeup.set()
+        return len(targets)
+
+    def list(self):
+        """列出回收站条目和各文件系统上待释放的空间"""
+        self.ensure_started()
+        with self._lock:
+            entries = sorted((dict(entry) for entry in self.entries.values()),
+                             key=lambda entry: entry['deleted_at'], reverse=True)
+        pending = {}
+        for entry in entries:
+            root = entry['trash_root']
+            info = pending.setdefault(root, {'trash_root': root, 'entries': 0, 'bytes': 0, 'size_unknown': 0})
+            info['entries'] += 1
+            if entry['size'] is None:
+                info['size_unknown'] += 1
+            else:
+                info['bytes'] += entry['size']
+        return {
+            'entries': entries,
+            'filesystems': list(pending.values()),
+            'pending_bytes': sum(info['bytes'] for info in pending.values()),
+            'retention': self.retention
+        }
+
+    def _measure(self, entry):
+        """统计目录条目大小，用于报告待释放空间"""
+        total = 0
+        for root, dirs, files in os.walk(entry['trash_path']):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        with self._lock:
+            entry['size'] = total
+            self._save()
+
+    def _reap(self, entry):
+        """限速删除一个条目"""
+        files_limiter = _RateLimiter(REAP_FILES_PER_SECOND)
+        bytes_limiter = _RateLimiter(REAP_BYTES_PER_SECOND)
+        freed = 0
+
+        def remove_file(path):
+            nonlocal freed
+            try:
+                size = os.lstat(path).st_size if not os.path.islink(path) else 0
+                # 大文件逐段截断，分散释放数据块的IO
+                while size > TRUNCATE_STEP:
+                    size -= TRUNCATE_STEP
+                    os.truncate(path, size)
+                    bytes_limiter.consume(TRUNCATE_STEP)
+                    freed += TRUNCATE_STEP
+                os.unlink(path)
+                bytes_limiter.consume(size)
+                freed += size
+            except FileNotFoundError:
+                pass
+            files_limiter.consume(1)
+
+        path = entry['trash_path']
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    remove_file(os.path.join(root, name))
+                for name in dirs:
+                    dir_path = os.path.join(root, name)
+                    if os.path.islink(dir_path):
+                        remove_file(dir_path)
+                    else:
+                        os.rmdir(dir_path)
+                        files_limiter.consume(1)
+                with self._lock:
+                    if entry['size'] is not None:
+                        entry['size'] = max(0, entry['size'] - freed)
+                    freed = 0
+            os.rmdir(path)
+        elif os.path.lexists(path):
+            remove_file(path)
+
+    def _reaper(self):
+        try:
+            apply_sched_profile(REAPER_SCHED_PROFILE, threading.get_native_id())
+        except Exception as e:
+            logger.debug(f"设置回收线程优先级失败: {str(e)}")
+        while True:
+            try:
+                with self._lock:
+                    unmeasured = [entry for entry in self.entries.values() if entry['size'] is None]
+                    now = time.time()
+                    expired = [entry for entry in self.entries.values() if entry['expires_at'] <= now]
+                for entry in unmeasured:
+                    self._measure(entry)
+                for entry in sorted(expired, key=lambda entry: entry['expires_at']):
+                    with self._lock:
+                        # 等待期间可能已被还原
+                        if entry['id'] not in self.entries:
+                            continue
+                        entry['state'] = 'reaping'
+                        self._save()
+                    try:
+                        self._reap(entry)
+                        logger.info(f"已清除回收站条目: {entry['original_path']}")
+                    except Exception as e:
+                        logger.error(f"清除回收站条目 {entry['trash_path']} 失败: {str(e)}")
+                        # 删除失败的条目一小时后重试
+                        with self._lock:
+                            # 数据仍在回收站中，重试前仍然可以还原
+                            entry['state'] = 'trashed'
+                            entry['expires_at'] = time.time() + 3600
+                            self._save()
+                        continue
+                    with self._lock:
+                        self.entries.pop(entry['id'], None)
+                        self._save()
+            except Exception as e:
+                logger.error(f"回收站线程出错: {str(e)}")
+            self._wakeup.wait(60)
+            self._wakeup.clear()
+
+
+# 创建全局回收站管理器实例
+trash_manager = TrashManager()